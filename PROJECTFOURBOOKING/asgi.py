@@ -2,6 +2,8 @@
 ASGI config for PROJECTFOURBOOKING project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI worker for the async booking API in accounts.async_views,
+e.g. ``gunicorn PROJECTFOURBOOKING.asgi:application -k uvicorn.workers.UvicornWorker``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -0,0 +1,176 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+
+# Counters for one database alias. Plain attribute updates are racy but only
+# ever lose the odd increment, which is fine for metrics.
+class PoolStats:
+    __slots__ = ('hits', 'misses', 'waits', 'wait_seconds', 'timeouts', 'broken', 'expired')
+
+    def __init__(self):
+        self.hits = 0  # Connection reused
+        self.misses = 0  # New connection opened
+        self.waits = 0  # Checkouts that had to wait for a free connection
+        self.wait_seconds = 0.0
+        self.timeouts = 0  # Checkouts that gave up waiting
+        self.broken = 0  # Connections dropped after failing a health check or reset
+        self.expired = 0  # Connections closed for exceeding their max lifetime
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# A small thread-safe pool of DB-API connections shared by all threads of a
+# process. Idle connections are reused most recently returned first, so a
+# quiet process keeps few connections warm and the rest age out.
+class ConnectionPool:
+
+    def __init__(self, connect, max_size=10, timeout=5.0, max_lifetime=1800.0, stats=None):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.stats = stats or PoolStats()
+        self._idle = deque()  # (connection, opened at)
+        self._opened_at = {}  # id(connection) -> opened at
+        self._size = 0  # Connections open, idle or checked out
+        self._cond = threading.Condition()
+        self.pid = os.getpid()  # The process that owns the connections
+
+    def _expired(self, opened_at):
+        return self.max_lifetime is not None and time.monotonic() - opened_at > self.max_lifetime
+
+    # Check out a connection. `check` is called (outside the lock) on reused
+    # connections and should return False for ones that are no longer usable.
+    def get(self, check=None):
+        while True:
+            connection = self._checkout()
+            if connection is None:
+                break
+            if check is None or check(connection):
+                self.stats.hits += 1
+                return connection
+            with self._cond:
+                self.stats.broken += 1
+                self._drop(connection)
+                self._cond.notify()
+
+        # Connect outside the lock; _checkout has reserved the slot
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self.stats.misses += 1
+        with self._cond:
+            self._opened_at[id(connection)] = time.monotonic()
+        return connection
+
+    # Take an idle connection, or reserve room for a new one and return None.
+    # Waits up to `timeout` seconds while the pool is full.
+    def _checkout(self):
+        deadline = None
+        with self._cond:
+            while True:
+                while self._idle:
+                    connection, opened_at = self._idle.pop()
+                    if not self._expired(opened_at):
+                        return connection
+                    self.stats.expired += 1
+                    self._drop(connection)
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.timeout
+                    self.stats.waits += 1
+                if now >= deadline or not self._cond.wait(deadline - now):
+                    self.stats.timeouts += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s')
+                self.stats.wait_seconds += time.monotonic() - now
+
+    # Return a checked out connection; broken ones are closed instead
+    def put(self, connection, broken=False):
+        with self._cond:
+            opened_at = self._opened_at.get(id(connection), 0.0)
+            if broken:
+                self.stats.broken += 1
+                self._drop(connection)
+            elif self._expired(opened_at):
+                self.stats.expired += 1
+                self._drop(connection)
+            else:
+                self._idle.append((connection, opened_at))
+            self._cond.notify()
+
+    # Close every idle connection, see close_all
+    def close_idle(self):
+        with self._cond:
+            while self._idle:
+                self._drop(self._idle.popleft()[0])
+
+    def _drop(self, connection):
+        self._opened_at.pop(id(connection), None)
+        self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def as_dict(self):
+        with self._cond:
+            return {**self.stats.as_dict(), 'size': self._size, 'idle': len(self._idle)}
+
+
+_lock = threading.Lock()
+_pools = {}  # alias -> ConnectionPool
+_stats = {}  # alias -> PoolStats, also kept for unpooled connections
+
+
+def stats_for(alias):
+    with _lock:
+        return _stats.setdefault(alias, PoolStats())
+
+
+def pool_for(alias, connect, **options):
+    with _lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            stats = _stats.setdefault(alias, PoolStats())
+            pool = _pools[alias] = ConnectionPool(connect, stats=stats, **options)
+        return pool
+
+
+# Close the idle connections of every pool when the process exits, so the
+# database sees a clean disconnect rather than a dropped socket. Checked out
+# connections belong to their threads and are left alone. A forked child
+# inherits its parent's pools and atexit hooks, but the sockets are still the
+# parent's, so pools created before the fork are skipped.
+@atexit.register
+def close_all():
+    with _lock:
+        pools = list(_pools.values())
+    pid = os.getpid()
+    for pool in pools:
+        if pool.pid == pid:
+            pool.close_idle()
+
+
+# Metrics for every alias, for the staff stats endpoint
+def all_stats():
+    with _lock:
+        pools, stats = dict(_pools), dict(_stats)
+    return {
+        alias: pools[alias].as_dict() if alias in pools else stats[alias].as_dict()
+        for alias in stats
+    }
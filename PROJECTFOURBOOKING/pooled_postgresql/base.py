@@ -0,0 +1,86 @@
+from django.db.backends.postgresql import base
+
+from PROJECTFOURBOOKING import dbpool
+
+
+# PostgreSQL backend with health checked connection reuse and an optional
+# process-wide connection pool. Configured with extra DATABASES keys:
+#
+#   HEALTH_CHECKS  Run SELECT 1 before the first use of a reused connection in
+#                  a request, and reconnect if it fails (Django 3.2 has no
+#                  CONN_HEALTH_CHECKS of its own).
+#   POOL           e.g. {'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_LIFETIME': 1800}.
+#                  Connections are then checked out of a pool shared by every
+#                  thread of the process and returned to it when Django
+#                  closes them, so set CONN_MAX_AGE to 0.
+#
+# Without POOL, CONN_MAX_AGE gives each thread its own persistent connection.
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_stats = dbpool.stats_for(self.alias)
+        self._health_check_pending = False
+        self._discard_on_close = False
+
+    def _pool(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        return dbpool.pool_for(
+            self.alias,
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 5.0),
+            max_lifetime=options.get('MAX_LIFETIME', 1800.0),
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool(conn_params)
+        if pool is None:
+            self.pool_stats.misses += 1
+            return super().get_new_connection(conn_params)
+        check = _ping if self.settings_dict.get('HEALTH_CHECKS') else None
+        return pool.get(check)
+
+    # Give pooled connections back instead of closing them
+    def _close(self):
+        if self.connection is None or not self.settings_dict.get('POOL'):
+            return super()._close()
+        connection, broken = self.connection, self._discard_on_close
+        self._discard_on_close = False
+        if not broken and not connection.closed:
+            try:
+                connection.rollback()  # Leave no open transaction behind
+            except base.Database.Error:
+                broken = True
+        dbpool.pool_for(self.alias, None).put(connection, broken=broken or bool(connection.closed))
+
+    # Called when a request starts and finishes
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        if self.connection is not None and self.settings_dict.get('HEALTH_CHECKS'):
+            self._health_check_pending = True
+
+    def ensure_connection(self):
+        if self._health_check_pending:
+            self._health_check_pending = False
+            if self.connection is not None and not self.in_atomic_block:
+                if self.is_usable():
+                    self.pool_stats.hits += 1
+                else:
+                    if not self.settings_dict.get('POOL'):
+                        self.pool_stats.broken += 1
+                    self._discard_on_close = True
+                    self.close()
+        super().ensure_connection()
+
+
+def _ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+        return True
+    except base.Database.Error:
+        return False
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 if os.path.isfile('env.py'):
     import env
@@ -40,13 +41,15 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
-    'cloudinary_storage',
     'django.contrib.staticfiles',
+    'cloudinary_storage',
     'cloudinary',
     'accounts',
 ]
 
 MIDDLEWARE = [
+    # SQL, template and total time per request, first so it sees everything
+    'accounts.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +57,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Logs views that go over their query budget, DEBUG only
+    'accounts.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'PROJECTFOURBOOKING.urls'
@@ -88,9 +93,58 @@ WSGI_APPLICATION = 'PROJECTFOURBOOKING.wsgi.application'
 # }
 
 DATABASES = {
-     'default': dj_database_url.parse(os.environ.get("DATABASE_URL"))
+     'default': dj_database_url.parse(
+         os.environ.get("DATABASE_URL"),
+         # Seconds each worker keeps its connection open for reuse
+         conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+     )
  }
 
+# Postgres goes through a backend that health checks reused connections and
+# can share a pool of connections between threads (DB_POOL_SIZE > 0), see
+# PROJECTFOURBOOKING/pooled_postgresql/base.py
+if DATABASES['default']['ENGINE'] in ('django.db.backends.postgresql', 'django.db.backends.postgresql_psycopg2'):
+    DATABASES['default']['ENGINE'] = 'PROJECTFOURBOOKING.pooled_postgresql'
+    DATABASES['default']['HEALTH_CHECKS'] = os.environ.get('DB_HEALTH_CHECKS', '1') == '1'
+    if int(os.environ.get('DB_POOL_SIZE', 0)):
+        DATABASES['default']['CONN_MAX_AGE'] = 0  # Return connections to the pool after each request
+        DATABASES['default']['POOL'] = {
+            'MAX_SIZE': int(os.environ['DB_POOL_SIZE']),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        }
+
+# Cache. Booking list pages, the table catalogue's version stamp (see
+# accounts/caching.py) and, in the cached session modes, sessions live here,
+# and a change made by one worker must reach them all, so the cache is shared
+# between processes: memcached when MEMCACHED_LOCATION is set, otherwise a
+# database table, made by createcachetable in the release phase (see
+# Procfile). The database cache only keeps the shared version stamps correct;
+# every lookup is a query, so booking list pages aren't cached in it (see
+# caching.pages_cached) and production should set MEMCACHED_LOCATION. A
+# per-process memory cache fails the accounts.E001 system check; only the
+# test runner, a single process, uses one.
+
+TESTING = sys.argv[1:2] == ['test']
+
+if os.environ.get('MEMCACHED_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'].split(','),
+        },
+    }
+elif TESTING:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'accounts_cache',
+        },
+    }
+ALLOW_PROCESS_LOCAL_CACHE = TESTING
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -110,6 +164,60 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Sessions. SESSION_MODE picks where they are kept:
+#   db (default): a database row, so a query on every request
+#   cached_db: the cache in front of the database, see accounts/sessions.py
+#   cache: only the cache; sessions are lost when it is cleared or evicts them
+#   signed_cookies: the cookie itself, no server side state, but logging out
+#     doesn't invalidate copies of the cookie
+# cached_db and cache keep them in the shared cache configured above and
+# need memcached (MEMCACHED_LOCATION): on the database cache they cost as many
+# queries as db or more, so the accounts.E002 system check refuses them there.
+# manage.py benchmark_bookings --sessions compares the modes.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'accounts.sessions',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('SESSION_MODE', 'db')]
+# Renew the expiry on every request rather than on changes only
+SESSION_SAVE_EVERY_REQUEST = os.environ.get('SESSION_SAVE_EVERY_REQUEST') == '1'
+# Seconds an unchanged cached_db session may go without a database write
+SESSION_DB_WRITE_INTERVAL = int(os.environ.get('SESSION_DB_WRITE_INTERVAL', 60))
+
+
+# Password hashing. New passwords use the first hasher, the others still
+# verify older hashes, which are upgraded on the user's next login, as are
+# hashes made with other costs. PASSWORD_HASHER=argon2 makes Argon2 the first
+# (needs argon2-cffi). manage.py benchmark_logins shows what each setting
+# costs in logins per second.
+
+PBKDF2_ITERATIONS = int(os.environ.get('PBKDF2_ITERATIONS', 260000))
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 102400))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 8))
+
+PASSWORD_HASHERS = [
+    'accounts.hashers.PBKDF2PasswordHasher',
+    'accounts.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+
+# Staff sign in with django.contrib.auth's User, customers with the email
+# address of accounts.User
+
+AUTHENTICATION_BACKENDS = [
+    'django.contrib.auth.backends.ModelBackend',
+    'accounts.backends.EmailBackend',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -127,9 +235,20 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
+# By default collectstatic fingerprints, minifies and precompresses the files
+# into STATIC_ROOT and wsgi.py serves them with far-future cache headers, see
+# PROJECTFOURBOOKING/staticfiles.py. STATIC_STORAGE=cloudinary uploads them to
+# Cloudinary instead (needs CLOUDINARY_URL).
+STATIC_STORAGE = os.environ.get('STATIC_STORAGE', 'local')
+
 STATIC_URL = '/static/'
-STATICFILES_STORAGE = 'cloudinary_storage.storage.StaticHashedCloudinaryStorage'
-STATICFILES_STORAGE = 'cloudinary_storage.storage.StaticHashedCloudinaryStorage'
+if STATIC_STORAGE == 'cloudinary':
+    STATICFILES_STORAGE = 'cloudinary_storage.storage.StaticHashedCloudinaryStorage'
+    # Its collectstatic command only takes over when listed before staticfiles
+    INSTALLED_APPS.remove('cloudinary_storage')
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('django.contrib.staticfiles'), 'cloudinary_storage')
+else:
+    STATICFILES_STORAGE = 'PROJECTFOURBOOKING.staticfiles.CompressedManifestStaticFilesStorage'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static'), ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
@@ -141,3 +260,23 @@ DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# One JSON line per request from accounts.middleware.PerformanceMiddleware.
+# Set PERFORMANCE_LOG_LEVEL=WARNING to silence it; it's quiet under
+# manage.py test.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'accounts.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get(
+                'PERFORMANCE_LOG_LEVEL', 'WARNING' if TESTING else 'INFO',
+            ),
+            'propagate': False,
+        },
+    },
+}
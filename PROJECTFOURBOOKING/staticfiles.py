@@ -0,0 +1,224 @@
+import gzip
+import json
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # Optional, only gzip copies are made without it
+    brotli = None
+
+
+# Local static files: collectstatic fingerprints, minifies and precompresses
+# them into STATIC_ROOT, and the WSGI app serves them straight from there
+# (see wsgi.py), so neither deploys nor page renders talk to a remote
+# storage service.
+
+
+# Text formats worth compressing. Images and fonts like woff2 are compressed
+# already.
+COMPRESSIBLE = {'.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+
+# Keep a compressed copy only if it saves at least this much
+MIN_SAVING = 0.05
+
+
+# Strings and comments in CSS, which minification must step over, whitespace
+# and the punctuation it may hug
+_CSS_TOKENS = re.compile(
+    r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*!.*?\*/)'''  # Strings and /*! licence */ comments
+    r'''|(/\*.*?\*/)'''  # Other comments
+    r'''|\s*([{};,])\s*'''  # Punctuation that needs no space around it
+    r'''|(\s+)''',
+    re.S,
+)
+
+
+# Drop comments and redundant whitespace from a stylesheet. Deliberately
+# conservative: it doesn't touch spaces before ':', which matter in selectors
+# like "a :hover", nor anything inside strings.
+def minify_css(css):
+    def token(match):
+        kept, comment, punctuation, space = match.groups()
+        if kept:
+            return kept
+        if comment:
+            return ''
+        if punctuation:
+            return punctuation
+        return ' '
+
+    # Comments first, so whitespace on both sides of one collapses together
+    without_comments = _CSS_TOKENS.sub(lambda match: '' if match.group(2) else match.group(), css)
+    return _CSS_TOKENS.sub(token, without_comments).strip()
+
+
+# ManifestStaticFilesStorage that also minifies stylesheets and writes .gz
+# (and, with the brotli package, .br) copies of the hashed files.
+# JavaScript is compressed but not minified; that needs a real parser.
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            if name.endswith('.css'):
+                with self.open(name) as original:
+                    content = original.read().decode('utf-8')
+                self._replace(name, minify_css(content).encode('utf-8'))
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                self._compress(name)
+
+    def _compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            if len(compressed) <= len(content) * (1 - MIN_SAVING):
+                self._replace(name + suffix, compressed)
+            elif self.exists(name + suffix):
+                self.delete(name + suffix)
+
+    def _replace(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+
+# A year, the longest lifetime caches are asked to honour. Safe for hashed
+# names, whose content never changes.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Unhashed names may change with the next deploy
+REVALIDATE = 'public, max-age=60'
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticFile:
+    __slots__ = ('path', 'headers', 'variants', 'modified')
+
+    def __init__(self, path, url_name, immutable):
+        stat = os.stat(path)
+        content_type, _ = mimetypes.guess_type(url_name)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        self.path = path
+        self.modified = int(stat.st_mtime)
+        self.headers = [
+            ('Content-Type', content_type),
+            ('Cache-Control', IMMUTABLE if immutable else REVALIDATE),
+            ('Last-Modified', formatdate(self.modified, usegmt=True)),
+        ]
+        # Compressed copies, best first, as (encoding, path, size)
+        self.variants = [
+            (encoding, path + suffix, os.path.getsize(path + suffix))
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        ]
+        if self.variants:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+        self.variants.append((None, path, stat.st_size))
+
+    def choose(self, accept_encoding):
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding, path, size in self.variants:
+            if encoding is None or encoding in accepted:
+                return encoding, path, size
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+# WSGI middleware serving the files under STATIC_ROOT at STATIC_URL, picking
+# the brotli or gzip copy the client accepts. The directory is indexed once
+# at startup, so a request costs a dict lookup and a file open, and only
+# indexed names are served, which rules out path traversal. Anything else
+# goes to the wrapped application.
+class StaticFilesApplication:
+
+    def __init__(self, application, root, url):
+        self.application = application
+        self.prefix = url if url.endswith('/') else url + '/'
+        self.files = self.index(root) if root and os.path.isdir(root) else {}
+
+    @staticmethod
+    def index(root):
+        hashed = set()
+        manifest = os.path.join(root, ManifestStaticFilesStorage.manifest_name)
+        if os.path.exists(manifest):
+            with open(manifest, encoding='utf-8') as handle:
+                hashed = set(json.load(handle).get('paths', {}).values())
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(('.gz', '.br')) and os.path.exists(os.path.join(directory, name[:-3])):
+                    continue
+                path = os.path.join(directory, name)
+                url_name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[url_name] = StaticFile(path, url_name, url_name in hashed)
+        return files
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        method = environ.get('REQUEST_METHOD')
+        if method not in ('GET', 'HEAD') or not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+        static = self.files.get(path[len(self.prefix):])
+        if static is None:
+            return self.application(environ, start_response)
+
+        headers = list(static.headers)
+        if _not_modified(environ.get('HTTP_IF_MODIFIED_SINCE'), static.modified):
+            start_response('304 Not Modified', headers)
+            return []
+        encoding, file_path, size = static.choose(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(size)))
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return []
+        handle = open(file_path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(handle, 64 * 1024)
+        return _read_chunks(handle)
+
+
+def _not_modified(header, modified):
+    if not header:
+        return False
+    try:
+        return parsedate_to_datetime(header).timestamp() >= modified
+    except (TypeError, ValueError):
+        return False
+
+
+def _read_chunks(handle):
+    with handle:
+        while True:
+            chunk = handle.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from PROJECTFOURBOOKING.staticfiles import StaticFilesApplication
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PROJECTFOURBOOKING.settings')
 
 application = get_wsgi_application()
+
+# Serve the collected static files without going through Django
+if settings.STATIC_STORAGE == 'local':
+    application = StaticFilesApplication(application, settings.STATIC_ROOT, settings.STATIC_URL)
@@ -1,6 +1,50 @@
 from django.contrib import admin
-from .models import User, Table, Booking
+from .models import User, Table, Booking, WaitlistEntry, Job
+from .pagination import EstimatedCountPaginator
 
-admin.site.register(User)
-admin.site.register(Table)
-admin.site.register(Booking)
+
+# search_fields also serves the user autocompletes of the other admins
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    list_display = ('email', 'first_name', 'last_name', 'is_active')
+    search_fields = ('email',)
+    ordering = ('email',)  # The unique index
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Table)
+class TableAdmin(admin.ModelAdmin):
+    list_display = ('table_number', 'capacity')
+    ordering = ('table_number',)
+
+
+# Load each booking's user and table with the booking itself, since the
+# changelist shows both for every row. The date drill-down and the table
+# filter both have an index (booking_date_idx, booking_table_date_idx).
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ('date_time', 'user', 'table', 'guests')
+    list_select_related = ('user', 'table')
+    list_filter = ('table',)
+    date_hierarchy = 'date_time'
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_related()
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date_time', 'guests', 'requested_at', 'status')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'run_after', 'attempts', 'last_error')
+    list_filter = ('status', 'kind')
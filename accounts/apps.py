@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    # Register the model signal handlers and system checks
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,100 @@
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability, caching, capacity
+from .availability import BOOKING_DURATION
+from .models import ArchivedBooking, Booking, WaitlistEntry
+from .pagination import KeysetPaginationMixin
+
+
+# Bookings that started longer ago than this are archived by default
+ARCHIVE_AFTER = timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365))
+
+
+# Move bookings that started before `cutoff` to ArchivedBooking, oldest
+# first, `batch_size` at a time. Each batch is copied and deleted in one
+# transaction, so an interrupted run loses nothing and simply resumes where
+# it stopped when run again. Yields the number of bookings moved so far
+# after every batch.
+#
+# Only finished sittings are moved, so the availability index never needs to
+# know. The daily summary keeps counting archived bookings, and the delete
+# deliberately skips the booking signals that would take them out of it.
+def archive(cutoff=None, batch_size=1000):
+    cutoff = min(cutoff or timezone.now() - ARCHIVE_AFTER, timezone.now() - BOOKING_DURATION)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Booking.objects
+                .filter(date_time__lt=cutoff)
+                .order_by('date_time', 'pk')
+                .select_for_update(of=('self',))
+                .values_list('pk', 'user_id', 'table_id', 'table__table_number', 'date_time', 'guests')
+                [:batch_size]
+            )
+            if not rows:
+                break
+            ArchivedBooking.objects.bulk_create(
+                (
+                    ArchivedBooking(
+                        id=pk, user_id=user_id, table_id=table_id, table_number=table_number,
+                        date_time=date_time, guests=guests,
+                    )
+                    for pk, user_id, table_id, table_number, date_time, guests in rows
+                ),
+                ignore_conflicts=True,  # Copied by an earlier run that was rolled back halfway
+            )
+            pks = [row[0] for row in rows]
+            WaitlistEntry.objects.filter(booking_id__in=pks).update(booking=None)
+            queryset = Booking.objects.filter(pk__in=pks)
+            queryset._raw_delete(queryset.db)
+
+        for user_id in {row[1] for row in rows}:
+            caching.invalidate_user_bookings(user_id)
+        moved += len(rows)
+        yield moved
+
+    capacity.index.invalidate()
+    availability.index.invalidate()
+
+
+# One entry of a user's booking history, live or archived
+def history_json(booking):
+    archived = isinstance(booking, ArchivedBooking)
+    return {
+        'id': booking.pk,
+        'table': booking.table_number if archived else booking.table.table_number,
+        'date_time': booking.date_time.isoformat(),
+        'guests': booking.guests,
+        'archived': archived,
+    }
+
+
+# Keyset pagination over a user's live and archived bookings, newest first.
+# Both tables are sought on the same (date_time, id) keyset, each through its
+# (user, date_time, id) index, and the two pages merged.
+class HistoryPaginationMixin(KeysetPaginationMixin):
+    keyset = ('-date_time', '-id')
+
+    def get_history(self, user):
+        return [
+            Booking.objects.filter(user=user).select_related('table').only(
+                'id', 'date_time', 'guests', 'table__table_number',
+            ),
+            ArchivedBooking.objects.filter(user=user).only('id', 'date_time', 'guests', 'table_number'),
+        ]
+
+    def seek_rows(self, querysets, page_size, backwards, values):
+        pages = []
+        for queryset in querysets:
+            pages.append(super().seek_rows(queryset, page_size, backwards, values))
+        merged = list(heapq.merge(
+            *(rows for rows, _ in pages), key=lambda booking: (booking.date_time, booking.pk), reverse=True,
+        ))
+        more = len(merged) > page_size or any(more for _, more in pages)
+        return (merged[-page_size:] if backwards else merged[:page_size]), more
@@ -0,0 +1,175 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+
+from . import availability
+from .availability import BOOKING_DURATION
+
+
+# Most tables that may be pushed together for one party. Tables with
+# consecutive numbers count as adjacent.
+MAX_COMBINED = getattr(settings, 'ASSIGNMENT_MAX_COMBINED', 3)
+
+# Options the batch planner may examine while backtracking for parties its
+# best fit decreasing pass couldn't seat
+SEARCH_BUDGET = getattr(settings, 'ASSIGNMENT_SEARCH_BUDGET', 2000)
+
+MINUTE = timedelta(minutes=1)
+
+
+# A party to seat; `key` identifies it in the plan
+Request = namedtuple('Request', 'key guests when')
+
+
+# The ways to seat `guests` at `tables` ((id, table_number, capacity) rows),
+# best first: as tuples of table ids, fewest empty seats, then fewest tables,
+# then lowest table number. Combinations are runs of adjacent tables that
+# only just fit, since a longer run would waste a whole table.
+def options(tables, guests):
+    tables = sorted(tables, key=lambda table: table[1])
+    found = []
+    for i, (pk, number, capacity) in enumerate(tables):
+        if capacity >= guests:
+            found.append((capacity - guests, 1, number, (pk,)))
+            continue
+        seats, run = capacity, [pk]
+        for j in range(i + 1, min(i + MAX_COMBINED, len(tables))):
+            if tables[j][1] != tables[j - 1][1] + 1:
+                break
+            seats += tables[j][2]
+            run.append(tables[j][0])
+            if seats >= guests:
+                found.append((seats - guests, len(run), number, tuple(run)))
+                break
+    found.sort()
+    return [option for *_, option in found]
+
+
+# Best place for one party at `when`, as a list of (id, table_number,
+# capacity) rows, or None when no table or adjacent tables are free
+def best_fit(guests, when, exclude=None):
+    free = availability.free_tables(1, when, exclude)
+    fits = options(free, guests)
+    if not fits:
+        return None
+    rows = {row[0]: row for row in free}
+    return [rows[pk] for pk in fits[0]]
+
+
+# Seats a batch of parties around the bookings already taken, best fit
+# decreasing: largest parties first, each at its best free option. Then it
+# backtracks for the parties left over: for each of their options blocked by
+# a single planned party, it tries to move that party to another free option
+# to make room. Nobody seated is ever dropped, so this only adds guests.
+# SEARCH_BUDGET bounds the options examined.
+#
+# Each table's occupancy is an int bitmask with a bit per minute from the
+# earliest sitting, so a fit check is one AND per table. Times are rounded
+# outwards to whole minutes, which can only make the plan more cautious.
+class Planner:
+
+    def __init__(self, tables, bookings=()):
+        self.tables = {pk: (number, capacity) for pk, number, capacity in tables}
+        self._rows = [(pk, number, capacity) for pk, (number, capacity) in self.tables.items()]
+        self._bookings = [(table_id, start) for table_id, start in bookings if table_id in self.tables]
+        self._options = {}  # guests -> options()
+
+    # Plan around the bookings held by the availability index
+    @classmethod
+    def for_window(cls, start, end):
+        return cls(*availability.index.window(start - BOOKING_DURATION, end + BOOKING_DURATION))
+
+    def options(self, guests):
+        if guests not in self._options:
+            self._options[guests] = options(self._rows, guests)
+        return self._options[guests]
+
+    # Returns {request key: tuple of table ids, or None if unseated}
+    def plan(self, requests, budget=SEARCH_BUDGET):
+        return _Plan(self, requests, budget).run()
+
+
+# The state of one Planner.plan() call
+class _Plan:
+
+    def __init__(self, planner, requests, budget):
+        self.planner = planner
+        self.requests = {request.key: request for request in requests}
+        self.budget = budget
+        times = [request.when for request in requests] + [start for _, start in planner._bookings]
+        self.origin = min(times, default=None)
+        self.fixed = dict.fromkeys(planner.tables, 0)  # Existing bookings
+        self.busy = dict.fromkeys(planner.tables, 0)  # Existing bookings and the plan
+        self.holders = {pk: [] for pk in planner.tables}  # Planned request keys
+        self.spans = {key: self.span(request.when) for key, request in self.requests.items()}
+        self.plan = {}
+        for table_id, start in planner._bookings:
+            self.fixed[table_id] |= self.span(start)
+        self.busy.update(self.fixed)
+
+    def span(self, when):
+        start = (when - self.origin) // MINUTE
+        end = -(-(when + BOOKING_DURATION - self.origin) // MINUTE)
+        return ((1 << (end - start)) - 1) << start
+
+    def first_fit(self, request):
+        span, busy = self.spans[request.key], self.busy
+        for option in self.planner.options(request.guests):
+            for table_id in option:
+                if busy[table_id] & span:
+                    break
+            else:
+                return option
+        return None
+
+    def place(self, option, key):
+        for table_id in option:
+            self.busy[table_id] |= self.spans[key]
+            self.holders[table_id].append(key)
+        self.plan[key] = option
+
+    def unplace(self, key):
+        for table_id in self.plan[key]:
+            self.busy[table_id] &= ~self.spans[key]
+            self.holders[table_id].remove(key)
+        self.plan[key] = None
+
+    # Seat `request` by moving one planned party out of the way
+    def make_room(self, request):
+        span = self.spans[request.key]
+        for option in self.planner.options(request.guests):
+            if self.budget <= 0:
+                return
+            self.budget -= 1
+            if any(self.fixed[table_id] & span for table_id in option):
+                continue
+            blockers = {
+                key for table_id in option for key in self.holders[table_id] if self.spans[key] & span
+            }
+            if len(blockers) != 1:
+                continue
+            moved = blockers.pop()
+            previous = self.plan[moved]
+            self.unplace(moved)
+            self.place(option, request.key)
+            elsewhere = self.first_fit(self.requests[moved])
+            if elsewhere is not None:
+                self.place(elsewhere, moved)
+                return
+            self.unplace(request.key)
+            self.place(previous, moved)
+
+    def run(self):
+        ordered = sorted(self.requests.values(), key=lambda request: (-request.guests, request.when))
+        for request in ordered:
+            self.plan[request.key] = None
+            option = self.first_fit(request)
+            if option is not None:
+                self.place(option, request.key)
+        for request in ordered:
+            if self.budget <= 0:
+                break
+            if self.plan[request.key] is None:
+                self.make_room(request)
+        return self.plan
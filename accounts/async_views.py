@@ -0,0 +1,202 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponseNotAllowed, JsonResponse
+
+from . import availability, batch, catalogue, reservations
+from .models import Booking, User
+from .pagination import KeysetPaginationMixin
+from .views import party_query
+
+
+# Async JSON endpoints for polling clients, served under ASGI (e.g.
+# gunicorn PROJECTFOURBOOKING.asgi:application -k uvicorn.workers.UvicornWorker).
+# The method checks are inline because Django 3.2's require_GET and friends
+# wrap views in a sync function, which would hide that they are async.
+#
+# Django 3.2 has no async ORM, so every database call is handed to a small
+# dedicated thread pool. The pool bounds how many connections the event loop
+# can open at once, and unlike the default thread_sensitive mode it doesn't
+# funnel every call through a single thread.
+_db_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_DB_THREADS', 8),
+    thread_name_prefix='accounts-db',
+)
+
+
+# Run a synchronous function in the database pool. Connections are checked
+# like at the start and end of a request, since pool threads outlive requests.
+def run_in_db_thread(func):
+
+    @wraps(func)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False, executor=_db_executor)
+
+
+# Resolve the lazy request.user (a session and a user query) off the loop
+@run_in_db_thread
+def _authenticated_user(request):
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+def _login_required():
+    return JsonResponse({'error': 'authentication required'}, status=401)
+
+
+# Staff sign in as django.contrib.auth users, who have no bookings
+def _customers_only():
+    return JsonResponse({'error': 'only customer accounts have bookings'}, status=403)
+
+
+def _booking_json(booking):
+    table = catalogue.snapshot().get(booking.table_id)
+    return {
+        'id': booking.pk,
+        'table': table.table_number if table else None,
+        'date_time': booking.date_time.isoformat(),
+        'guests': booking.guests,
+    }
+
+
+# Cursor pagination over a user's bookings, newest first, matching
+# BookingListView
+class _BookingPager(KeysetPaginationMixin):
+    keyset = ('-date_time', '-id')
+
+    def __init__(self, request):
+        self.request = request
+
+
+@run_in_db_thread
+def _booking_page(request, user, page_size):
+    queryset = Booking.objects.filter(user=user).only('id', 'table', 'date_time', 'guests')
+    _, page, rows, _ = _BookingPager(request).paginate_queryset(queryset, page_size)
+    return {
+        'bookings': [_booking_json(booking) for booking in rows],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+async def booking_list(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user = await _authenticated_user(request)
+    if user is None:
+        return _login_required()
+    if not isinstance(user, User):
+        return _customers_only()
+    return JsonResponse(await _booking_page(request, user, page_size=20))
+
+
+# Same parameters as TableAvailabilityView: ?guests=4&date_time=...
+async def table_availability(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    guests, when, error = party_query(request.GET)
+    if error is not None:
+        return error
+
+    # The index may need a (re)build from the database
+    free = await run_in_db_thread(availability.free_tables)(guests, when)
+    tables = [
+        {'id': pk, 'table_number': table_number, 'capacity': capacity}
+        for pk, table_number, capacity in free
+    ]
+    return JsonResponse({'guests': guests, 'date_time': when.isoformat(), 'tables': tables})
+
+
+@run_in_db_thread
+def _create_booking(user, data):
+    table = catalogue.snapshot().by_number(data['table'])
+    if table is None:
+        return {'error': 'unknown table'}, 400
+    if not 1 <= data['guests'] <= table.capacity:
+        return {'error': f'table {table.table_number} seats 1 to {table.capacity} guests'}, 400
+    booking = Booking(user=user, table_id=table.id, date_time=data['date_time'], guests=data['guests'])
+    try:
+        reservations.reserve(booking)
+    except reservations.BookingConflict:
+        return {'error': 'table already booked at that time'}, 409
+    return _booking_json(booking), 201
+
+
+# Create a booking from a JSON body: {"table": 3, "date_time": "...", "guests": 2}
+async def booking_create(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _authenticated_user(request)
+    if user is None:
+        return _login_required()
+    if not isinstance(user, User):
+        return _customers_only()
+    try:
+        body = json.loads(request.body)
+        data = {
+            'table': int(body['table']),
+            'guests': int(body['guests']),
+            'date_time': availability.parse_when(body['date_time']),
+        }
+    except (ValueError, KeyError, TypeError):
+        data = None
+    if data is None or data['date_time'] is None:
+        return JsonResponse({'error': 'expected table, guests and an ISO 8601 date_time'}, status=400)
+
+    result, status = await _create_booking(user, data)
+    return JsonResponse(result, status=status)
+
+
+@run_in_db_thread
+def _apply_batch(user, operations, atomic):
+    applied, results = batch.apply(user, operations, atomic)
+    for result in results:
+        if 'booking' in result:
+            result['booking'] = _booking_json(result['booking'])
+    return {'applied': applied, 'results': results}
+
+
+# Apply many booking operations in one request and one transaction:
+#
+#   {"operations": [
+#       {"op": "create", "table": 3, "date_time": "...", "guests": 2},
+#       {"op": "update", "id": 7, "guests": 4},
+#       {"op": "delete", "id": 8}],
+#    "atomic": true}
+#
+# The response has a result per operation, see batch.apply. With "atomic"
+# (the default) one invalid operation rejects the batch with a 400;
+# "atomic": false applies the valid operations and reports the others.
+async def booking_batch(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = await _authenticated_user(request)
+    if user is None:
+        return _login_required()
+    if not isinstance(user, User):
+        return _customers_only()
+    try:
+        body = json.loads(request.body)
+        operations, atomic = body['operations'], body.get('atomic', True)
+    except (ValueError, KeyError, TypeError):
+        operations = atomic = None
+    if not isinstance(operations, list) or not isinstance(atomic, bool):
+        return JsonResponse({'error': 'expected a list of operations and an optional atomic flag'}, status=400)
+
+    try:
+        result = await _apply_batch(user, operations, atomic)
+    except batch.BatchError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    except batch.BatchConflict as exc:
+        return JsonResponse({'error': str(exc)}, status=409)
+    return JsonResponse(result, status=200 if result['applied'] else 400)
@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Booking, Table
+
+
+# How long a single booking keeps its table occupied
+BOOKING_DURATION = getattr(settings, 'BOOKING_DURATION', timedelta(hours=2))
+
+# Seconds a worker trusts its index before reloading it, so that writes made by
+# other gunicorn workers (which only fire signals in their own process) show up
+INDEX_MAX_AGE = getattr(settings, 'AVAILABILITY_INDEX_MAX_AGE', 60)
+
+
+# Parse the start of a sitting from an ISO 8601 date and time, naive times
+# being in the current time zone. None if it isn't one, including impossible
+# dates like 2030-02-30, which make parse_datetime raise.
+def parse_when(value):
+    try:
+        when = parse_datetime(value)
+    except ValueError:
+        return None
+    if when is not None and timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+# Sorted start times of the bookings on one table. Every booking lasts
+# BOOKING_DURATION, so the start times alone describe the occupied intervals.
+class _TableSlots:
+    __slots__ = ('table_number', 'capacity', 'starts', 'booking_ids')
+
+    def __init__(self, table_number, capacity):
+        self.table_number = table_number
+        self.capacity = capacity
+        self.starts = []  # Booking start times, kept sorted
+        self.booking_ids = []  # Booking ids, parallel to starts
+
+    def add(self, booking_id, start):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.booking_ids.insert(i, booking_id)
+
+    def remove(self, booking_id, start):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.booking_ids[i] == booking_id:
+                del self.starts[i]
+                del self.booking_ids[i]
+                return
+            i += 1
+
+    # A new sitting at `when` overlaps every booking starting in the open
+    # interval (when - BOOKING_DURATION, when + BOOKING_DURATION)
+    def is_free(self, when, exclude=None):
+        i = bisect.bisect_right(self.starts, when - BOOKING_DURATION)
+        end = when + BOOKING_DURATION
+        while i < len(self.starts) and self.starts[i] < end:
+            if self.booking_ids[i] != exclude:
+                return False
+            i += 1
+        return True
+
+
+# In-memory interval index of upcoming bookings, one sorted list per table.
+# Built lazily from the database and then kept up to date by the model signals
+# in accounts/signals.py.
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tables = None  # table id -> _TableSlots
+        self._bookings = {}  # booking id -> (table id, start)
+        self._built_at = 0.0
+
+    def rebuild(self):
+        horizon = timezone.now() - BOOKING_DURATION
+        tables = {
+            pk: _TableSlots(table_number, capacity)
+            for pk, table_number, capacity
+            in Table.objects.values_list('pk', 'table_number', 'capacity')
+        }
+        bookings = {}
+        rows = (
+            Booking.objects
+            .filter(date_time__gt=horizon)
+            .order_by('date_time')
+            .values_list('pk', 'table_id', 'date_time')
+        )
+        for pk, table_id, start in rows:
+            slots = tables.get(table_id)
+            if slots is not None:
+                # Rows arrive in start order, so appending keeps each list sorted
+                slots.starts.append(start)
+                slots.booking_ids.append(pk)
+                bookings[pk] = (table_id, start)
+        with self._lock:
+            self._tables = tables
+            self._bookings = bookings
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+
+    def _ensure_built(self):
+        if self._tables is None or time.monotonic() - self._built_at > INDEX_MAX_AGE:
+            self.rebuild()
+
+    # Return the tables that seat `guests` and are free for a sitting at `when`,
+    # smallest suitable table first
+    def free_tables(self, guests, when, exclude=None):
+        with self._lock:
+            self._ensure_built()
+            free = [
+                (pk, slots.table_number, slots.capacity)
+                for pk, slots in self._tables.items()
+                if slots.capacity >= guests and slots.is_free(when, exclude)
+            ]
+        free.sort(key=lambda row: (row[2], row[1]))
+        return free
+
+    # Check a single table; `exclude` skips a booking that is being edited
+    def is_table_free(self, table_id, when, exclude=None):
+        with self._lock:
+            self._ensure_built()
+            slots = self._tables.get(table_id)
+            return slots is not None and slots.is_free(when, exclude)
+
+    # Every table as (id, table_number, capacity), and the bookings starting
+    # between `start` and `end` as (table id, start), for planning
+    def window(self, start, end):
+        with self._lock:
+            self._ensure_built()
+            tables = [(pk, slots.table_number, slots.capacity) for pk, slots in self._tables.items()]
+            bookings = [
+                (pk, booked)
+                for pk, slots in self._tables.items()
+                for booked in slots.starts[
+                    bisect.bisect_left(slots.starts, start):bisect.bisect_left(slots.starts, end)
+                ]
+            ]
+        return tables, bookings
+
+    def booking_saved(self, booking_id, table_id, start):
+        with self._lock:
+            if self._tables is None:
+                return
+            self._discard(booking_id)
+            slots = self._tables.get(table_id)
+            if slots is None:
+                # Unknown table, most likely created by another worker
+                self._tables = None
+                return
+            slots.add(booking_id, start)
+            self._bookings[booking_id] = (table_id, start)
+
+    def booking_deleted(self, booking_id):
+        with self._lock:
+            if self._tables is not None:
+                self._discard(booking_id)
+
+    def table_saved(self, table_id, table_number, capacity):
+        with self._lock:
+            if self._tables is None:
+                return
+            slots = self._tables.get(table_id)
+            if slots is None:
+                self._tables[table_id] = _TableSlots(table_number, capacity)
+            else:
+                slots.table_number = table_number
+                slots.capacity = capacity
+
+    def table_deleted(self, table_id):
+        with self._lock:
+            if self._tables is None:
+                return
+            # Deleting a table cascades to its bookings
+            slots = self._tables.pop(table_id, None)
+            if slots is not None:
+                for booking_id in slots.booking_ids:
+                    self._bookings.pop(booking_id, None)
+
+    def _discard(self, booking_id):
+        previous = self._bookings.pop(booking_id, None)
+        if previous is not None:
+            table_id, start = previous
+            slots = self._tables.get(table_id)
+            if slots is not None:
+                slots.remove(booking_id, start)
+
+
+# Process-wide index shared by the views and the signal handlers
+index = AvailabilityIndex()
+
+
+def free_tables(guests, when, exclude=None):
+    return index.free_tables(guests, when, exclude)
+
+
+def is_table_free(table, when, exclude=None):
+    table_id = getattr(table, 'pk', table)
+    return index.is_table_free(table_id, when, exclude)
@@ -0,0 +1,33 @@
+from django.contrib.auth.backends import BaseBackend
+
+from .models import User
+
+
+# Log customers in with the email address and password of accounts.User.
+# Staff keep using django.contrib.auth's User through ModelBackend. Only
+# email= logins are accepted: username= comes from forms for staff (like the
+# admin's), which must not get a customer, who has no is_staff.
+class EmailBackend(BaseBackend):
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if not email or password is None:
+            return None
+        try:
+            user = User.objects.get(email=User.objects.normalize_email(email))
+        except User.DoesNotExist:
+            # Hash anyway so response times don't reveal which emails exist
+            User().set_password(password)
+            return None
+        if not user.is_active:
+            return None
+        # Also upgrades the hash if the hasher or its costs changed
+        if not user.check_password(password):
+            return None
+        return user
+
+    def get_user(self, user_id):
+        try:
+            user = User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if user.is_active else None
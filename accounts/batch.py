@@ -0,0 +1,257 @@
+import bisect
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+
+from . import availability, caching, capacity, catalogue, summaries, waitlist
+from .availability import BOOKING_DURATION
+from .bulk import RowError, _overlaps
+from .models import Booking, Table, WaitlistEntry
+from .reservations import OVERLAP_CONSTRAINT, _is_retryable
+
+
+# Most operations accepted in one batch
+MAX_OPERATIONS = getattr(settings, 'BOOKING_BATCH_MAX_OPERATIONS', 1000)
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+# The batch as a whole can't be processed, e.g. it is too long
+class BatchError(Exception):
+    pass
+
+
+# The database rejected the checked batch, because of a concurrent change or
+# because the batch swaps bookings between slots
+class BatchConflict(Exception):
+    pass
+
+
+# Check the shape of one operation and resolve its table. Returns a dict with
+# op, id (update and delete), and table, date_time and guests where given.
+def _parse(operation, tables):
+    if not isinstance(operation, dict):
+        raise RowError('expected an object')
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        raise RowError('op must be create, update or delete')
+    parsed = {'op': op}
+    if op != 'create':
+        pk = operation.get('id')
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            raise RowError('id must be a booking id')
+        parsed['id'] = pk
+    if op == 'delete':
+        return parsed
+
+    if 'table' in operation:
+        table = tables.by_number(operation['table']) if isinstance(operation['table'], int) else None
+        if table is None:
+            raise RowError('unknown table')
+        parsed['table'] = table
+    if 'date_time' in operation:
+        when = availability.parse_when(str(operation['date_time']))
+        if when is None:
+            raise RowError('date_time must be an ISO 8601 date and time')
+        parsed['date_time'] = when
+    if 'guests' in operation:
+        guests = operation['guests']
+        if not isinstance(guests, int) or isinstance(guests, bool):
+            raise RowError('guests must be a number')
+        parsed['guests'] = guests
+
+    if op == 'create' and not {'table', 'date_time', 'guests'} <= parsed.keys():
+        raise RowError('create needs table, date_time and guests')
+    if op == 'update' and len(parsed) == 2:
+        raise RowError('update needs at least one of table, date_time and guests')
+    return parsed
+
+
+# Apply a list of booking operations for `user` in one transaction and
+# return (applied, results), one result dict per operation:
+#
+#   {'status': 'created' or 'updated', 'booking': <Booking>}
+#   {'status': 'deleted', 'id': ...}
+#   {'status': 'error', 'error': ...}
+#   {'status': 'skipped'}  (valid, but the batch was not applied)
+#
+# Operations are validated together: updates and deletes free their old
+# slots for the rest of the batch, and creates and updates are checked
+# against table capacity, the user's other bookings in the batch and the
+# bookings already in the database, in order. With `atomic` one invalid
+# operation stops the whole batch, otherwise the valid ones are applied.
+#
+# Writes go through bulk_create, bulk_update and a raw delete, without
+# signals, so the daily summary, the indexes and the caches are updated here
+# like in bulk.insert_bookings.
+def apply(user, operations, atomic=True):
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'at most {MAX_OPERATIONS} operations per batch')
+    tables = catalogue.snapshot()
+    results = [None] * len(operations)
+    parsed = {}
+    for index, operation in enumerate(operations):
+        try:
+            parsed[index] = _parse(operation, tables)
+        except RowError as exc:
+            results[index] = {'status': 'error', 'error': str(exc)}
+
+    try:
+        with transaction.atomic():
+            changes = _check(user, parsed, results, tables)
+            if atomic and any(result is not None for result in results):
+                for index in changes['valid']:
+                    results[index] = {'status': 'skipped'}
+                return False, results
+            _write(changes)
+    except IntegrityError as exc:
+        if OVERLAP_CONSTRAINT in str(exc):
+            raise BatchConflict('bookings clash, nothing was applied') from exc
+        raise
+    except OperationalError as exc:
+        # A deadlock, left possible when a booking changed table between
+        # the read and the lock in _check, or a lock timeout
+        if _is_retryable(exc):
+            raise BatchConflict('the bookings changed while the batch ran, nothing was applied') from exc
+        raise
+
+    if changes['valid']:
+        availability.index.invalidate()
+        capacity.index.invalidate()
+        caching.invalidate_user_bookings(user.pk)
+    for index in changes['valid']:
+        op, booking = changes['valid'][index]
+        results[index] = (
+            {'status': 'deleted', 'id': booking.pk} if op == 'delete' else {'status': f'{op}d', 'booking': booking}
+        )
+    return True, results
+
+
+# Validate the parsed operations against the database, recording errors in
+# `results`. Locks the user's bookings and the tables involved until the
+# transaction ends.
+def _check(user, parsed, results, tables):
+    # Lock the tables before the bookings, like reservations.reserve, which
+    # locks a table and then writes its booking: taking them the other way
+    # round could deadlock with it. Updates without a table stay at the one
+    # they are at now, read here without a lock.
+    locked = {operation['table'].id for operation in parsed.values() if 'table' in operation}
+    staying = [operation['id'] for operation in parsed.values() if operation['op'] == 'update']
+    if staying:
+        locked.update(Booking.objects.filter(user=user, pk__in=staying).values_list('table_id', flat=True))
+    _lock_tables(locked)
+    ids = [operation['id'] for operation in parsed.values() if 'id' in operation]
+    existing = Booking.objects.select_for_update().filter(user=user, pk__in=ids).in_bulk()
+
+    seen = set()
+    targets = {}  # index: (op, booking with its new values, old values)
+    for index, operation in parsed.items():
+        try:
+            op = operation['op']
+            if op == 'create':
+                booking, old = Booking(user=user), None
+            else:
+                booking = existing.get(operation['id'])
+                if booking is None:
+                    raise RowError('booking not found')
+                if booking.pk in seen:
+                    raise RowError('booking changed earlier in this batch')
+                seen.add(booking.pk)
+                old = Booking(table_id=booking.table_id, date_time=booking.date_time, guests=booking.guests)
+            if op != 'delete':
+                if 'table' in operation:
+                    booking.table_id = operation['table'].id
+                booking.date_time = operation.get('date_time', booking.date_time)
+                booking.guests = operation.get('guests', booking.guests)
+                seats = tables.capacity(booking.table_id)
+                if not 1 <= booking.guests <= (seats or 0):
+                    raise RowError(f'table {tables.get(booking.table_id).table_number} seats 1 to {seats} guests')
+            targets[index] = (op, booking, old)
+        except RowError as exc:
+            results[index] = {'status': 'error', 'error': str(exc)}
+
+    # A booking moved to another table since it was read above
+    placed = [booking for op, booking, _ in targets.values() if op != 'delete']
+    table_ids = {booking.table_id for booking in placed}
+    _lock_tables(table_ids - locked)
+
+    # Start times per table of the bookings that stay where they are
+    starts = {table_id: [] for table_id in table_ids}
+    if placed:
+        moving = [booking.pk for op, booking, _ in targets.values() if op != 'create']
+        rows = (
+            Booking.objects
+            .filter(
+                table_id__in=table_ids,
+                date_time__gt=min(booking.date_time for booking in placed) - BOOKING_DURATION,
+                date_time__lt=max(booking.date_time for booking in placed) + BOOKING_DURATION,
+            )
+            .exclude(pk__in=moving)
+            .order_by('date_time')
+            .values_list('table_id', 'date_time')
+        )
+        for table_id, start in rows:
+            starts[table_id].append(start)
+
+    valid = {}
+    for index, (op, booking, old) in sorted(targets.items()):
+        if op != 'delete':
+            if _overlaps(starts[booking.table_id], booking.date_time):
+                results[index] = {'status': 'error', 'error': 'table already booked at that time'}
+                continue
+            bisect.insort(starts[booking.table_id], booking.date_time)
+        valid[index] = (op, booking)
+    return {'valid': valid, 'old': {index: targets[index][2] for index in valid}}
+
+
+# Lock tables in id order, so concurrent batches queue up instead of
+# deadlocking
+def _lock_tables(table_ids):
+    if table_ids:
+        list(Table.objects.select_for_update().filter(pk__in=table_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def _write(changes):
+    by_op = {op: [] for op in OPERATIONS}
+    for op, booking in changes['valid'].values():
+        by_op[op].append(booking)
+    old = [booking for booking in changes['old'].values() if booking is not None]
+
+    if by_op['delete']:
+        pks = [booking.pk for booking in by_op['delete']]
+        WaitlistEntry.objects.filter(booking_id__in=pks).update(booking=None)
+        queryset = Booking.objects.filter(pk__in=pks)
+        queryset._raw_delete(queryset.db)
+    summaries.bookings_removed(old)
+    if by_op['update']:
+        Booking.objects.bulk_update(by_op['update'], ['table', 'date_time', 'guests'])
+    if by_op['create']:
+        Booking.objects.bulk_create(by_op['create'])
+        _fill_ids(by_op['create'])
+    summaries.bookings_added(by_op['update'] + by_op['create'])
+    if by_op['delete'] or any(
+        waitlist.frees_room(_slot(changes['old'][index]), _slot(booking))
+        for index, (op, booking) in changes['valid'].items() if op == 'update'
+    ):
+        waitlist.request_promotion()
+
+
+def _slot(booking):
+    return booking.table_id, booking.date_time, booking.guests
+
+
+# bulk_create only sets primary keys on databases that return them (not
+# SQLite on Django 3.2). A table can't hold two bookings starting at the
+# same time, so (table, start) finds them.
+def _fill_ids(bookings):
+    missing = {(booking.table_id, booking.date_time): booking for booking in bookings if booking.pk is None}
+    if not missing:
+        return
+    rows = Booking.objects.filter(
+        table_id__in={table_id for table_id, _ in missing},
+        date_time__in={start for _, start in missing},
+    ).values_list('pk', 'table_id', 'date_time')
+    for pk, table_id, start in rows:
+        booking = missing.get((table_id, start))
+        if booking is not None:
+            booking.pk = pk
@@ -0,0 +1,231 @@
+import json
+import platform
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import caching, checks
+from .availability import BOOKING_DURATION
+from .models import Booking, Table, User
+from .querycount import count_queries
+
+
+CUSTOMER_BACKEND = 'accounts.backends.EmailBackend'
+STAFF_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+# Latency percentiles (ms), throughput and queries per request for a run
+def summarize(latencies, elapsed, queries=None, errors=0):
+    latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    if queries is not None:
+        summary['queries_per_request'] = round(sum(queries) / len(queries), 2)
+    return summary
+
+
+# The flows under test: (name, who is logged in, method, path, POST data
+# factory taking the request number)
+def scenarios():
+    first_table = Table.objects.order_by('pk').first()
+    latest = Booking.objects.order_by('-date_time').values_list('date_time', flat=True).first()
+    start = max(latest or timezone.now(), timezone.now()) + BOOKING_DURATION
+
+    def new_booking(n):
+        return {
+            'table': first_table.pk,
+            'date_time': timezone.localtime(start + BOOKING_DURATION * n).strftime('%Y-%m-%d %H:%M:%S'),
+            'guests': 1,
+        }
+
+    return [
+        ('booking_list', 'customer', 'get', reverse('home'), None),
+        ('booking_create', 'customer', 'post', reverse('create_view'), new_booking),
+        ('table_list', None, 'get', reverse('table-list'), None),
+        ('admin_booking_changelist', 'staff', 'get', reverse('admin:accounts_booking_changelist'), None),
+    ]
+
+
+def benchmark_users():
+    customer = (
+        User.objects.filter(booking__isnull=False).order_by('pk').first()
+        or User.objects.order_by('pk').first()
+    )
+    staff, _ = get_user_model().objects.get_or_create(
+        username='benchmark-staff', defaults={'is_staff': True, 'is_superuser': True},
+    )
+    return {'customer': (customer, CUSTOMER_BACKEND), 'staff': (staff, STAFF_BACKEND), None: None}
+
+
+# Drive each flow through Django's test client, counting queries
+def run_in_process(requests):
+    users = benchmark_users()
+    results = {}
+    for name, who, method, path, data in scenarios():
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+        if users[who] is not None:
+            user, backend = users[who]
+            client.force_login(user, backend=backend)
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for n in range(requests):
+            begin = time.perf_counter()
+            with count_queries() as counter:
+                if method == 'get':
+                    response = client.get(path)
+                else:
+                    response = client.post(path, data(n))
+            latencies.append(time.perf_counter() - begin)
+            queries.append(counter.count)
+            # A create that re-renders the form was rejected
+            errors += response.status_code >= 400 or (method == 'post' and response.status_code != 302)
+        results[name] = summarize(latencies, time.perf_counter() - started, queries, errors)
+    return results
+
+
+# The booking list of a logged in customer under each session engine
+# (settings.SESSION_ENGINES), each also with SESSION_SAVE_EVERY_REQUEST, where
+# every response saves the session. Session reads and writes show up in the
+# queries per request.
+#
+# The cached modes are meant for memcached. Without it (a database cache,
+# which they refuse) they are measured on a memory cache instead, which
+# costs no queries either, and labelled so.
+def run_sessions(requests):
+    customer, backend = benchmark_users()['customer']
+    path = reverse('home')
+    results = {}
+    for mode, engine in settings.SESSION_ENGINES.items():
+        cache_settings, label = {}, ''
+        session_cache = settings.CACHES[settings.SESSION_CACHE_ALIAS]['BACKEND']
+        if engine in checks.CACHED_SESSION_ENGINES and session_cache in caching.DATABASE_CACHES:
+            memory = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+            cache_settings = {'CACHES': {**settings.CACHES, 'benchmark': memory}, 'SESSION_CACHE_ALIAS': 'benchmark'}
+            label = ' (memory cache)'
+        for save_every_request in (False, True):
+            with override_settings(
+                SESSION_ENGINE=engine, SESSION_SAVE_EVERY_REQUEST=save_every_request, **cache_settings,
+            ):
+                client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+                client.force_login(customer, backend=backend)
+                client.get(path)  # Warm the caches, as a logged in user would have
+                latencies, queries, errors = [], [], 0
+                started = time.perf_counter()
+                for _ in range(requests):
+                    begin = time.perf_counter()
+                    with count_queries() as counter:
+                        response = client.get(path)
+                    latencies.append(time.perf_counter() - begin)
+                    queries.append(counter.count)
+                    errors += response.status_code != 200
+                name = f'{mode}{label}, save every request' if save_every_request else f'{mode}{label}'
+                results[name] = summarize(latencies, time.perf_counter() - started, queries, errors)
+    return results
+
+
+# Session cookies for a user, so an HTTP client can act as them
+def session_cookie(user, backend):
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = backend
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.save()
+    return f'{settings.SESSION_COOKIE_NAME}={store.session_key}'
+
+
+# Hit a running server with `concurrency` threads. Only GET flows are used,
+# since POSTs would need a CSRF round trip per request.
+def run_http(base_url, requests, concurrency):
+    users = benchmark_users()
+    cookies = {who: session_cookie(*users[who]) for who in ('customer', 'staff')}
+    cookies[None] = ''
+    results = {}
+    for name, who, method, path, _ in scenarios():
+        if method != 'get':
+            continue
+        url = base_url.rstrip('/') + path
+
+        def fetch(_):
+            request = urllib.request.Request(url, headers={'Cookie': cookies[who]})
+            begin = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    failed = response.status >= 400
+            except OSError:
+                failed = True
+            return time.perf_counter() - begin, failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(fetch, range(requests)))
+        results[name] = summarize(
+            [latency for latency, _ in outcomes],
+            time.perf_counter() - started,
+            errors=sum(failed for _, failed in outcomes),
+        )
+    return results
+
+
+def environment():
+    return {
+        'database': connection.vendor,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'bookings': Booking.objects.count(),
+        'tables': Table.objects.count(),
+        'users': User.objects.count(),
+        'finished_at': timezone.now().isoformat(),
+    }
+
+
+# Compare a run with an earlier one. A flow regresses when its p95 latency
+# grows or its throughput drops by more than `tolerance` (a fraction), or
+# when it runs more queries per request.
+def regressions(current, baseline, tolerance=0.2):
+    found = []
+    for mode, flows in current.items():
+        for name, now in flows.items():
+            before = baseline.get(mode, {}).get(name)
+            if not before:
+                continue
+            if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                found.append(f'{mode}/{name}: p95 {before["p95_ms"]}ms -> {now["p95_ms"]}ms')
+            if before.get('throughput_rps') and now['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+                found.append(
+                    f'{mode}/{name}: throughput {before["throughput_rps"]} -> {now["throughput_rps"]} req/s'
+                )
+            if now.get('queries_per_request', 0) > before.get('queries_per_request', float('inf')):
+                found.append(
+                    f'{mode}/{name}: queries per request '
+                    f'{before["queries_per_request"]} -> {now["queries_per_request"]}'
+                )
+    return found
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
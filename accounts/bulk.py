@@ -0,0 +1,212 @@
+import bisect
+import csv
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+
+from . import availability, caching, capacity, catalogue, summaries
+from .availability import BOOKING_DURATION
+from .models import Booking, User
+from .reservations import OVERLAP_CONSTRAINT
+
+
+# Columns of a booking in import and export files. Users are identified by
+# email and tables by table number, so files can move between databases.
+BOOKING_FIELDS = ('user', 'table', 'date_time', 'guests')
+
+
+# A JSON Lines line that isn't a JSON object. It is passed on like a row,
+# holding the raw line, so the validators reject it with `error` and it ends
+# up with the other rejects instead of stopping the import.
+class InvalidRow(dict):
+
+    def __init__(self, line, error):
+        super().__init__(line=line.rstrip('\r\n'))
+        self.error = error
+
+
+# Stream rows as dicts from a CSV (with a header line) or JSON Lines file
+def read_rows(fileobj, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(fileobj)
+    elif fmt == 'jsonl':
+        for number, line in enumerate(fileobj, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield InvalidRow(line, f'line {number} is not valid JSON')
+                continue
+            yield row if isinstance(row, dict) else InvalidRow(line, f'line {number} is not a JSON object')
+    else:
+        raise ValueError(f'Unknown format {fmt!r}')
+
+
+# Write rows (dicts) to a CSV or JSON Lines file
+class RowWriter:
+
+    def __init__(self, fileobj, fmt, fields):
+        self.fileobj = fileobj
+        self.fmt = fmt
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(fileobj, fieldnames=fields, extrasaction='ignore')
+            self._csv.writeheader()
+        elif fmt != 'jsonl':
+            raise ValueError(f'Unknown format {fmt!r}')
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self._csv.writerow(row)
+        else:
+            self.fileobj.write(json.dumps(row, default=str) + '\n')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RowError(Exception):
+    pass
+
+
+# Turn one raw row into an unsaved Booking, or raise RowError
+def _build_booking(row, user_ids, tables):
+    if isinstance(row, InvalidRow):
+        raise RowError(row.error)
+    user_id = user_ids.get(User.objects.normalize_email(str(row.get('user', '')).strip()))
+    if user_id is None:
+        raise RowError('unknown user')
+    try:
+        table = tables.by_number(int(row.get('table')))
+    except (TypeError, ValueError):
+        raise RowError('table must be a table number')
+    if table is None:
+        raise RowError('unknown table')
+    when = availability.parse_when(str(row.get('date_time', '')).strip())
+    if when is None:
+        raise RowError('date_time must be an ISO 8601 date and time')
+    try:
+        guests = int(row.get('guests'))
+    except (TypeError, ValueError):
+        raise RowError('guests must be a number')
+    if guests < 1:
+        raise RowError('guests must be at least 1')
+    if guests > table.capacity:
+        raise RowError(f'table {table.table_number} seats at most {table.capacity} guests')
+    return Booking(user_id=user_id, table_id=table.id, date_time=when, guests=guests)
+
+
+# Start times of the existing bookings that could clash with `bookings`,
+# per table, sorted
+def _booked_starts(bookings):
+    if not bookings:
+        return {}
+    table_ids = {booking.table_id for booking in bookings}
+    earliest = min(booking.date_time for booking in bookings) - BOOKING_DURATION
+    latest = max(booking.date_time for booking in bookings) + BOOKING_DURATION
+    starts = {table_id: [] for table_id in table_ids}
+    rows = (
+        Booking.objects
+        .filter(table_id__in=table_ids, date_time__gt=earliest, date_time__lt=latest)
+        .order_by('date_time')
+        .values_list('table_id', 'date_time')
+    )
+    for table_id, start in rows:
+        starts[table_id].append(start)
+    return starts
+
+
+def _overlaps(starts, when):
+    i = bisect.bisect_right(starts, when - BOOKING_DURATION)
+    return i < len(starts) and starts[i] < when + BOOKING_DURATION
+
+
+# Validate a chunk of rows against users, table capacity and availability
+# (including earlier rows of the same chunk). Returns the bookings to insert
+# and a list of (row, error) rejects.
+def validate_chunk(rows):
+    emails = {User.objects.normalize_email(str(row.get('user', '')).strip()) for row in rows}
+    user_ids = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+    tables = catalogue.snapshot()
+
+    candidates, rejects = [], []
+    for row in rows:
+        try:
+            candidates.append((row, _build_booking(row, user_ids, tables)))
+        except RowError as exc:
+            rejects.append((row, str(exc)))
+
+    starts = _booked_starts([booking for _, booking in candidates])
+    accepted = []
+    for row, booking in candidates:
+        table_starts = starts[booking.table_id]
+        if _overlaps(table_starts, booking.date_time):
+            rejects.append((row, 'table already booked at that time'))
+            continue
+        bisect.insort(table_starts, booking.date_time)
+        accepted.append((row, booking))
+    return accepted, rejects
+
+
+# Insert validated bookings in one transaction. If a concurrent writer took
+# a slot in the meantime the database rejects the batch; the rows are then
+# retried one at a time so only the clashing ones are rejected.
+def insert_bookings(accepted, batch_size):
+    rejects = []
+    try:
+        with transaction.atomic():
+            Booking.objects.bulk_create([booking for _, booking in accepted], batch_size=batch_size)
+            summaries.bookings_added(booking for _, booking in accepted)
+        created = len(accepted)
+    except IntegrityError:
+        created = 0
+        with transaction.atomic():
+            for row, booking in accepted:
+                booking.pk = None
+                try:
+                    with transaction.atomic():
+                        booking.save(force_insert=True)
+                    created += 1
+                except IntegrityError as exc:
+                    if OVERLAP_CONSTRAINT in str(exc):
+                        rejects.append((row, 'table already booked at that time'))
+                    else:
+                        rejects.append((row, str(exc)))
+
+    # bulk_create sends no post_save signals, so refresh the derived state here
+    if created:
+        availability.index.invalidate()
+        capacity.index.invalidate()
+        for user_id in {booking.user_id for _, booking in accepted}:
+            caching.invalidate_user_bookings(user_id)
+    return created, rejects
+
+
+# Import bookings from an iterable of rows in chunks. Yields
+# (rows processed, bookings created, rejects) after every chunk.
+def import_bookings(rows, chunk_size=1000):
+    for chunk in chunked(rows, chunk_size):
+        accepted, rejects = validate_chunk(chunk)
+        created, failed = insert_bookings(accepted, chunk_size)
+        yield len(chunk), created, rejects + failed
+
+
+# Stream every booking as a row dict with constant memory
+def export_bookings(queryset=None, chunk_size=2000, ordering=('pk',)):
+    if queryset is None:
+        queryset = Booking.objects.all()
+    rows = (
+        queryset
+        .order_by(*ordering)
+        .values_list('user__email', 'table__table_number', 'date_time', 'guests')
+        .iterator(chunk_size=chunk_size)
+    )
+    for email, table_number, when, guests in rows:
+        yield {'user': email, 'table': table_number, 'date_time': when.isoformat(), 'guests': guests}
@@ -0,0 +1,71 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# How long a cached booking list page stays valid at most
+BOOKING_LIST_TIMEOUT = getattr(settings, 'BOOKING_LIST_CACHE_TIMEOUT', 300)
+
+TABLES_VERSION_KEY = 'accounts:tables:version'
+
+# Caches that cost a database query per lookup
+DATABASE_CACHES = {'django.core.cache.backends.db.DatabaseCache'}
+
+
+# Whether booking list pages are worth caching. Through a database cache a
+# hit costs three queries (version keys, page, fragment) to save the one
+# that builds the page, so pages are only cached in memcached or memory.
+# Version stamps, and with them the catalogue, are kept in any cache.
+def pages_cached():
+    return settings.CACHES['default']['BACKEND'] not in DATABASE_CACHES
+
+
+def _user_version_key(user_id):
+    return f'accounts:bookings:{user_id}:version'
+
+
+# Versions are unique tokens rather than counters, so a version key that was
+# evicted and recreated can never match entries cached under an old value
+def _new_version():
+    return str(time.time_ns())
+
+
+def _versions(*keys):
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            version = _new_version()
+            # add() so that concurrent requests settle on a single value
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            found[key] = version
+        versions.append(found[key])
+    return versions
+
+
+# Current version stamp of the table catalogue
+def tables_version():
+    return _versions(TABLES_VERSION_KEY)[0]
+
+
+# Cache key for one page of a user's booking list. It changes whenever one of
+# the user's bookings or any table changes, so stale entries are never read
+# and simply expire.
+def booking_list_key(user_id, cursor=''):
+    user_version, table_version = _versions(_user_version_key(user_id), TABLES_VERSION_KEY)
+    digest = hashlib.md5(cursor.encode()).hexdigest()
+    return f'accounts:bookings:{user_id}:{user_version}:{table_version}:{digest}'
+
+
+# Called from the Booking signals
+def invalidate_user_bookings(user_id):
+    cache.set(_user_version_key(user_id), _new_version(), None)
+
+
+# Called when the table catalogue changes; table numbers show up in every
+# booking list
+def invalidate_tables():
+    cache.set(TABLES_VERSION_KEY, _new_version(), None)
@@ -0,0 +1,168 @@
+import math
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .availability import BOOKING_DURATION
+from .models import Booking, Table
+
+
+SLOT = timedelta(minutes=getattr(settings, 'CAPACITY_SLOT_MINUTES', 15))
+DAYS = getattr(settings, 'CAPACITY_DAYS', 30)
+
+# Seconds a worker trusts its matrix before reloading it, as with the
+# availability index
+MAX_AGE = getattr(settings, 'CAPACITY_MAX_AGE', 60)
+
+SLOTS_PER_DAY = timedelta(days=1) // SLOT
+
+
+# Precomputed occupancy of every table in every SLOT of the next DAYS days,
+# starting at local midnight today. Built lazily from the database and then
+# kept up to date by the model signals in accounts/signals.py, one booking at
+# a time.
+#
+# The matrix is a flat array with a row of SLOT counters per table (bookings
+# covering that table and slot, normally 0 or 1). Per slot totals of busy
+# tables, busy seats and seated guests are maintained alongside it, so reading
+# the free capacity of any range is a slice.
+class CapacityIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._origin = None  # Start of the first slot; None when not built
+        self._built_at = 0.0
+        self._slots = DAYS * SLOTS_PER_DAY
+        self._rows = {}  # table id -> row number in the matrix
+        self._capacity = {}  # table id -> seats
+        self._bookings = {}  # booking id -> (table id, start, guests)
+        self._matrix = array('H')
+        self._busy_tables = array('H')
+        self._busy_seats = array('L')
+        self._guests = array('L')
+
+    def rebuild(self):
+        origin = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        tables = list(Table.objects.order_by('pk').values_list('pk', 'capacity'))
+        rows = (
+            Booking.objects
+            .filter(
+                date_time__gt=origin - BOOKING_DURATION,
+                date_time__lt=origin + SLOT * self._slots,
+            )
+            .values_list('pk', 'table_id', 'date_time', 'guests')
+        )
+        with self._lock:
+            self._origin = origin
+            self._rows = {pk: row for row, (pk, _) in enumerate(tables)}
+            self._capacity = dict(tables)
+            self._bookings = {}
+            self._matrix = array('H', [0]) * (len(tables) * self._slots)
+            self._busy_tables = array('H', [0]) * self._slots
+            self._busy_seats = array('L', [0]) * self._slots
+            self._guests = array('L', [0]) * self._slots
+            for pk, table_id, start, guests in rows:
+                if self._apply(table_id, start, guests, 1):
+                    self._bookings[pk] = (table_id, start, guests)
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._origin = None
+
+    def _ensure_built(self):
+        if (
+            self._origin is None
+            or time.monotonic() - self._built_at > MAX_AGE
+            or timezone.now() >= self._origin + timedelta(days=1)
+        ):
+            self.rebuild()
+
+    # The slots a booking starting at `start` covers, clipped to the matrix
+    def _slot_range(self, start):
+        offset = (start - self._origin) / SLOT
+        first = max(math.floor(offset), 0)
+        last = min(math.ceil(offset + BOOKING_DURATION / SLOT), self._slots)
+        return range(first, last)
+
+    # Add (sign 1) or remove (sign -1) a booking. Returns False when its table
+    # isn't in the matrix.
+    def _apply(self, table_id, start, guests, sign):
+        row = self._rows.get(table_id)
+        if row is None:
+            return False
+        capacity = self._capacity[table_id]
+        base = row * self._slots
+        matrix, busy_tables, busy_seats, seated = (
+            self._matrix, self._busy_tables, self._busy_seats, self._guests,
+        )
+        for slot in self._slot_range(start):
+            before = matrix[base + slot]
+            matrix[base + slot] = before + sign
+            if sign > 0 and before == 0:
+                busy_tables[slot] += 1
+                busy_seats[slot] += capacity
+            elif sign < 0 and before == 1:
+                busy_tables[slot] -= 1
+                busy_seats[slot] -= capacity
+            seated[slot] += sign * guests
+        return True
+
+    def booking_saved(self, booking_id, table_id, start, guests):
+        with self._lock:
+            if self._origin is None:
+                return
+            self._discard(booking_id)
+            if self._apply(table_id, start, guests, 1):
+                self._bookings[booking_id] = (table_id, start, guests)
+            else:
+                # Unknown table, most likely created by another worker
+                self._origin = None
+
+    def booking_deleted(self, booking_id):
+        with self._lock:
+            if self._origin is not None:
+                self._discard(booking_id)
+
+    # Tables change rarely and shift every row, so just start over
+    def table_changed(self):
+        self.invalidate()
+
+    def _discard(self, booking_id):
+        previous = self._bookings.pop(booking_id, None)
+        if previous is not None:
+            self._apply(*previous, -1)
+
+    # Free capacity per slot from `start` (default: local midnight today) for
+    # `days` days, or up to the end of the horizon
+    def grid(self, start=None, days=None):
+        with self._lock:
+            self._ensure_built()
+            origin = self._origin
+            first = 0 if start is None else max(math.floor((start - origin) / SLOT), 0)
+            last = self._slots if days is None else min(first + days * SLOTS_PER_DAY, self._slots)
+            total_tables = len(self._rows)
+            total_seats = sum(self._capacity.values())
+            busy_tables = self._busy_tables[first:last]
+            busy_seats = self._busy_seats[first:last]
+            guests = self._guests[first:last]
+        return {
+            'start': (origin + SLOT * first).isoformat(),
+            'slot_minutes': SLOT // timedelta(minutes=1),
+            'total_tables': total_tables,
+            'total_seats': total_seats,
+            'free_tables': [total_tables - n for n in busy_tables],
+            'free_seats': [total_seats - n for n in busy_seats],
+            'guests': guests.tolist(),
+        }
+
+
+# Process-wide matrix shared by the views and the signal handlers
+index = CapacityIndex()
+
+
+def grid(start=None, days=None):
+    return index.grid(start, days)
@@ -0,0 +1,105 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from . import caching
+from .models import Table
+
+
+# Seconds between checks of the shared version stamp. Changes made in this
+# process are seen at once; other workers see them within this interval.
+CHECK_INTERVAL = getattr(settings, 'TABLE_CATALOGUE_CHECK_INTERVAL', 1.0)
+
+# Seconds a snapshot is trusted at most, like the availability index, in case
+# a change's version bump never reached the cache (a failed write, a flush)
+MAX_AGE = getattr(settings, 'TABLE_CATALOGUE_MAX_AGE', 60)
+
+
+# Read-only stand-in for a Table row
+class TableRecord(namedtuple('TableRecord', ['id', 'table_number', 'capacity'])):
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return f'Table {self.table_number} with capacity of {self.capacity} guests.'
+
+
+# Immutable copy of every table, ordered by id, with O(1) lookups by id and
+# by table number
+class TableSnapshot:
+    __slots__ = ('version', 'records', 'ids', '_by_id', '_by_number')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = tuple(records)
+        self.ids = tuple(record.id for record in self.records)
+        self._by_id = {record.id: record for record in self.records}
+        self._by_number = {record.table_number: record for record in self.records}
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, pk):
+        return self._by_id.get(pk)
+
+    def by_number(self, table_number):
+        return self._by_number.get(table_number)
+
+    def capacity(self, pk):
+        record = self._by_id.get(pk)
+        return None if record is None else record.capacity
+
+    # Position of the first table with an id above `pk`, for cursor paging
+    def index_after(self, pk):
+        return bisect.bisect_right(self.ids, pk)
+
+    def index_before(self, pk):
+        return bisect.bisect_left(self.ids, pk)
+
+
+_lock = threading.Lock()
+_snapshot = None
+_checked_at = 0.0
+_loaded_at = 0.0
+
+
+# Return this process's snapshot of the table catalogue, reloading it when
+# the shared version stamp in the cache has moved on or it is MAX_AGE old
+def snapshot():
+    global _snapshot, _checked_at, _loaded_at
+    current = _snapshot
+    now = time.monotonic()
+    if current is not None and now - _checked_at < CHECK_INTERVAL and now - _loaded_at <= MAX_AGE:
+        return current
+    with _lock:
+        version = caching.tables_version()
+        if _snapshot is None or _snapshot.version != version or now - _loaded_at > MAX_AGE:
+            rows = Table.objects.order_by('id').values_list('id', 'table_number', 'capacity')
+            records = tuple(TableRecord(*row) for row in rows)
+            if _snapshot is not None and _snapshot.version == version and _snapshot.records != records:
+                # The tables changed under an unchanged version. Move it on,
+                # so ETags and cached pages built on the old tables go too.
+                caching.invalidate_tables()
+                version = caching.tables_version()
+            _snapshot = TableSnapshot(version, records)
+            _loaded_at = now
+        _checked_at = now
+        return _snapshot
+
+
+# Drop the local snapshot and move the shared version on, so every worker
+# reloads on its next check. Called from the Table signals.
+def invalidate():
+    global _snapshot
+    caching.invalidate_tables()
+    with _lock:
+        _snapshot = None
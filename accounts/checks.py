@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from .caching import DATABASE_CACHES
+
+
+# Caches private to each process
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+
+# Session engines that keep sessions in SESSION_CACHE_ALIAS
+CACHED_SESSION_ENGINES = {
+    'accounts.sessions',
+    'django.contrib.sessions.backends.cache',
+    'django.contrib.sessions.backends.cached_db',
+}
+
+
+# Booking list pages and the table catalogue are invalidated through the
+# default cache (accounts/caching.py). With a cache of its own every worker
+# would keep serving what it cached before another worker's change.
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES and not getattr(settings, 'ALLOW_PROCESS_LOCAL_CACHE', False):
+        return [Error(
+            'The default cache is private to each process.',
+            hint='Configure a shared cache such as memcached or DatabaseCache, '
+                 'or set ALLOW_PROCESS_LOCAL_CACHE for a single process deployment.',
+            id='accounts.E001',
+        )]
+    return []
+
+
+# Cached sessions save database queries only if the cache doesn't cost one
+# per lookup itself. On a database cache they run as many queries as db
+# sessions, and more when every request saves the session.
+@register(Tags.caches)
+def check_session_cache(app_configs, **kwargs):
+    if settings.SESSION_ENGINE not in CACHED_SESSION_ENGINES:
+        return []
+    backend = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {}).get('BACKEND')
+    if backend in DATABASE_CACHES:
+        return [Error(
+            f'{settings.SESSION_ENGINE} sessions are kept in a database cache.',
+            hint='Use SESSION_MODE=db, or set MEMCACHED_LOCATION for the cached session modes.',
+            id='accounts.E002',
+        )]
+    return []
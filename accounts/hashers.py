@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+# Django's hashers with their cost taken from settings. The algorithm names
+# are unchanged, so existing hashes keep verifying, and a hash made with
+# other costs is redone with the configured ones on the user's next login
+# (check_password calls must_update). See manage.py benchmark_logins for
+# what the costs do to login throughput.
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = getattr(settings, 'PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+# Needs argon2-cffi
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = getattr(settings, 'ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+    memory_cost = getattr(settings, 'ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
+    parallelism = getattr(settings, 'ARGON2_PARALLELISM', hashers.Argon2PasswordHasher.parallelism)
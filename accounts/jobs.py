@@ -0,0 +1,109 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Attempts before a job is marked failed, and the first retry delay in
+# seconds (doubled after every failed attempt)
+MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 5)
+
+# Seconds before a job claimed by a worker that died is given to another one
+LEASE = getattr(settings, 'JOB_LEASE', 300)
+
+# Seconds an idle worker waits before looking for jobs again
+POLL_INTERVAL = getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+
+
+# kind -> function called with the job's payload as keyword arguments
+handlers = {}
+
+
+def handler(kind):
+    def register(func):
+        handlers[kind] = func
+        return func
+    return register
+
+
+# Add a job. Call it inside the transaction that makes the work necessary,
+# so the job is committed, or rolled back, along with it. With unique=True an
+# already pending job of the same kind and payload is reused.
+def enqueue(kind, payload=None, run_after=None, unique=False):
+    payload = payload or {}
+    if unique:
+        pending = Job.objects.filter(kind=kind, status=Job.PENDING, payload=payload).first()
+        if pending is not None:
+            return pending
+    return Job.objects.create(kind=kind, payload=payload, run_after=run_after or timezone.now())
+
+
+# Claim the next due job, or one whose lease ran out. The claim is a
+# conditional UPDATE, so two workers never get the same job and no row locks
+# (or SKIP LOCKED) are needed.
+def claim():
+    now = timezone.now()
+    due = (
+        Job.objects
+        .filter(
+            Q(status=Job.PENDING, run_after__lte=now)
+            | Q(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=LEASE))
+        )
+        .order_by('run_after', 'pk')
+        .values_list('pk', 'status', 'locked_at')[:10]
+    )
+    for pk, status, locked_at in due:
+        claimed = (
+            Job.objects
+            .filter(pk=pk, status=status, locked_at=locked_at)
+            .update(status=Job.RUNNING, locked_at=now, attempts=F('attempts') + 1)
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+# Run a claimed job. Finished jobs are deleted; failed ones are retried with
+# exponential backoff until MAX_ATTEMPTS, then kept as failed.
+def run(job):
+    try:
+        handlers[job.kind](**job.payload)
+    except Exception as exc:
+        logger.exception('%s failed (attempt %d)', job, job.attempts)
+        job.last_error = repr(exc)
+        job.locked_at = None
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = Job.FAILED
+        else:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        job.save(update_fields=['status', 'run_after', 'locked_at', 'last_error'])
+        return False
+    job.delete()
+    return True
+
+
+# Process jobs until `should_stop()` returns True, or with burst=True until
+# none are due. Returns the number of jobs run.
+def work(burst=False, should_stop=lambda: False):
+    done = 0
+    while not should_stop():
+        close_old_connections()
+        job = claim()
+        if job is None:
+            if burst:
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+        run(job)
+        done += 1
+    return done
@@ -0,0 +1,40 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from accounts import archive
+
+
+# Move old bookings to the archive table in batches. Safe to interrupt and
+# run again; run it from cron to keep the live table small.
+class Command(BaseCommand):
+    help = 'Archive bookings older than a cutoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive bookings before this date (YYYY-MM-DD)')
+        parser.add_argument(
+            '--days', type=int,
+            help='Archive bookings older than this many days (default ARCHIVE_AFTER_DAYS, 365)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Bookings per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        cutoff = None
+        if options['before']:
+            day = parse_date(options['before'])
+            if day is None:
+                raise CommandError('--before must be a date, e.g. 2023-01-01')
+            cutoff = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        elif options['days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+
+        moved = 0
+        for moved in archive.archive(cutoff, options['batch_size']):
+            self.stdout.write(f'{moved} bookings archived')
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Done, {moved} bookings archived'))
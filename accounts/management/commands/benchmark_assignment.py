@@ -0,0 +1,83 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts import assignment
+from accounts.availability import BOOKING_DURATION
+
+
+# Time the batch planner on a synthetic evening: `--requests` parties of 1 to
+# 12 guests arriving between 17:00 and 22:00 at `--tables` tables. Runs in
+# memory, without touching the database, and compares the planner with best
+# fit decreasing alone and with handing out the first free table that fits.
+class Command(BaseCommand):
+    help = 'Benchmark best-fit table assignment for an evening of booking requests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Parties to seat')
+        parser.add_argument('--tables', type=int, default=120, help='Tables in the room')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the requests')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs to take the best time of')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tables = [
+            (n, n, (2, 2, 4, 4, 4, 6, 8)[n % 7]) for n in range(1, options['tables'] + 1)
+        ]
+        opening = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time())) + timedelta(hours=17)
+        requests = [
+            assignment.Request(
+                key=n,
+                guests=rng.choices(range(1, 13), weights=(2, 10, 6, 8, 3, 3, 1, 1, 1, 1, 1, 1))[0],
+                when=opening + timedelta(minutes=15 * rng.randrange(21)),
+            )
+            for n in range(options['requests'])
+        ]
+        wanted = sum(request.guests for request in requests)
+
+        self.stdout.write(
+            f'{len(requests)} parties, {wanted} guests, {len(tables)} tables, '
+            f'{sum(capacity for *_, capacity in tables)} seats\n'
+        )
+        self.stdout.write(f'{"strategy":<24} {"ms":>8} {"parties":>8} {"guests":>8} {"empty seats":>12}')
+        capacities = {pk: capacity for pk, _, capacity in tables}
+        strategies = [
+            ('first free table', lambda: first_free(tables, requests)),
+            ('best fit decreasing', lambda: assignment.Planner(tables).plan(requests, budget=0)),
+            ('best fit + backtracking', lambda: assignment.Planner(tables).plan(requests)),
+        ]
+        for name, run in strategies:
+            elapsed = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                plan = run()
+                elapsed.append(time.perf_counter() - started)
+            seated = [request for request in requests if plan[request.key]]
+            empty = sum(
+                sum(capacities[pk] for pk in plan[request.key]) - request.guests for request in seated
+            )
+            self.stdout.write(
+                f'{name:<24} {min(elapsed) * 1000:>8.1f} {len(seated):>8} '
+                f'{sum(request.guests for request in seated):>8} {empty:>12}'
+            )
+
+
+# What staff do by hand: in arrival order, the lowest numbered free table
+# that is big enough
+def first_free(tables, requests):
+    tables = sorted(tables, key=lambda table: table[1])
+    sittings = {pk: [] for pk, *_ in tables}
+    plan = {}
+    for request in sorted(requests, key=lambda request: request.when):
+        plan[request.key] = None
+        for pk, _, capacity in tables:
+            if capacity >= request.guests and all(
+                abs(start - request.when) >= BOOKING_DURATION for start in sittings[pk]
+            ):
+                sittings[pk].append(request.when)
+                plan[request.key] = (pk,)
+                break
+    return plan
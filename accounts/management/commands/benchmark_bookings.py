@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import benchmarks, seeding
+
+
+# Benchmark the main booking flows (booking list, booking create, table list
+# and the admin booking changelist). Each flow is driven in process through
+# the test client, which also counts its queries, and with --url against a
+# running server from concurrent threads. Results can be written as JSON and
+# compared with an earlier run, failing on regressions, e.g.
+#
+#     manage.py benchmark_bookings --bookings 100000 --output after.json --baseline before.json
+#
+# --sessions adds the booking list under each session engine.
+class Command(BaseCommand):
+    help = 'Measure latency percentiles, throughput and queries per request of the booking flows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Users to seed')
+        parser.add_argument('--tables', type=int, default=20, help='Tables to seed')
+        parser.add_argument('--bookings', type=int, default=10000, help='Bookings to seed')
+        parser.add_argument('--no-seed', action='store_true', help='Use the data already in the database')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per flow')
+        parser.add_argument('--url', help='Base URL of a running server to load test, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients for --url')
+        parser.add_argument(
+            '--sessions', action='store_true', help='Also compare the booking list under each session engine',
+        )
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed p95 growth or throughput drop before a flow counts as a regression',
+        )
+
+    def handle(self, *args, **options):
+        if not options['no_seed']:
+            self.stdout.write(
+                f'Seeding {options["users"]} users, {options["tables"]} tables '
+                f'and {options["bookings"]} bookings...'
+            )
+            seeding.seed(users=options['users'], tables=options['tables'], bookings=options['bookings'])
+
+        results = {'in_process': benchmarks.run_in_process(options['requests'])}
+        if options['sessions']:
+            results['sessions'] = benchmarks.run_sessions(options['requests'])
+        if options['url']:
+            results['http'] = benchmarks.run_http(options['url'], options['requests'], options['concurrency'])
+        for mode, flows in results.items():
+            self.report(mode, flows)
+
+        if options['output']:
+            report = {
+                'environment': benchmarks.environment(),
+                'parameters': {
+                    name: options[name] for name in ('requests', 'concurrency', 'url', 'no_seed')
+                },
+                **results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Wrote {options["output"]}')
+
+        if options['baseline']:
+            found = benchmarks.regressions(results, benchmarks.load(options['baseline']), options['tolerance'])
+            if found:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(found))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def report(self, mode, flows):
+        self.stdout.write(
+            f'\n{mode}\n{"flow":<46} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"req/s":>8} {"queries":>8} {"errors":>7}'
+        )
+        for name, row in flows.items():
+            self.stdout.write(
+                f'{name:<46} {row["p50_ms"]:>8.1f} {row["p95_ms"]:>8.1f} {row["p99_ms"]:>8.1f} '
+                f'{row["throughput_rps"]:>8.1f} {row.get("queries_per_request", "-"):>8} {row["errors"]:>7}'
+            )
@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from accounts import seeding
+from accounts.views import BookingExportView
+
+
+class _Staff(AnonymousUser):
+    is_authenticated = True
+    is_staff = True
+
+
+class _Rollback(Exception):
+    pass
+
+
+# Show that BookingExportView streams in constant memory: for each size,
+# seed that many bookings, stream the CSV and report the peak Python
+# allocation. Everything runs in a transaction that is rolled back.
+class Command(BaseCommand):
+    help = 'Measure peak memory of the streaming booking export for growing row counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sizes', nargs='*', type=int, default=[1000, 10000, 100000, 1000000],
+            help='Numbers of bookings to export',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"rows":>10} {"seconds":>9} {"MB sent":>9} {"peak KiB":>9}')
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    seeding.seed(users=100, tables=50, bookings=size)
+                    self.stdout.write(self.measure(size))
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def measure(self, size):
+        request = RequestFactory().get('/export')
+        request.user = _Staff()
+        started = time.perf_counter()
+        tracemalloc.start()
+        response = BookingExportView.as_view()(request)
+        sent = sum(len(chunk) for chunk in response.streaming_content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - started
+        return f'{size:>10} {elapsed:>9.2f} {sent / 1e6:>9.1f} {peak / 1024:>9.0f}'
@@ -0,0 +1,71 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+
+PASSWORD = 'correct horse battery staple'
+
+
+# Time password checks, the cost of a login, for each hasher configuration
+# in one process, i.e. logins per second per core. Pass several
+# --pbkdf2-iterations or --argon2 values to compare costs before setting
+# PBKDF2_ITERATIONS or ARGON2_*.
+class Command(BaseCommand):
+    help = 'Benchmark login throughput per password hasher configuration.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pbkdf2-iterations', type=int, nargs='*',
+            help=f'PBKDF2 iteration counts (default: the configured {PBKDF2PasswordHasher.iterations})',
+        )
+        parser.add_argument(
+            '--argon2', nargs='*', metavar='TIME,MEMORY_KIB,PARALLELISM',
+            help='Argon2 costs (default: the configured ones); skipped without argon2-cffi',
+        )
+        parser.add_argument('--seconds', type=float, default=2, help='How long to time each configuration')
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        self.stdout.write(f'{"configuration":<44} {"ms/login":>9} {"logins/s/core":>14} {f"x{cores} cores":>10}')
+        for name, check in self.configurations(options):
+            rate = self.measure(check, options['seconds'])
+            self.stdout.write(f'{name:<44} {1000 / rate:>9.2f} {rate:>14.1f} {rate * cores:>10.0f}')
+
+    def configurations(self, options):
+        for iterations in options['pbkdf2_iterations'] or [PBKDF2PasswordHasher.iterations]:
+            hasher = PBKDF2PasswordHasher()
+            hasher.iterations = iterations
+            yield f'pbkdf2_sha256 iterations={iterations}', self.checker(hasher)
+
+        argon2 = Argon2PasswordHasher
+        for costs in options['argon2'] or [f'{argon2.time_cost},{argon2.memory_cost},{argon2.parallelism}']:
+            try:
+                time_cost, memory_cost, parallelism = (int(value) for value in costs.split(','))
+            except ValueError:
+                raise CommandError(f'--argon2 takes TIME,MEMORY_KIB,PARALLELISM, not {costs!r}')
+            hasher = Argon2PasswordHasher()
+            hasher.time_cost, hasher.memory_cost, hasher.parallelism = time_cost, memory_cost, parallelism
+            name = f'argon2 t={time_cost} m={memory_cost} p={parallelism}'
+            try:
+                hasher._load_library()
+            except ValueError:
+                self.stdout.write(f'{name:<44} skipped, argon2-cffi is not installed')
+                continue
+            yield name, self.checker(hasher)
+
+    def checker(self, hasher):
+        encoded = hasher.encode(PASSWORD, hasher.salt())
+        return lambda: hasher.verify(PASSWORD, encoded)
+
+    # Checks per second, timing at least three
+    def measure(self, check, seconds):
+        count = 0
+        started = time.perf_counter()
+        while True:
+            check()
+            count += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= seconds and count >= 3:
+                return count / elapsed
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from accounts.bulk import BOOKING_FIELDS, RowWriter, export_bookings
+
+
+# Export every booking in the layout import_bookings reads, streaming rows
+# from the database so memory use does not grow with the table
+class Command(BaseCommand):
+    help = 'Export all bookings to a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        target = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        count = 0
+        try:
+            writer = RowWriter(target, options['format'], BOOKING_FIELDS)
+            for row in export_bookings(chunk_size=options['chunk_size']):
+                writer.write(row)
+                count += 1
+        finally:
+            if target is not sys.stdout:
+                target.close()
+        self.stderr.write(f'Exported {count} bookings.')
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.bulk import BOOKING_FIELDS, RowWriter, import_bookings, read_rows
+
+
+# Bulk import bookings from a partner system's CSV or JSON Lines export.
+# Rows are columns user (email), table (number), date_time and guests.
+class Command(BaseCommand):
+    help = 'Import bookings from a CSV or JSON Lines file in batched transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--rejects', help='Where to write rejected rows (default: <path>.rejects.<format>)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Cannot tell the file format, pass --format')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        rejects_path = options['rejects'] or f'{"bookings" if path == "-" else path}.rejects.{fmt}'
+
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        processed = created = rejected = 0
+        started = time.monotonic()
+        try:
+            with open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+                writer = RowWriter(rejects_file, fmt, BOOKING_FIELDS + ('error',))
+                for rows, inserted, rejects in import_bookings(read_rows(source, fmt), options['chunk_size']):
+                    processed += rows
+                    created += inserted
+                    rejected += len(rejects)
+                    for row, error in rejects:
+                        writer.write({**row, 'error': error})
+                    rate = processed / max(time.monotonic() - started, 1e-9)
+                    self.stdout.write(
+                        f'{processed} rows read, {created} imported, {rejected} rejected ({rate:.0f} rows/s)'
+                    )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        if not rejected:
+            os.remove(rejects_path)
+        else:
+            self.stdout.write(f'Rejected rows written to {rejects_path}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} of {processed} bookings.'))
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.bulk import RowWriter, read_rows
+from accounts.provisioning import USER_FIELDS, provision_users
+
+
+# Bulk create customer accounts, e.g. when onboarding a corporate client.
+# Rows are columns email, first_name, last_name and password.
+class Command(BaseCommand):
+    help = 'Create users from a CSV or JSON Lines file, hashing passwords in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: one per CPU)')
+        parser.add_argument('--rejects', help='Where to write rejected rows (default: <path>.rejects.<format>)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Cannot tell the file format, pass --format')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        rejects_path = options['rejects'] or f'{"users" if path == "-" else path}.rejects.{fmt}'
+
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        processed = created = rejected = 0
+        started = time.monotonic()
+        try:
+            with open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+                # Never write the passwords of rejected rows back to disk
+                writer = RowWriter(rejects_file, fmt, USER_FIELDS[:-1] + ('error',))
+                batches = provision_users(read_rows(source, fmt), options['chunk_size'], options['workers'])
+                for rows, inserted, rejects in batches:
+                    processed += rows
+                    created += inserted
+                    rejected += len(rejects)
+                    for row, error in rejects:
+                        writer.write({**{field: row.get(field) for field in USER_FIELDS[:-1]}, 'error': error})
+                    rate = processed / max(time.monotonic() - started, 1e-9)
+                    self.stdout.write(
+                        f'{processed} rows read, {created} created, {rejected} rejected ({rate:.0f} rows/s)'
+                    )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        if not rejected:
+            os.remove(rejects_path)
+        else:
+            self.stdout.write(f'Rejected rows written to {rejects_path}')
+        self.stdout.write(self.style.SUCCESS(f'Created {created} of {processed} users.'))
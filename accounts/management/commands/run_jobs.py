@@ -0,0 +1,26 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from accounts import jobs
+
+
+# Background worker for the database job table, e.g. waitlist promotion. Run
+# one or more next to the web processes; no message broker is involved. Stops
+# after the current job on SIGINT or SIGTERM.
+class Command(BaseCommand):
+    help = 'Run queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help='Exit once no jobs are due')
+
+    def handle(self, *args, **options):
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        done = jobs.work(burst=options['burst'], should_stop=lambda: bool(stopping))
+        self.stdout.write(f'Ran {done} jobs')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import summaries
+
+
+# Rebuild the per day and table booking summary from the bookings, or with
+# --verify check it against them. Rebuild after changing TIME_ZONE, since
+# days are counted in the current time zone.
+class Command(BaseCommand):
+    help = 'Rebuild or verify the daily per-table booking summary.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Compare the summary with the bookings instead of rebuilding it',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            summaries.rebuild()
+            self.stdout.write(self.style.SUCCESS('Summary rebuilt'))
+            return
+
+        differences = summaries.verify()
+        for (date, table_id), (stored, actual) in sorted(differences.items()):
+            self.stdout.write(
+                f'{date} table {table_id}: summary has {stored[0]} bookings, {stored[1]} guests; '
+                f'bookings have {actual[0]}, {actual[1]}'
+            )
+        if differences:
+            raise CommandError(f'{len(differences)} summary rows differ, run summarize_bookings to rebuild')
+        self.stdout.write(self.style.SUCCESS('Summary matches the bookings'))
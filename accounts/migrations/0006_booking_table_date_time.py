@@ -0,0 +1,25 @@
+# Generated by Django 3.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_auto_20230404_2006'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='table',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to='accounts.table'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='date_time',
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+from ._overlap import (
+    POSTGRES_BACKWARD, POSTGRES_FORWARD, SQLITE_BACKWARD, SQLITE_FORWARD,
+    run_for_vendor,
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_booking_table_date_time'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from ._overlap import sqlite_recreate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_booking_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='table',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.table'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.user'),
+        ),
+        migrations.AlterField(
+            model_name='table',
+            name='table_number',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'date_time', 'id'], name='booking_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['table', 'date_time'], name='booking_table_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['date_time'], name='booking_date_idx'),
+        ),
+        # The AlterFields above rebuild accounts_booking on SQLite
+        migrations.RunPython(sqlite_recreate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+# Fill the summary from the existing bookings, like manage.py
+# summarize_bookings
+def populate(apps, schema_editor):
+    Booking = apps.get_model('accounts', 'Booking')
+    DailyTableSummary = apps.get_model('accounts', 'DailyTableSummary')
+    rows = (
+        Booking.objects
+        .annotate(date=TruncDate('date_time'))
+        .values('date', 'table_id')
+        .annotate(bookings=Count('id'), guests=Sum('guests'))
+        .order_by()
+    )
+    DailyTableSummary.objects.bulk_create(
+        (DailyTableSummary(**row) for row in rows.iterator()), batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_waitlist_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTableSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('guests', models.IntegerField(default=0)),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.table')),
+            ],
+            options={
+                'ordering': ['date', 'table'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailytablesummary',
+            constraint=models.UniqueConstraint(fields=('date', 'table'), name='summary_date_table_unique'),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_daily_table_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('table_number', models.IntegerField()),
+                ('date_time', models.DateTimeField()),
+                ('guests', models.IntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('table', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.table')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='accounts.user')),
+            ],
+            options={
+                'ordering': ['-date_time'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['user', 'date_time', 'id'], name='archive_user_date_idx'),
+        ),
+    ]
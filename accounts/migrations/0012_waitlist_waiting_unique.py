@@ -0,0 +1,28 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:47
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+# Keep the earliest of any duplicate waiting entries, so the constraint can
+# be added; the later ones are expired
+def expire_duplicates(apps, schema_editor):
+    WaitlistEntry = apps.get_model('accounts', 'WaitlistEntry')
+    waiting = WaitlistEntry.objects.filter(status='waiting')
+    keep = waiting.values('user', 'date_time', 'guests').annotate(first=Min('id')).values('first')
+    waiting.exclude(pk__in=keep).update(status='expired')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_archived_booking'),
+    ]
+
+    operations = [
+        migrations.RunPython(expire_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='waitlistentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('user', 'date_time', 'guests'), name='waitlist_waiting_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 21:40
+
+from django.db import migrations
+
+from ._overlap import sqlite_recreate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_waitlist_waiting_unique'),
+    ]
+
+    operations = [
+        # Replace the SQLite overlap triggers with ones that check a range of
+        # booking_table_date_idx instead of scanning the table's bookings
+        migrations.RunPython(sqlite_recreate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Shared by the migrations that create the booking overlap constraint. SQLite
+# drops triggers whenever a migration rebuilds accounts_booking, so later
+# migrations that alter the table must call sqlite_recreate afterwards.
+
+# Bookings on the same table may not overlap. Every sitting lasts two hours
+# (accounts.availability.BOOKING_DURATION); changing that setting needs a new
+# migration that recreates the constraint.
+DURATION_SECONDS = 2 * 60 * 60
+
+POSTGRES_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS btree_gist',
+    f'''
+    ALTER TABLE accounts_booking ADD CONSTRAINT accounts_booking_no_overlap
+    EXCLUDE USING gist (
+        table_id WITH =,
+        tsrange(
+            date_time AT TIME ZONE 'UTC',
+            (date_time AT TIME ZONE 'UTC') + interval '{DURATION_SECONDS} seconds'
+        ) WITH &&
+    )
+    ''',
+]
+POSTGRES_BACKWARD = [
+    'ALTER TABLE accounts_booking DROP CONSTRAINT IF EXISTS accounts_booking_no_overlap',
+]
+
+# SQLite has no exclusion constraints, so triggers do the same check. The
+# range on b.date_time lets it seek booking_table_date_idx; it is a second
+# wider than the sitting since datetime() drops fractions of a second, and
+# the exact test on the few rows in it has a millisecond of slack to keep
+# back-to-back sittings legal despite julianday() rounding. strftime('%s')
+# can't be used as Django rewrites '%s' placeholders.
+SQLITE_CHECK = f'''
+    WHEN EXISTS (
+        SELECT 1 FROM accounts_booking b
+        WHERE b.table_id = NEW.table_id
+        AND b.date_time > datetime(NEW.date_time, '-{DURATION_SECONDS + 1} seconds')
+        AND b.date_time < datetime(NEW.date_time, '+{DURATION_SECONDS + 1} seconds')
+        AND b.id IS NOT NEW.id
+        AND abs(julianday(b.date_time) - julianday(NEW.date_time)) * 86400 < {DURATION_SECONDS} - 0.001
+    )
+    BEGIN
+        SELECT RAISE(ABORT, 'accounts_booking_no_overlap: table already booked at that time');
+    END
+'''
+SQLITE_FORWARD = [
+    'CREATE TRIGGER accounts_booking_no_overlap_insert '
+    'BEFORE INSERT ON accounts_booking' + SQLITE_CHECK,
+    'CREATE TRIGGER accounts_booking_no_overlap_update '
+    'BEFORE UPDATE OF table_id, date_time ON accounts_booking' + SQLITE_CHECK,
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS accounts_booking_no_overlap_insert',
+    'DROP TRIGGER IF EXISTS accounts_booking_no_overlap_update',
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+def sqlite_recreate(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD + SQLITE_FORWARD:
+            schema_editor.execute(sql)
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User, AbstractBaseUser, BaseUserManager
 
 
@@ -40,7 +41,7 @@ class User(AbstractBaseUser):
 
 
 class Table(models.Model):
-    table_number = models.IntegerField()
+    table_number = models.IntegerField(unique=True)
     capacity = models.IntegerField()  # Max no of guests the table can seat
 
     # String representation of the table.
@@ -48,15 +49,142 @@ class Table(models.Model):
         return f'Table {self.table_number} with capacity of {self.capacity} guests.'
 
 
+# Querysets for bookings that are going to be displayed
+class BookingQuerySet(models.QuerySet):
+
+    # Join the user and table in the same query (Booking.__str__ and the
+    # templates read both) and skip the user's password and name columns
+    def with_related(self):
+        return self.select_related('user', 'table').only(
+            'id', 'date_time', 'guests',
+            'user', 'user__email',
+            'table', 'table__table_number', 'table__capacity',
+        )
+
+
 # Model representing a booking made by a user
 class Booking(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    date_time = models.DateTimeField(auto_now=True)
+    # The composite indexes below lead with user and table, so the foreign
+    # keys don't need single column indexes of their own
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, db_index=False)
+    date_time = models.DateTimeField()  # Start of the sitting
     guests = models.IntegerField()  # The number of guests for the booking
 
+    objects = BookingQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date_time']
+        indexes = [
+            # A user's bookings, newest first (BookingListView and its cursor)
+            models.Index(fields=['user', 'date_time', 'id'], name='booking_user_date_idx'),
+            # Overlap checks and availability per table
+            models.Index(fields=['table', 'date_time'], name='booking_table_date_idx'),
+            # Upcoming bookings across all tables and the default ordering
+            models.Index(fields=['date_time'], name='booking_date_idx'),
+        ]
 
     # String representation of the booking.
     def __str__(self):
-        return f'{self.user.username} - {self.date_time} for {self.guests} guests.'
+        return f'{self.user.email} - {self.date_time} for {self.guests} guests.'
+
+
+# Past bookings moved out of Booking by manage.py archive_bookings, keeping
+# their ids, so that the live table stays small. The table number is copied
+# since the table may be removed later.
+class ArchivedBooking(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    table = models.ForeignKey(Table, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    table_number = models.IntegerField()
+    date_time = models.DateTimeField()
+    guests = models.IntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date_time']
+        indexes = [
+            # A user's history, newest first, like booking_user_date_idx
+            models.Index(fields=['user', 'date_time', 'id'], name='archive_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.email} - {self.date_time} for {self.guests} guests (archived).'
+
+
+# Bookings and guests per day and table, kept up to date with every booking
+# change by accounts/summaries.py so reports read a row per day and table
+# instead of aggregating the bookings. Days are in the current time zone.
+class DailyTableSummary(models.Model):
+    date = models.DateField()
+    table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    bookings = models.IntegerField(default=0)
+    guests = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date', 'table']
+        constraints = [
+            # Also the index for date range reads
+            models.UniqueConstraint(fields=['date', 'table'], name='summary_date_table_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} table {self.table_id}: {self.bookings} bookings, {self.guests} guests.'
+
+
+# A party waiting for a table to free up at the time they asked for
+class WaitlistEntry(models.Model):
+    WAITING = 'waiting'
+    PROMOTED = 'promoted'  # Booked once a table freed up
+    EXPIRED = 'expired'  # The time passed before a table freed up
+    STATUS_CHOICES = [(WAITING, 'Waiting'), (PROMOTED, 'Promoted'), (EXPIRED, 'Expired')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date_time = models.DateTimeField()  # Start of the sitting they want
+    guests = models.IntegerField()
+    requested_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=WAITING)
+    booking = models.OneToOneField(Booking, null=True, blank=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        ordering = ['requested_at']
+        indexes = [
+            # The promotion worker's scan of parties still waiting
+            models.Index(fields=['status', 'date_time'], name='waitlist_status_date_idx'),
+        ]
+        constraints = [
+            # A party waits once for a sitting, however often the form is sent
+            models.UniqueConstraint(
+                fields=['user', 'date_time', 'guests'], condition=models.Q(status='waiting'),
+                name='waitlist_waiting_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user.email} waiting for {self.date_time} with {self.guests} guests.'
+
+
+# A unit of background work, run by manage.py run_jobs (see accounts/jobs.py)
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'  # Gave up after JOB_MAX_ATTEMPTS
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_at = models.DateTimeField(null=True, blank=True)  # When a worker claimed it
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for the next due job
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} job {self.pk} ({self.status})'
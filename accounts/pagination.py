@@ -0,0 +1,158 @@
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+# Tables estimated to hold more rows than this are not counted exactly by
+# EstimatedCountPaginator
+ESTIMATE_COUNTS_ABOVE = getattr(settings, 'ESTIMATE_COUNTS_ABOVE', 100000)
+
+
+# The current page of a keyset paginated list. Unlike Django's Page it knows
+# nothing about the total number of rows, so no COUNT(*) is ever needed.
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+# Cursor based pagination for ListViews.
+#
+# Pages are found by seeking past the last row of the previous page on the
+# `keyset` columns, e.g. ('-date_time', '-id'), instead of with OFFSET. The
+# keyset must end in a unique column so that the ordering is total. The
+# position is passed around as an opaque signed token in ?cursor=.
+class KeysetPaginationMixin:
+    keyset = ('id',)
+    cursor_kwarg = 'cursor'
+    cursor_salt = 'accounts.pagination'
+
+    def get_ordering(self):
+        return self.keyset
+
+    # Replaces MultipleObjectMixin.paginate_queryset and keeps its return shape
+    def paginate_queryset(self, queryset, page_size):
+        backwards, values = self._decode_cursor(self.request.GET.get(self.cursor_kwarg))
+        rows, more = self.seek_rows(queryset, page_size, backwards, values)
+        if backwards and not more:
+            # Walked back onto the first page, so serve it in full
+            backwards, values = False, None
+            rows, more = self.seek_rows(queryset, page_size, backwards, values)
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if more or backwards:
+                next_cursor = self._encode_cursor(False, rows[-1])
+            if backwards or values is not None:
+                previous_cursor = self._encode_cursor(True, rows[0])
+
+        page = KeysetPage(rows, next_cursor, previous_cursor)
+        return (None, page, rows, page.has_other_pages())
+
+    # Fetch one page after (or, going backwards, before) the cursor values.
+    # Views that page something other than a queryset override this.
+    def seek_rows(self, queryset, page_size, backwards, values):
+        keyset = self.keyset
+        if backwards:
+            keyset = tuple(_flip(field) for field in keyset)
+        queryset = queryset.order_by(*keyset)
+        if values is not None:
+            queryset = queryset.filter(_seek(keyset, values))
+        # One extra row tells us whether there is another page in this direction
+        rows = list(queryset[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+        return rows, more
+
+    def _encode_cursor(self, backwards, obj):
+        values = [_json_value(getattr(obj, field.lstrip('-'))) for field in self.keyset]
+        return signing.dumps([backwards, values], salt=self.cursor_salt, compress=True)
+
+    # A missing or tampered cursor falls back to the first page
+    def _decode_cursor(self, token):
+        if not token:
+            return False, None
+        try:
+            backwards, values = signing.loads(token, salt=self.cursor_salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            return False, None
+        if len(values) != len(self.keyset):
+            return False, None
+        return bool(backwards), values
+
+
+# A Paginator for admin changelists of big tables. COUNT(*) has to read the
+# whole table on Postgres, so an unfiltered list uses the planner's row
+# estimate (pg_class.reltuples, kept up to date by autovacuum) once it is
+# above ESTIMATE_COUNTS_ABOVE. Filtered lists, smaller tables and other
+# databases are counted exactly. Use with show_full_result_count = False,
+# which saves the admin another unfiltered count.
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where and not queryset.query.distinct:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ESTIMATE_COUNTS_ABOVE:
+                return estimate
+        return super().count
+
+
+# The planner's row estimate for a model's table, or None where there is none
+def estimated_count(model, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # -1 until the table is first vacuumed or analysed
+    return row[0] if row and row[0] >= 0 else None
+
+
+# Dates and times travel as ISO strings, which the ORM accepts back in lookups
+def _json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _flip(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+
+# Build the row-value comparison (a, b) > (x, y) as
+# a > x OR (a = x AND b > y), honouring each column's direction
+def _seek(keyset, values):
+    condition = Q()
+    equal = {}
+    for field, value in zip(keyset, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
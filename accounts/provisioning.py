@@ -0,0 +1,134 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .bulk import InvalidRow, RowError, chunked
+from .models import User
+
+
+# Columns of a user in provisioning files. A blank password gives the user an
+# unusable one, e.g. for accounts that sign in through a password reset.
+USER_FIELDS = ('email', 'first_name', 'last_name', 'password')
+
+NAME_LENGTH = User._meta.get_field('first_name').max_length
+
+
+# Pool workers only hash, but the hashers read settings, so a worker started
+# with spawn rather than fork needs Django set up
+def _init_worker():
+    django.setup()
+
+
+# Hash passwords, spread over the `workers` processes of `pool` if one is
+# given. Hashing is CPU bound by design, so threads would not help.
+def hash_passwords(passwords, pool=None, workers=1):
+    passwords = [password or None for password in passwords]
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+# Turn one raw row into an unsaved User (without a password), or raise
+# RowError
+def _build_user(row):
+    if isinstance(row, InvalidRow):
+        raise RowError(row.error)
+    email = User.objects.normalize_email(str(row.get('email') or '').strip())
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise RowError('email must be a valid email address')
+    names = {}
+    for field in ('first_name', 'last_name'):
+        value = str(row.get(field) or '').strip()
+        if not value:
+            raise RowError(f'{field} is required')
+        if len(value) > NAME_LENGTH:
+            raise RowError(f'{field} must be at most {NAME_LENGTH} characters')
+        names[field] = value
+    # JSON Lines rows may hold numbers, which make_password refuses
+    password = row.get('password')
+    if password is not None and not isinstance(password, str):
+        raise RowError('password must be a string')
+    return User(email=email, **names)
+
+
+# Validate a chunk of rows and drop emails that are already registered or
+# were seen earlier in the file (`seen` is updated). Returns (row, user)
+# pairs to insert and a list of (row, error) rejects.
+def validate_chunk(rows, seen):
+    candidates, rejects = [], []
+    for row in rows:
+        try:
+            user = _build_user(row)
+        except RowError as exc:
+            rejects.append((row, str(exc)))
+            continue
+        if user.email in seen:
+            rejects.append((row, 'duplicate email in file'))
+            continue
+        seen.add(user.email)
+        candidates.append((row, user))
+
+    existing = set(
+        User.objects.filter(email__in=[user.email for _, user in candidates]).values_list('email', flat=True)
+    )
+    accepted = []
+    for row, user in candidates:
+        if user.email in existing:
+            rejects.append((row, 'email already registered'))
+        else:
+            accepted.append((row, user))
+    return accepted, rejects
+
+
+# Insert users in one transaction. If a concurrent signup took one of the
+# emails in the meantime the database rejects the batch; the rows are then
+# retried one at a time so only the duplicates are rejected.
+def insert_users(accepted, batch_size):
+    rejects = []
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in accepted], batch_size=batch_size)
+        return len(accepted), rejects
+    except IntegrityError:
+        pass
+    created = 0
+    with transaction.atomic():
+        for row, user in accepted:
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                created += 1
+            except IntegrityError:
+                rejects.append((row, 'email already registered'))
+    return created, rejects
+
+
+# Create users from an iterable of rows in chunks, hashing passwords with
+# `workers` processes (default: one per CPU). Yields
+# (rows processed, users created, rejects) after every chunk. Passwords are
+# hashed before the chunk's transaction starts, so no locks are held while
+# the pool works.
+def provision_users(rows, chunk_size=1000, workers=None):
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker) if workers > 1 else None
+    seen = set()
+    try:
+        for chunk in chunked(rows, chunk_size):
+            accepted, rejects = validate_chunk(chunk, seen)
+            hashes = hash_passwords([row.get('password') for row, _ in accepted], pool, workers)
+            for (_, user), password in zip(accepted, hashes):
+                user.password = password
+            created, failed = insert_users(accepted, chunk_size)
+            yield len(chunk), created, rejects + failed
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+# Counts the SQL queries run on the default connection while installed with
+# connection.execute_wrapper(). Works with DEBUG off, unlike connection.queries.
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+# Test helper: fail when the block runs more than `budget` queries, e.g.
+#
+#     with assert_max_queries(3):
+#         client.get('/bookings/')
+@contextmanager
+def assert_max_queries(budget):
+    with count_queries() as counter:
+        yield counter
+    if counter.count > budget:
+        listing = '\n'.join(f'{n}. {sql}' for n, sql in enumerate(counter.statements, 1))
+        raise AssertionError(
+            f'{counter.count} queries executed, budget is {budget}:\n{listing}'
+        )
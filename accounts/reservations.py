@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+
+from .availability import BOOKING_DURATION
+from .models import Booking, Table
+
+
+# Name of the database constraint (Postgres) or trigger (SQLite) that
+# rejects overlapping bookings, see migration 0007
+OVERLAP_CONSTRAINT = 'accounts_booking_no_overlap'
+
+# Retry policy for serialization failures and lock timeouts
+MAX_ATTEMPTS = getattr(settings, 'RESERVATION_MAX_ATTEMPTS', 5)
+BACKOFF_BASE = getattr(settings, 'RESERVATION_BACKOFF_BASE', 0.02)  # seconds
+BACKOFF_MAX = getattr(settings, 'RESERVATION_BACKOFF_MAX', 0.5)  # seconds
+
+# Postgres serialization_failure and deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+
+# Raised when the requested table is already booked at that time
+class BookingConflict(Exception):
+    pass
+
+
+def _is_retryable(exc):
+    pgcode = getattr(exc.__cause__, 'pgcode', None)
+    return pgcode in RETRYABLE_PGCODES or 'database is locked' in str(exc)
+
+
+def _is_overlap(exc):
+    return OVERLAP_CONSTRAINT in str(exc)
+
+
+def _backoff(attempt):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    time.sleep(random.uniform(0, delay))  # Full jitter spreads out the retries
+
+
+# Save `booking` only if its table is free for the whole sitting.
+#
+# The table row is locked with SELECT ... FOR UPDATE, so concurrent requests
+# for the same table queue up behind each other while bookings on other tables
+# go ahead in parallel. The overlap constraint added in migration 0007 backs
+# this up at the database level. Serialization failures and lock timeouts are
+# retried with bounded, jittered exponential backoff.
+def reserve(booking):
+    pk, adding = booking.pk, booking._state.adding
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                Table.objects.select_for_update().only('pk').get(pk=booking.table_id)
+                clash = (
+                    Booking.objects
+                    .filter(
+                        table_id=booking.table_id,
+                        date_time__gt=booking.date_time - BOOKING_DURATION,
+                        date_time__lt=booking.date_time + BOOKING_DURATION,
+                    )
+                    .exclude(pk=booking.pk)
+                    .exists()
+                )
+                if clash:
+                    raise BookingConflict
+                booking.save()
+            return booking
+        except IntegrityError as exc:
+            booking.pk, booking._state.adding = pk, adding
+            if _is_overlap(exc):
+                raise BookingConflict from exc
+            raise
+        except OperationalError as exc:
+            if not _is_retryable(exc) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            # Forget any id assigned by the rolled back insert before retrying
+            booking.pk, booking._state.adding = pk, adding
+            _backoff(attempt)
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability, caching, capacity, catalogue, summaries
+from .availability import BOOKING_DURATION
+from .bulk import chunked
+from .models import Booking, Table, User
+
+
+# Synthetic data for benchmarks. Bookings are spread round robin over users
+# and tables, one sitting after another per table, so they never overlap.
+def seed(users=10, tables=10, bookings=100, batch_size=5000, start=None):
+    first_user = User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    first_table = Table.objects.order_by('-table_number').values_list('table_number', flat=True).first() or 0
+    User.objects.bulk_create(
+        (
+            User(email=f'seed{first_user + n}@example.com', first_name='Seed', last_name=str(n))
+            for n in range(1, users + 1)
+        ),
+        batch_size=batch_size,
+    )
+    Table.objects.bulk_create(
+        (Table(table_number=first_table + n, capacity=2 + n % 7) for n in range(1, tables + 1)),
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.order_by('-pk').values_list('pk', flat=True)[:users])
+    table_ids = list(Table.objects.order_by('-pk').values_list('pk', flat=True)[:tables])
+
+    # Start after every existing booking so the new ones can't clash
+    latest = Booking.objects.order_by('-date_time').values_list('date_time', flat=True).first()
+    start = start or timezone.now().replace(minute=0, second=0, microsecond=0)
+    if latest is not None and latest + BOOKING_DURATION > start:
+        start = latest + BOOKING_DURATION
+
+    rows = (
+        Booking(
+            user_id=user_ids[n % users],
+            table_id=table_ids[n % tables],
+            date_time=start + BOOKING_DURATION * (n // tables),
+            guests=1 + n % 2,
+        )
+        for n in range(bookings)
+    )
+    for batch in chunked(rows, batch_size):
+        with transaction.atomic():
+            Booking.objects.bulk_create(batch)
+            summaries.bookings_added(batch)
+
+    # bulk_create sends no post_save signals, so refresh the derived state here
+    catalogue.invalidate()
+    availability.index.invalidate()
+    capacity.index.invalidate()
+    for user_id in user_ids:
+        caching.invalidate_user_bookings(user_id)
+    return user_ids, table_ids
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+
+# Seconds an unchanged session may go without its database row being
+# rewritten. Only the expiry date would change, so in between the save just
+# refreshes the cache.
+WRITE_INTERVAL = getattr(settings, 'SESSION_DB_WRITE_INTERVAL', 60)
+
+
+# Django's cached_db sessions with the database writes coalesced: a save
+# that changes nothing but the expiry (every request, with
+# SESSION_SAVE_EVERY_REQUEST) only goes to the cache, and the row is rewritten
+# at most every WRITE_INTERVAL seconds. The row's expiry can therefore lag
+# the cache's by up to that long. Reads are served by the cache as before.
+#
+# The cache must be shared by every process and cheaper than the database,
+# i.e. memcached: a per-process cache would keep logged out sessions alive in
+# other processes, and a database cache costs the queries this saves (see
+# the accounts.E002 system check).
+class SessionStore(cached_db.SessionStore):
+    # The cached value is (data, time of the last database write), a
+    # different format from cached_db's
+    cache_key_prefix = 'accounts.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._written_at = None
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            cached = None  # E.g. memcached rejects the key, see cached_db
+        if cached is not None:
+            data, self._written_at = cached
+            return data
+
+        session = self._get_session_from_db()
+        if not session:
+            return {}
+        data = self.decode(session.session_data)
+        self._written_at = session.expire_date.timestamp() - self.get_session_cookie_age()
+        self._cache.set(self.cache_key, (data, self._written_at), self.get_expiry_age(expiry=session.expire_date))
+        return data
+
+    def save(self, must_create=False):
+        data = self._get_session(no_load=must_create)  # Loads _written_at too
+        now = time.time()
+        if must_create or self.modified or self._written_at is None or now - self._written_at >= WRITE_INTERVAL:
+            DBStore.save(self, must_create)
+            self._written_at = now
+        self._cache.set(self.cache_key, (data, self._written_at), self.get_expiry_age())
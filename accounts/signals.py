@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import availability, caching, capacity, catalogue, summaries, waitlist
+from .models import Booking, Table
+
+
+# Keep the availability index, the capacity matrix, the table catalogue and
+# the booking list cache in step with the database. Updates are applied on
+# commit so that a rolled back save never leaks into them. The daily summary
+# is updated, and changes that free a table queue a waitlist promotion job,
+# in the same transaction as the change itself.
+@receiver(pre_save, sender=Booking)
+def booking_saving(sender, instance, **kwargs):
+    # Remember what an update replaces, for the daily summary and the waitlist
+    instance._summary_previous = None
+    if not instance._state.adding and instance.pk is not None:
+        instance._summary_previous = (
+            Booking.objects.filter(pk=instance.pk).values_list('table_id', 'date_time', 'guests').first()
+        )
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, created, **kwargs):
+    booking_id, table_id, start = instance.pk, instance.table_id, instance.date_time
+    user_id, guests = instance.user_id, instance.guests
+
+    def update():
+        availability.index.booking_saved(booking_id, table_id, start)
+        capacity.index.booking_saved(booking_id, table_id, start, guests)
+        caching.invalidate_user_bookings(user_id)
+    transaction.on_commit(update)
+
+    previous = getattr(instance, '_summary_previous', None)
+    if previous != (table_id, start, guests):
+        if previous is not None:
+            summaries.booking_removed(*previous)
+        summaries.booking_added(table_id, start, guests)
+    # A moved or smaller booking may make room. The job is part of this
+    # transaction, so it only exists if the change is committed.
+    if previous is not None and waitlist.frees_room(previous, (table_id, start, guests)):
+        waitlist.request_promotion()
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    booking_id, user_id = instance.pk, instance.user_id
+
+    def update():
+        availability.index.booking_deleted(booking_id)
+        capacity.index.booking_deleted(booking_id)
+        caching.invalidate_user_bookings(user_id)
+    transaction.on_commit(update)
+    summaries.booking_removed(instance.table_id, instance.date_time, instance.guests)
+    waitlist.request_promotion()
+
+
+@receiver(post_save, sender=Table)
+def table_saved(sender, instance, **kwargs):
+    table_id, table_number, seats = instance.pk, instance.table_number, instance.capacity
+
+    def update():
+        availability.index.table_saved(table_id, table_number, seats)
+        capacity.index.table_changed()
+        catalogue.invalidate()
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Table)
+def table_deleted(sender, instance, **kwargs):
+    table_id = instance.pk
+
+    def update():
+        availability.index.table_deleted(table_id)
+        capacity.index.table_changed()
+        catalogue.invalidate()
+    transaction.on_commit(update)
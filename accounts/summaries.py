@@ -0,0 +1,118 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedBooking, Booking, DailyTableSummary
+
+
+# Maintenance of DailyTableSummary. Every change runs in the transaction of
+# the booking change behind it, so the summary commits or rolls back with it.
+
+
+def _key(table_id, when):
+    return timezone.localdate(when), table_id
+
+
+# Add `bookings` and `guests` (either may be negative) to the summary row of
+# a day and table
+def _adjust(date, table_id, bookings, guests):
+    rows = DailyTableSummary.objects.filter(date=date, table_id=table_id)
+    if rows.update(bookings=F('bookings') + bookings, guests=F('guests') + guests):
+        if bookings < 0:
+            rows.filter(bookings__lte=0).delete()
+        return
+    if bookings <= 0:
+        return  # Nothing to take away from, e.g. the table is being deleted
+    try:
+        with transaction.atomic():
+            DailyTableSummary.objects.create(date=date, table_id=table_id, bookings=bookings, guests=guests)
+    except IntegrityError:
+        # Created by a concurrent transaction since the update above
+        rows.update(bookings=F('bookings') + bookings, guests=F('guests') + guests)
+
+
+def booking_added(table_id, when, guests):
+    _adjust(*_key(table_id, when), 1, guests)
+
+
+def booking_removed(table_id, when, guests):
+    _adjust(*_key(table_id, when), -1, -guests)
+
+
+# Count bookings saved without signals, e.g. by bulk_create, with one
+# update per day and table
+def bookings_added(bookings, sign=1):
+    counts, guests = Counter(), Counter()
+    for booking in bookings:
+        key = _key(booking.table_id, booking.date_time)
+        counts[key] += 1
+        guests[key] += booking.guests
+    for (date, table_id), count in counts.items():
+        _adjust(date, table_id, sign * count, sign * guests[(date, table_id)])
+
+
+# Uncount bookings changed or deleted without signals
+def bookings_removed(bookings):
+    bookings_added(bookings, sign=-1)
+
+
+# Bookings and guests per day and table, computed from the live and
+# archived bookings
+def aggregate():
+    totals = {}
+    for model in (Booking, ArchivedBooking):
+        rows = (
+            model.objects
+            .filter(table__isnull=False)
+            .annotate(date=TruncDate('date_time'))
+            .values('date', 'table_id')
+            .annotate(bookings=Count('id'), guests=Sum('guests'))
+            .order_by()
+        )
+        for row in rows:
+            key = (row['date'], row['table_id'])
+            bookings, guests = totals.get(key, (0, 0))
+            totals[key] = (bookings + row['bookings'], guests + row['guests'])
+    return dict(totals)
+
+
+def rebuild(batch_size=5000):
+    with transaction.atomic():
+        DailyTableSummary.objects.all().delete()
+        DailyTableSummary.objects.bulk_create(
+            (
+                DailyTableSummary(date=date, table_id=table_id, bookings=bookings, guests=guests)
+                for (date, table_id), (bookings, guests) in aggregate().items()
+            ),
+            batch_size=batch_size,
+        )
+
+
+# Differences between the summary and the bookings, as
+# {(date, table id): (summary (bookings, guests), actual (bookings, guests))}
+def verify():
+    stored = {
+        (date, table_id): (bookings, guests)
+        for date, table_id, bookings, guests
+        in DailyTableSummary.objects.values_list('date', 'table_id', 'bookings', 'guests')
+    }
+    actual = aggregate()
+    return {
+        key: (stored.get(key, (0, 0)), actual.get(key, (0, 0)))
+        for key in stored.keys() | actual.keys()
+        if stored.get(key, (0, 0)) != actual.get(key, (0, 0))
+    }
+
+
+# Totals per day between two dates (inclusive), optionally for one table:
+# [{'date': ..., 'bookings': ..., 'guests': ...}]
+def daily(start, end, table_id=None):
+    rows = DailyTableSummary.objects.filter(date__gte=start, date__lte=end)
+    if table_id is not None:
+        rows = rows.filter(table_id=table_id)
+    return list(
+        rows.values('date').annotate(bookings=Sum('bookings'), guests=Sum('guests')).order_by('date')
+    )
@@ -1,3 +1,1613 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import QuerySet
+from django.template import engines
+from django.template.response import SimpleTemplateResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PROJECTFOURBOOKING import dbpool, staticfiles
+
+from . import (
+    archive, assignment, async_views, availability, backends, batch, benchmarks, bulk, caching, capacity, catalogue,
+    checks, hashers, jobs, middleware, provisioning, reservations, seeding, sessions, summaries, views, waitlist,
+)
+from .models import ArchivedBooking, Booking, DailyTableSummary, Job, Table, User, WaitlistEntry
+from .pagination import EstimatedCountPaginator
+from .querycount import assert_max_queries
+
+
+class AvailabilityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.tables = [Table.objects.create(table_number=n, capacity=c) for n, c in ((1, 2), (2, 4), (3, 6))]
+        cls.when = timezone.make_aware(datetime(2030, 1, 1, 19))
+
+    def setUp(self):
+        cache.clear()
+        availability.index.invalidate()
+        self.booking = Booking.objects.create(user=self.user, table=self.tables[1], date_time=self.when, guests=4)
+
+    def tearDown(self):
+        availability.index.invalidate()
+        catalogue.invalidate()
+
+    def free(self, guests, when, exclude=None):
+        return [number for _, number, _ in availability.free_tables(guests, when, exclude)]
+
+    def test_free_tables_skip_overlapping_bookings_smallest_first(self):
+        duration = availability.BOOKING_DURATION
+        self.assertEqual(self.free(2, self.when), [1, 3])
+        self.assertEqual(self.free(2, self.when - duration + timedelta(minutes=1)), [1, 3])
+        self.assertEqual(self.free(2, self.when + duration), [1, 2, 3])
+        self.assertEqual(self.free(2, self.when - duration), [1, 2, 3])
+        self.assertEqual(self.free(4, self.when, exclude=self.booking.pk), [2, 3])
+        self.assertFalse(availability.is_table_free(self.tables[1], self.when))
+
+    def test_signals_keep_the_index_in_step(self):
+        self.assertEqual(self.free(2, self.when), [1, 3])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(user=self.user, table=self.tables[0], date_time=self.when, guests=2)
+        self.assertEqual(self.free(2, self.when), [3])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.date_time += timedelta(days=1)
+            booking.save()
+        self.assertEqual(self.free(2, self.when), [1, 3])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.delete()
+        self.assertEqual(self.free(2, self.when), [1, 2, 3])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_booking_views_reject_overlaps(self):
+        self.client.force_login(self.user, backend='accounts.backends.EmailBackend')
+        when = self.when.strftime('%Y-%m-%d %H:%M:%S')
+        response = self.client.post(
+            reverse('create_view'), {'table': self.tables[1].pk, 'date_time': when, 'guests': 2},
+        )
+        self.assertFormError(
+            response, 'form', 'table', 'This table is already booked at that time, but table 1 is free.',
+        )
+        self.assertEqual(Booking.objects.count(), 1)
+
+        # A booking may keep its own slot, but not move onto another's
+        response = self.client.post(
+            reverse('update_view', args=[self.booking.pk]),
+            {'table': self.tables[1].pk, 'date_time': when, 'guests': 3},
+        )
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        other = Booking.objects.create(
+            user=self.user, table=self.tables[2], date_time=self.when + timedelta(days=1), guests=2,
+        )
+        response = self.client.post(
+            reverse('update_view', args=[other.pk]), {'table': self.tables[1].pk, 'date_time': when, 'guests': 2},
+        )
+        self.assertFormError(response, 'form', 'date_time', 'This table is already booked at that time.')
+        other.refresh_from_db()
+        self.assertEqual(other.table, self.tables[2])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('table_availability'), {'guests': 3, 'date_time': '2030-01-01T19:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([table['table_number'] for table in response.json()['tables']], [3])
+
+        for params in (
+            {'guests': 'two', 'date_time': '2030-01-01T19:00'},
+            {'guests': 2},
+            {'guests': 2, 'date_time': 'tonight'},
+            {'guests': 2, 'date_time': '2030-02-30T19:00'},  # Well formed, but no such day
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('table_availability'), params).status_code, 400)
+
+
+class ReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.table = Table.objects.create(table_number=1, capacity=4)
+        cls.when = timezone.make_aware(datetime(2030, 1, 1, 19))
+        cls.booking = Booking.objects.create(user=cls.user, table=cls.table, date_time=cls.when, guests=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        catalogue.invalidate()
+
+    def new_booking(self, when):
+        return Booking(user=self.user, table=self.table, date_time=when, guests=2)
+
+    def test_reserve_rejects_overlaps_and_allows_back_to_back(self):
+        booking = self.new_booking(self.when + timedelta(hours=1))
+        with self.assertRaises(reservations.BookingConflict):
+            reservations.reserve(booking)
+        self.assertIsNone(booking.pk)
+        reservations.reserve(self.new_booking(self.when - availability.BOOKING_DURATION))
+        reservations.reserve(self.new_booking(self.when + availability.BOOKING_DURATION))
+        self.assertEqual(Booking.objects.count(), 3)
+
+        # Saving a booking again doesn't clash with itself
+        self.booking.guests = 3
+        reservations.reserve(self.booking)
+
+    def test_overlaps_missed_by_the_check_are_caught_by_the_database(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'No overlap constraint on {connection.vendor}')
+        booking = self.new_booking(self.when + timedelta(hours=1))
+        with mock.patch.object(reservations, 'BOOKING_DURATION', timedelta(0)):
+            with self.assertRaises(reservations.BookingConflict):
+                reservations.reserve(booking)
+        self.assertIsNone(booking.pk)
+        self.assertTrue(booking._state.adding)
+
+    def test_database_rejects_overlapping_inserts_and_updates(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'No overlap constraint on {connection.vendor}')
+        with self.assertRaisesMessage(IntegrityError, reservations.OVERLAP_CONSTRAINT):
+            with transaction.atomic():
+                Booking.objects.create(user=self.user, table=self.table, date_time=self.when, guests=2)
+        later = Booking.objects.create(
+            user=self.user, table=self.table, date_time=self.when + availability.BOOKING_DURATION, guests=2,
+        )
+        with self.assertRaisesMessage(IntegrityError, reservations.OVERLAP_CONSTRAINT):
+            with transaction.atomic():
+                Booking.objects.filter(pk=later.pk).update(date_time=self.when + timedelta(minutes=90))
+        # Within half a second of the range the trigger seeks
+        with self.assertRaisesMessage(IntegrityError, reservations.OVERLAP_CONSTRAINT):
+            with transaction.atomic():
+                Booking.objects.create(
+                    user=self.user, table=self.table, guests=2,
+                    date_time=self.when - availability.BOOKING_DURATION + timedelta(milliseconds=500),
+                )
+        # Other tables and other columns are not affected
+        other = Table.objects.create(table_number=2, capacity=4)
+        Booking.objects.create(user=self.user, table=other, date_time=self.when, guests=2)
+        Booking.objects.filter(pk=later.pk).update(guests=4)
+
+    def test_lock_timeouts_are_retried(self):
+        booking = self.new_booking(self.when + timedelta(days=1))
+        save = Booking.save
+        calls = []
+
+        def locked_once(instance, *args, **kwargs):
+            calls.append(instance.pk)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return save(instance, *args, **kwargs)
+
+        with mock.patch.object(Booking, 'save', locked_once), mock.patch.object(reservations, '_backoff') as backoff:
+            reservations.reserve(booking)
+        self.assertEqual(len(calls), 2)
+        backoff.assert_called_once_with(0)
+        self.assertTrue(Booking.objects.filter(pk=booking.pk).exists())
+
+        with mock.patch.object(Booking, 'save', side_effect=OperationalError('no such table')):
+            with self.assertRaises(OperationalError):
+                reservations.reserve(self.new_booking(self.when + timedelta(days=2)))
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        tables = [Table.objects.create(table_number=n, capacity=4) for n in (1, 2, 3)]
+        start = timezone.make_aware(datetime(2030, 1, 1, 12))
+        # Three bookings share every start time, so pages split ties
+        Booking.objects.bulk_create(
+            Booking(user=cls.user, table=tables[i % 3], date_time=start + timedelta(days=i // 3), guests=2)
+            for i in range(20)
+        )
+        cls.expected = list(Booking.objects.order_by('-date_time', '-id').values_list('pk', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        catalogue.invalidate()
+
+    def page(self, cursor=None):
+        view = views.BookingListView()
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        request.user = self.user
+        view.setup(request)
+        view.object_list = view.get_queryset()
+        page = view.get_context_data()['page_obj']
+        return [booking.pk for booking in page], page
+
+    def test_cursors_walk_every_row_once_both_ways(self):
+        pages, cursor = [], None
+        while True:
+            ids, page = self.page(cursor)
+            pages.append((ids, page))
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([pk for ids, _ in pages for pk in ids], self.expected)
+        self.assertEqual([len(ids) for ids, _ in pages], [8, 8, 4])
+        self.assertFalse(pages[0][1].has_previous())
+
+        ids, page = self.page(pages[-1][1].previous_cursor)
+        self.assertEqual(ids, pages[1][0])
+        ids, page = self.page(page.previous_cursor)
+        self.assertEqual(ids, pages[0][0])
+        self.assertFalse(page.has_previous())
+
+    def test_tampered_cursors_fall_back_to_the_first_page(self):
+        first, page = self.page()
+        cursor = page.next_cursor
+        for bad in (cursor[:-2] + ('A' if cursor[-1] != 'A' else 'B'), 'garbage', signing.dumps([False, [1]])):
+            with self.subTest(cursor=bad):
+                self.assertEqual(self.page(bad)[0], first)
+        # A cursor for another keyset, signed with the same salt
+        other = signing.dumps([False, [1]], salt=views.BookingListView.cursor_salt, compress=True)
+        self.assertEqual(self.page(other)[0], first)
+
+
+# Plan lines that mean a whole table is read. SQLite reports "SCAN <table>",
+# also when it walks a whole index to get an ordering, Postgres "Seq Scan".
+SEQ_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)'),
+    'postgresql': re.compile(r'\bSeq Scan\b'),
+}
+
+
+# Run EXPLAIN on every query the hot paths issue and fail when one of them
+# falls back to a sequential scan, e.g. because an index was dropped
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        other = User.objects.create(email='other@example.com', first_name='An', last_name='Other')
+        cls.tables = [Table.objects.create(table_number=n, capacity=2 + n % 4) for n in range(1, 11)]
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        Booking.objects.bulk_create(
+            Booking(
+                user=cls.user if i % 2 else other,
+                table=cls.tables[i % 10],
+                date_time=start + timedelta(hours=3 * (i // 10)),
+                guests=2,
+            )
+            for i in range(200)
+        )
+        cls.booking = Booking.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        if connection.vendor == 'postgresql':
+            # The test tables are tiny, so make Postgres use any usable index
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertIndexedPlans(self, queries):
+        pattern = SEQ_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'No plan check for {connection.vendor}')
+        self.assertTrue(queries)
+        for query in queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(connection.ops.explain_query_prefix() + ' ' + query['sql'])
+                plan = '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+            self.assertIsNone(pattern.search(plan), f'Sequential scan in\n{query["sql"]}\n{plan}')
+
+    # Run a list view's queryset and pagination without rendering the template
+    def list_queries(self, view_class, **params):
+        view = view_class()
+        request = self.factory.get('/', params)
+        request.user = self.user
+        view.setup(request)
+        with CaptureQueriesContext(connection) as ctx:
+            view.object_list = view.get_queryset()
+            context = view.get_context_data()
+        return ctx.captured_queries, context
+
+    def detail_queries(self, view_class, pk):
+        view = view_class()
+        request = self.factory.get('/')
+        request.user = self.user
+        view.setup(request, pk=pk)
+        with CaptureQueriesContext(connection) as ctx:
+            view.get_object()
+        return ctx.captured_queries
+
+    def test_booking_list(self):
+        queries, context = self.list_queries(views.BookingListView)
+        self.assertIndexedPlans(queries)
+        queries, _ = self.list_queries(views.BookingListView, cursor=context['page_obj'].next_cursor)
+        self.assertIndexedPlans(queries)
+
+    # The first page is a LIMITed primary key walk, later pages seek on the key
+    def test_user_list_pages(self):
+        cursor = views.UserListView()._encode_cursor(False, self.user)
+        queries, _ = self.list_queries(views.UserListView, cursor=cursor)
+        self.assertIndexedPlans(queries)
+
+    def test_detail_views(self):
+        self.assertIndexedPlans(self.detail_queries(views.BookingDetailView, self.booking.pk))
+        self.assertIndexedPlans(self.detail_queries(views.UserDetailView, self.user.pk))
+
+    def test_reservation_overlap_check(self):
+        booking = Booking(
+            user=self.user, table=self.tables[0],
+            date_time=self.booking.date_time + timedelta(days=365), guests=2,
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            reservations.reserve(booking)
+        self.assertIndexedPlans(ctx.captured_queries)
+
+    def test_availability_rebuild(self):
+        with CaptureQueriesContext(connection) as ctx:
+            availability.AvailabilityIndex().rebuild()
+        # Loading the (small) table catalogue is a scan by design
+        self.assertIndexedPlans([q for q in ctx.captured_queries if 'accounts_booking' in q['sql']])
+
+    def test_table_number_lookup(self):
+        with CaptureQueriesContext(connection) as ctx:
+            Table.objects.get(table_number=3)
+        self.assertIndexedPlans(ctx.captured_queries)
+
+
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for n in range(1, 11):
+            table = Table.objects.create(table_number=n, capacity=4)
+            Booking.objects.create(user=cls.user, table=table, date_time=start, guests=2)
+
+    def setUp(self):
+        cache.clear()
+
+    # Listing a page of bookings and printing them is a single query
+    def test_booking_list_has_no_per_row_queries(self):
+        view = views.BookingListView()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view.setup(request)
+        with assert_max_queries(1):
+            view.object_list = view.get_queryset()
+            context = view.get_context_data()
+            rows = [str(booking) for booking in context['bookings']]
+        self.assertEqual(len(rows), 8)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_booking_admin_changelist(self):
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        with assert_max_queries(8):
+            response = self.client.get(reverse('admin:accounts_booking_changelist'))
+        self.assertContains(response, 'guest@example.com')
+
+
+class BookingListCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.table = Table.objects.create(table_number=1, capacity=4)
+        cls.start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        Booking.objects.create(user=cls.user, table=cls.table, date_time=cls.start, guests=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def booking_list(self):
+        view = views.BookingListView()
+        request = RequestFactory().get('/')
+        request.user = self.user
+        view.setup(request)
+        view.object_list = view.get_queryset()
+        return view.get_context_data()['bookings']
+
+    def test_second_hit_is_served_from_cache(self):
+        self.booking_list()
+        with assert_max_queries(0):
+            self.assertEqual(len(self.booking_list()), 1)
+
+    def test_saving_a_booking_invalidates_the_users_list(self):
+        self.booking_list()
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(
+                user=self.user, table=self.table, date_time=self.start + timedelta(days=1), guests=3,
+            )
+        self.assertEqual(len(self.booking_list()), 2)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_database_caches_dont_cache_pages(self):
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared):
+            self.assertFalse(caching.pages_cached())
+        self.assertTrue(caching.pages_cached())
+
+        self.client.force_login(self.user, backend='accounts.backends.EmailBackend')
+        with mock.patch.object(caching, 'pages_cached', return_value=False), \
+                mock.patch.object(views.cache, 'get') as get:
+            response = self.client.get(reverse('home'))
+        get.assert_not_called()
+        self.assertIsNone(response.context['booking_list_key'])
+        self.assertContains(response, 'Table 1 for 2 guests')
+
+    def test_per_process_caches_fail_the_system_checks(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem, ALLOW_PROCESS_LOCAL_CACHE=False):
+            self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['accounts.E001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared, ALLOW_PROCESS_LOCAL_CACHE=False):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class TableCatalogueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tables = [Table.objects.create(table_number=n, capacity=n) for n in range(1, 21)]
+
+    def setUp(self):
+        cache.clear()
+
+    def table_list(self, **params):
+        view = views.TableListView()
+        view.setup(RequestFactory().get('/', params))
+        view.object_list = view.get_queryset()
+        return view.get_context_data()
+
+    def test_lookups_are_served_from_the_snapshot(self):
+        catalogue.snapshot()
+        with assert_max_queries(0):
+            self.assertEqual(catalogue.snapshot().by_number(7).capacity, 7)
+            context = self.table_list()
+            self.assertEqual([t.table_number for t in context['tables']], list(range(1, 9)))
+            context = self.table_list(cursor=context['page_obj'].next_cursor)
+            self.assertEqual([t.table_number for t in context['tables']], list(range(9, 17)))
+            context = self.table_list(cursor=context['page_obj'].previous_cursor)
+            self.assertEqual([t.table_number for t in context['tables']], list(range(1, 9)))
+
+    def test_changes_reload_the_snapshot(self):
+        catalogue.snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tables[0].capacity = 12
+            self.tables[0].save()
+        self.assertEqual(catalogue.snapshot().get(self.tables[0].pk).capacity, 12)
+
+    def test_version_change_from_another_worker_is_picked_up(self):
+        catalogue.snapshot()
+        Table.objects.filter(table_number=1).update(capacity=9)
+        caching.invalidate_tables()
+        with mock.patch.object(catalogue, 'CHECK_INTERVAL', 0):
+            self.assertEqual(catalogue.snapshot().by_number(1).capacity, 9)
+
+    def test_snapshots_are_reloaded_once_too_old(self):
+        catalogue.invalidate()
+        version = catalogue.snapshot().version
+        # A change whose version bump was lost
+        Table.objects.filter(table_number=1).update(capacity=9)
+        with mock.patch.object(catalogue, 'CHECK_INTERVAL', 0):
+            self.assertEqual(catalogue.snapshot().by_number(1).capacity, 1)
+            with mock.patch.object(catalogue, 'MAX_AGE', -1):
+                self.assertEqual(catalogue.snapshot().by_number(1).capacity, 9)
+        self.assertNotEqual(catalogue.snapshot().version, version)
+        self.assertEqual(caching.tables_version(), catalogue.snapshot().version)
+
+
+class BulkImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        Table.objects.create(table_number=1, capacity=4)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_import_rejects_bad_rows_and_round_trips(self):
+        source = io.StringIO(
+            'user,table,date_time,guests\n'
+            'guest@example.com,1,2030-01-01T18:00,2\n'
+            'guest@example.com,1,2030-01-01T19:00,2\n'  # Overlaps the first row
+            'guest@example.com,1,2030-01-01T20:00,6\n'  # Too many guests
+            'nobody@example.com,1,2030-01-02T18:00,2\n'
+            'guest@example.com,1,2030-01-01T20:00,4\n'
+        )
+        results = list(bulk.import_bookings(bulk.read_rows(source, 'csv'), chunk_size=2))
+        self.assertEqual(sum(created for _, created, _ in results), 2)
+        errors = [error for _, _, rejects in results for _, error in rejects]
+        self.assertEqual(errors, [
+            'table already booked at that time',
+            'table 1 seats at most 4 guests',
+            'unknown user',
+        ])
+        exported = list(bulk.export_bookings())
+        self.assertEqual([row['guests'] for row in exported], [2, 4])
+
+    def test_malformed_json_lines_are_rejected_not_fatal(self):
+        source = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        self.addCleanup(os.remove, source.name)
+        with source:
+            source.write(
+                '{"user": "guest@example.com", "table": 1, "date_time": "2030-01-01T18:00", "guests": 2}\n'
+                '{"user": "guest@example.com", "table": 1,\n'
+                '\n'
+                '[1, 2]\n'
+                '{"user": "guest@example.com", "table": 1, "date_time": "2030-01-01T20:00", "guests": 2}\n'
+            )
+        rejects = source.name + '.rejects.jsonl'
+        self.addCleanup(os.remove, rejects)
+        call_command('import_bookings', source.name, stdout=io.StringIO())
+
+        self.assertEqual(Booking.objects.count(), 2)
+        with open(rejects) as handle:
+            rows = [json.loads(line) for line in handle]
+        self.assertEqual(rows, [
+            {'line': '{"user": "guest@example.com", "table": 1,', 'error': 'line 2 is not valid JSON'},
+            {'line': '[1, 2]', 'error': 'line 4 is not a JSON object'},
+        ])
+
+
+class BookingExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.tables = [Table.objects.create(table_number=n, capacity=4) for n in (1, 2)]
+        for day in (1, 2, 3):
+            for table in cls.tables:
+                Booking.objects.create(
+                    user=cls.user, table=table, guests=2,
+                    date_time=timezone.make_aware(datetime(2030, 1, day, 19)),
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_requires_staff(self):
+        self.client.force_login(get_user_model().objects.create_user('someone', password='pw'))
+        self.assertEqual(self.client.get(reverse('booking_export')).status_code, 403)
+
+    def test_streams_filtered_rows(self):
+        self.client.force_login(get_user_model().objects.create_user('staff', password='pw', is_staff=True))
+        response = self.client.get(reverse('booking_export'), {'start': '2030-01-02', 'end': '2030-01-03', 'table': 2})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'user,table,date_time,guests')
+        self.assertEqual(lines[1:], [
+            'guest@example.com,2,2030-01-02T19:00:00+00:00,2',
+            'guest@example.com,2,2030-01-03T19:00:00+00:00,2',
+        ])
+
+    def test_rejects_bad_dates(self):
+        self.client.force_login(get_user_model().objects.create_user('staff', password='pw', is_staff=True))
+        self.assertEqual(self.client.get(reverse('booking_export'), {'start': '2030-13-01'}).status_code, 400)
+
+
+# The async views query from a thread pool, which can't see the data of a
+# TestCase transaction, hence TransactionTestCase
+class AsyncApiTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        Table.objects.create(table_number=1, capacity=2)
+        Table.objects.create(table_number=2, capacity=6)
+        self.factory = RequestFactory()
+
+    def call(self, view, request):
+        request.user = self.user
+        return async_to_sync(view)(request)
+
+    def test_create_then_list_and_check_availability(self):
+        body = json.dumps({'table': 2, 'guests': 4, 'date_time': '2030-01-01T19:00'})
+        request = self.factory.post('/', body, content_type='application/json')
+        response = self.call(async_views.booking_create, request)
+        self.assertEqual(response.status_code, 201)
+        response = self.call(async_views.booking_create, self.factory.post('/', body, content_type='application/json'))
+        self.assertEqual(response.status_code, 409)
+
+        response = self.call(async_views.booking_list, self.factory.get('/'))
+        self.assertEqual([b['table'] for b in json.loads(response.content)['bookings']], [2])
+
+        availability.index.invalidate()
+        request = self.factory.get('/', {'guests': 2, 'date_time': '2030-01-01T20:00'})
+        response = self.call(async_views.table_availability, request)
+        self.assertEqual([t['table_number'] for t in json.loads(response.content)['tables']], [1])
+
+    def test_requires_login(self):
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        self.assertEqual(async_to_sync(async_views.booking_list)(request).status_code, 401)
+
+    def test_staff_accounts_have_no_bookings(self):
+        self.user = get_user_model().objects.create(username='staff', is_staff=True)
+        self.assertEqual(self.call(async_views.booking_list, self.factory.get('/')).status_code, 403)
+        body = json.dumps({'table': 2, 'guests': 4, 'date_time': '2030-01-01T19:00'})
+        request = self.factory.post('/', body, content_type='application/json')
+        self.assertEqual(self.call(async_views.booking_create, request).status_code, 403)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_rejects_impossible_dates(self):
+        request = self.factory.get('/', {'guests': 2, 'date_time': '2030-02-30T19:00'})
+        self.assertEqual(self.call(async_views.table_availability, request).status_code, 400)
+        for date_time in ('2030-02-30T19:00', 1893524400):
+            body = json.dumps({'table': 2, 'guests': 4, 'date_time': date_time})
+            request = self.factory.post('/', body, content_type='application/json')
+            self.assertEqual(self.call(async_views.booking_create, request).status_code, 400)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    class FakeConnection:
+        def __init__(self):
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    def make_pool(self, **options):
+        return dbpool.ConnectionPool(self.FakeConnection, **options)
+
+    def test_reuses_returned_connections(self):
+        pool = self.make_pool(max_size=2)
+        first = pool.get()
+        pool.put(first)
+        self.assertIs(pool.get(), first)
+        self.assertEqual((pool.stats.hits, pool.stats.misses), (1, 1))
+
+    def test_close_all_closes_idle_connections(self):
+        alias = 'close-all-test'
+        self.addCleanup(dbpool._stats.pop, alias, None)
+        self.addCleanup(dbpool._pools.pop, alias, None)
+        pool = dbpool.pool_for(alias, self.FakeConnection, max_size=2)
+        idle, busy = pool.get(), pool.get()
+        pool.put(idle)
+        dbpool.close_all()
+        self.assertEqual((idle.closed, busy.closed), (True, False))
+        self.assertEqual(pool.as_dict()['idle'], 0)
+
+    def test_close_all_leaves_a_parents_pools_alone(self):
+        alias = 'close-all-fork-test'
+        self.addCleanup(dbpool._stats.pop, alias, None)
+        self.addCleanup(dbpool._pools.pop, alias, None)
+        pool = dbpool.pool_for(alias, self.FakeConnection, max_size=1)
+        idle = pool.get()
+        pool.put(idle)
+        with mock.patch('os.getpid', return_value=pool.pid + 1):
+            dbpool.close_all()
+        self.assertFalse(idle.closed)
+        self.assertEqual(pool.as_dict()['idle'], 1)
+
+    def test_waits_then_times_out_when_full(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        pool.get()
+        with self.assertRaises(dbpool.PoolTimeout):
+            pool.get()
+        self.assertEqual((pool.stats.waits, pool.stats.timeouts), (1, 1))
+
+    def test_drops_broken_and_expired_connections(self):
+        pool = self.make_pool(max_size=1, max_lifetime=60)
+        broken = pool.get()
+        pool.put(broken)
+        fresh = pool.get(check=lambda connection: False)
+        self.assertIsNot(fresh, broken)
+        self.assertTrue(broken.closed)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 120):
+            pool.put(fresh)
+        self.assertTrue(fresh.closed)
+        self.assertEqual(pool.as_dict()['size'], 0)
+        self.assertEqual((pool.stats.broken, pool.stats.expired), (1, 1))
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        seeding.seed(users=3, tables=2, bookings=10)
+
+    # The seeded tables are rolled back, but not the process-local snapshot
+    def tearDown(self):
+        catalogue.invalidate()
+        availability.index.invalidate()
+
+    def test_runs_every_flow_without_errors(self):
+        results = benchmarks.run_in_process(requests=3)
+        self.assertEqual(
+            set(results), {'booking_list', 'booking_create', 'table_list', 'admin_booking_changelist'},
+        )
+        for name, row in results.items():
+            self.assertEqual(row['errors'], 0, name)
+            self.assertEqual(row['requests'], 3)
+        self.assertEqual(Booking.objects.count(), 13)
+
+    def test_flags_regressions(self):
+        before = {'in_process': {'booking_list': {'p95_ms': 10.0, 'throughput_rps': 100.0, 'queries_per_request': 2}}}
+        now = {'in_process': {'booking_list': {'p95_ms': 11.0, 'throughput_rps': 95.0, 'queries_per_request': 2}}}
+        self.assertEqual(benchmarks.regressions(now, before), [])
+        now['in_process']['booking_list'].update(p95_ms=15.0, queries_per_request=3)
+        self.assertEqual(len(benchmarks.regressions(now, before)), 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PerformanceMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Table.objects.create(table_number=1, capacity=4)
+
+    def setUp(self):
+        cache.clear()
+        catalogue.invalidate()
+        availability.index.invalidate()
+
+    def test_reports_sql_and_template_time(self):
+        self.client.force_login(get_user_model().objects.create(username='staff', is_staff=True))
+        with self.assertLogs('accounts.performance', 'INFO') as logs:
+            response = self.client.get(
+                reverse('table_availability'), {'guests': 2, 'date_time': '2030-01-01T18:00'},
+            )
+        timing = dict(
+            part.split(';', 1)[0:2] for part in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timing), {'sql', 'tpl', 'app', 'total'})
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['path'], reverse('table_availability'))
+        self.assertGreater(record['sql_count'], 0)
+        self.assertIn(f'desc="{record["sql_count"]} queries"', timing['sql'])
+        self.assertLessEqual(len(record['slowest_queries']), middleware.SLOW_QUERY_COUNT)
+        self.assertGreaterEqual(record['total_ms'], record['sql_ms'] + record['template_ms'] - 0.02)
+
+    def test_template_time_covers_template_responses(self):
+        with self.assertLogs('accounts.performance', 'INFO') as logs:
+            self.client.get(reverse('table-list'))
+        self.assertGreater(json.loads(logs.records[-1].getMessage())['template_ms'], 0)
+
+    def test_anonymous_clients_get_no_server_timing(self):
+        response = self.client.get(reverse('table_availability'), {'guests': 2, 'date_time': '2030-01-01T18:00'})
+        self.assertNotIn('Server-Timing', response)
+
+    def test_sql_run_while_rendering_is_not_template_time(self):
+        timer = middleware.SqlTimer()
+        request = RequestFactory().get('/')
+        request._template_seconds = 0.0
+        request._sql_timer = timer
+        template = engines['django'].from_string('{{ rows }}')
+        response = SimpleTemplateResponse(
+            template, {'rows': lambda: timer(lambda *args: time.sleep(0.05), 'SELECT 1', (), False, {})},
+        )
+        middleware.PerformanceMiddleware(None).process_template_response(request, response).render()
+        self.assertGreaterEqual(timer.seconds, 0.05)
+        self.assertLess(request._template_seconds, 0.05)
+
+    def test_keeps_the_slowest_queries(self):
+        timer = middleware.SqlTimer()
+        for n, seconds in enumerate([0.001, 0.005, 0.002, 0.004, 0.003]):
+            clock = iter([0.0, seconds])
+            with mock.patch('accounts.middleware.time.perf_counter', lambda: next(clock)):
+                timer(lambda *args: None, f'SELECT {n}', (), False, {})
+        self.assertEqual(timer.count, 5)
+        self.assertEqual(sorted(sql for _, sql in timer.slowest), ['SELECT 1', 'SELECT 3', 'SELECT 4'])
+
+
+class CapacityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.tables = [Table.objects.create(table_number=n, capacity=2 * n) for n in range(1, 4)]
+
+    def setUp(self):
+        cache.clear()
+        capacity.index.invalidate()
+        self.today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.bookings = [
+            Booking.objects.create(
+                user=self.user, table=table, guests=1,
+                date_time=self.today + timedelta(days=day, hours=18, minutes=10 * n),
+            )
+            for n, table in enumerate(self.tables) for day in (1, 3)
+        ]
+
+    def tearDown(self):
+        capacity.index.invalidate()
+
+    # Free seats per slot, slot by slot from the database
+    def brute_force(self, days):
+        seats = sum(table.capacity for table in self.tables)
+        free = []
+        for n in range(days * capacity.SLOTS_PER_DAY):
+            start = self.today + capacity.SLOT * n
+            busy = Table.objects.filter(
+                booking__date_time__gt=start - availability.BOOKING_DURATION,
+                booking__date_time__lt=start + capacity.SLOT,
+            ).distinct()
+            free.append(seats - sum(table.capacity for table in busy))
+        return free
+
+    def test_matrix_matches_the_bookings(self):
+        grid = capacity.grid(days=4)
+        self.assertEqual(grid['slot_minutes'], 15)
+        self.assertEqual(grid['total_seats'], 12)
+        self.assertEqual(len(grid['free_seats']), 4 * capacity.SLOTS_PER_DAY)
+        self.assertEqual(grid['free_seats'], self.brute_force(days=4))
+        # 18:30 on day one: every table is taken, one guest at each
+        slot = capacity.SLOTS_PER_DAY + 18 * 4 + 2
+        self.assertEqual((grid['free_tables'][slot], grid['guests'][slot]), (0, 3))
+
+    def test_booking_changes_update_the_matrix_in_place(self):
+        capacity.grid()
+        booking = self.bookings[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.date_time += timedelta(days=1)
+            booking.save()
+            self.bookings[1].delete()
+        with assert_max_queries(0):
+            grid = capacity.grid(days=4)
+        self.assertEqual(grid['free_seats'], self.brute_force(days=4))
+
+    def test_staff_endpoint(self):
+        staff = get_user_model().objects.create(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        start = (self.today + timedelta(days=1)).date()
+        response = self.client.get(reverse('capacity'), {'date': start.isoformat(), 'days': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['free_seats']), capacity.SLOTS_PER_DAY)
+        self.assertEqual(
+            self.client.get(reverse('capacity'), {'date': 'tomorrow'}).status_code, 400,
+        )
+
+
+class TableAssignmentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        # Tables 1-4 stand in a row, table 10 on its own
+        cls.tables = {
+            number: Table.objects.create(table_number=number, capacity=capacity)
+            for number, capacity in [(1, 2), (2, 4), (3, 4), (4, 6), (10, 6)]
+        }
+        cls.when = timezone.make_aware(datetime(2030, 1, 1, 19))
+
+    def setUp(self):
+        cache.clear()
+        availability.index.invalidate()
+
+    def rows(self):
+        return [(table.pk, number, table.capacity) for number, table in self.tables.items()]
+
+    def numbers(self, option):
+        pks = {table.pk: number for number, table in self.tables.items()}
+        return [pks[pk] for pk in option]
+
+    def test_options_prefer_the_smallest_fit_then_adjacent_tables(self):
+        self.assertEqual(self.numbers(assignment.options(self.rows(), 3)[0]), [2])
+        self.assertEqual(self.numbers(assignment.options(self.rows(), 6)[0]), [4])
+        self.assertEqual(
+            [self.numbers(option) for option in assignment.options(self.rows(), 8)],
+            [[2, 3], [3, 4], [1, 2, 3]],
+        )
+        self.assertEqual(assignment.options(self.rows(), 20), [])
+
+    def test_best_fit_skips_booked_tables(self):
+        Booking.objects.create(user=self.user, table=self.tables[4], date_time=self.when, guests=2)
+        Booking.objects.create(user=self.user, table=self.tables[10], date_time=self.when, guests=2)
+        best = assignment.best_fit(6, self.when + timedelta(hours=1))
+        self.assertEqual([number for _, number, _ in best], [1, 2])
+        best = assignment.best_fit(6, self.when + timedelta(hours=2))
+        self.assertEqual([number for _, number, _ in best], [4])
+
+    def test_plan_makes_room_by_moving_a_party(self):
+        # Two tables of six, the second booked later in the evening
+        planner = assignment.Planner(
+            [(1, 1, 6), (2, 2, 6)], [(2, self.when + timedelta(hours=2, minutes=30))],
+        )
+        requests = [
+            assignment.Request('a', 6, self.when),
+            # Only table 1 is free for b, once a moves to table 2
+            assignment.Request('b', 6, self.when + timedelta(hours=1)),
+        ]
+        self.assertEqual(planner.plan(requests, budget=0), {'a': (1,), 'b': None})
+        self.assertEqual(planner.plan(requests), {'a': (2,), 'b': (1,)})
+
+    def test_staff_endpoint(self):
+        self.client.force_login(get_user_model().objects.create(username='staff', is_staff=True))
+        response = self.client.get(
+            reverse('table_assignment'), {'guests': 7, 'date_time': self.when.isoformat()},
+        )
+        self.assertEqual([table['table_number'] for table in response.json()['tables']], [2, 3])
+        self.assertFalse(response.json()['bookable'])
+        response = self.client.get(
+            reverse('table_assignment'), {'guests': 5, 'date_time': self.when.isoformat()},
+        )
+        self.assertEqual([table['table_number'] for table in response.json()['tables']], [4])
+        self.assertTrue(response.json()['bookable'])
+        response = self.client.get(reverse('table_assignment'), {'guests': 7, 'date_time': '2030-02-30T19:00'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_waitlist_plan_seats_parties_around_the_bookings(self):
+        Booking.objects.create(user=self.user, table=self.tables[4], date_time=self.when, guests=2)
+        waiting = [
+            WaitlistEntry.objects.create(user=self.user, date_time=self.when, guests=guests)
+            for guests in (6, 10)
+        ]
+        WaitlistEntry.objects.create(
+            user=self.user, date_time=self.when + timedelta(days=1), guests=2,
+        )
+        self.client.force_login(get_user_model().objects.create(username='staff', is_staff=True))
+        response = self.client.get(reverse('waitlist_plan'), {'date': '2030-01-01'})
+        parties = {party['id']: party for party in response.json()['parties']}
+        self.assertEqual(parties.keys(), {entry.pk for entry in waiting})
+        self.assertEqual([table['table_number'] for table in parties[waiting[0].pk]['tables']], [10])
+        self.assertTrue(parties[waiting[0].pk]['bookable'])
+        self.assertEqual([table['table_number'] for table in parties[waiting[1].pk]['tables']], [1, 2, 3])
+        self.assertFalse(parties[waiting[1].pk]['bookable'])
+        self.assertEqual(self.client.get(reverse('waitlist_plan'), {'date': '2030-02-30'}).status_code, 400)
+
+
+# The worker closes stale connections between jobs, which would end the
+# test's transaction
+@mock.patch('accounts.jobs.close_old_connections', lambda: None)
+class WaitlistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(email=f'guest{n}@example.com', first_name='A', last_name=str(n))
+            for n in range(3)
+        ]
+        cls.table = Table.objects.create(table_number=1, capacity=4)
+        cls.when = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+    def setUp(self):
+        cache.clear()
+        availability.index.invalidate()
+        self.booking = Booking.objects.create(user=self.users[0], table=self.table, date_time=self.when, guests=2)
+
+    def test_create_joins_the_waitlist_when_no_table_is_free(self):
+        self.client.force_login(self.users[1], backend='accounts.backends.EmailBackend')
+        response = self.client.post(reverse('create_view'), {
+            'table': self.table.pk, 'date_time': timezone.localtime(self.when).strftime('%Y-%m-%d %H:%M:%S'),
+            'guests': 3,
+        })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        entry = WaitlistEntry.objects.get()
+        self.assertEqual((entry.user, entry.date_time, entry.guests), (self.users[1], self.when, 3))
+
+    def test_freed_table_goes_to_the_first_in_the_queue(self):
+        late = waitlist.join(self.users[1], self.when, 2)
+        early_small = waitlist.join(self.users[2], self.when, 2)
+        early_large = waitlist.join(self.users[2], self.when + timedelta(minutes=30), 4)
+        requested = timezone.now() - timedelta(hours=1)
+        WaitlistEntry.objects.filter(pk__in=[early_small.pk, early_large.pk]).update(requested_at=requested)
+
+        self.booking.delete()
+        waitlist.request_promotion()  # Coalesced with the delete's job
+        self.assertEqual(Job.objects.filter(kind=waitlist.PROMOTE).count(), 1)
+        self.assertEqual(jobs.work(burst=True), 1)
+
+        statuses = dict(WaitlistEntry.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            early_large.pk: WaitlistEntry.PROMOTED,
+            early_small.pk: WaitlistEntry.WAITING,
+            late.pk: WaitlistEntry.WAITING,
+        })
+        booking = WaitlistEntry.objects.get(pk=early_large.pk).booking
+        self.assertEqual((booking.table, booking.guests), (self.table, 4))
+        self.assertFalse(Job.objects.exists())
+
+    def test_only_updates_that_make_room_queue_a_promotion(self):
+        waitlist.join(self.users[1], self.when, 2)
+        self.booking.guests = 3
+        self.booking.save()
+        self.assertFalse(Job.objects.filter(kind=waitlist.PROMOTE).exists())
+        self.booking.guests = 1
+        self.booking.save()
+        self.assertEqual(Job.objects.filter(kind=waitlist.PROMOTE).count(), 1)
+        Job.objects.all().delete()
+        self.booking.date_time += timedelta(hours=3)
+        self.booking.save()
+        self.assertEqual(Job.objects.filter(kind=waitlist.PROMOTE).count(), 1)
+
+    def test_joining_twice_keeps_one_entry(self):
+        first = waitlist.join(self.users[1], self.when, 3)
+        self.assertEqual(waitlist.join(self.users[1], self.when, 3), first)
+        waitlist.join(self.users[1], self.when, 2)
+        self.assertEqual(WaitlistEntry.objects.count(), 2)
+
+        # Once promoted, the party may wait for the same sitting again
+        WaitlistEntry.objects.filter(pk=first.pk).update(status=WaitlistEntry.PROMOTED)
+        self.assertNotEqual(waitlist.join(self.users[1], self.when, 3), first)
+
+    def test_promotion_sees_tables_freed_by_other_processes(self):
+        entry = waitlist.join(self.users[1], self.when, 2)
+        self.assertEqual(availability.free_tables(2, self.when), [])
+        # Deleted by another worker: this process's index isn't told
+        Booking.objects.filter(pk=self.booking.pk)._raw_delete(connection.alias)
+
+        waitlist.promote()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, WaitlistEntry.PROMOTED)
+        self.assertEqual(entry.booking.table, self.table)
+
+    def test_failing_jobs_are_retried_then_kept(self):
+        job = jobs.enqueue('explode')
+        with mock.patch.dict(jobs.handlers, explode=mock.Mock(side_effect=ValueError('boom'))):
+            for attempt in range(jobs.MAX_ATTEMPTS):
+                Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                with self.assertLogs('accounts.jobs', 'ERROR'):
+                    self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, jobs.MAX_ATTEMPTS))
+        self.assertIn('boom', job.last_error)
+        self.assertIsNone(jobs.claim())
+
+    def test_jobs_of_dead_workers_are_reclaimed(self):
+        job = jobs.enqueue('noop')
+        self.assertEqual(jobs.claim().pk, job.pk)
+        self.assertIsNone(jobs.claim())
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=jobs.LEASE + 1))
+        self.assertEqual(jobs.claim().attempts, 2)
+
+
+class DailySummaryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.tables = [Table.objects.create(table_number=n, capacity=6) for n in (1, 2)]
+        cls.day = timezone.make_aware(datetime(2030, 1, 1, 12))
+
+    def setUp(self):
+        cache.clear()
+
+    def book(self, table, hours, guests=2):
+        return Booking.objects.create(
+            user=self.user, table=table, date_time=self.day + timedelta(hours=hours), guests=guests,
+        )
+
+    def rows(self):
+        return set(DailyTableSummary.objects.values_list('date', 'table__table_number', 'bookings', 'guests'))
+
+    def test_saves_and_deletes_keep_the_summary_in_step(self):
+        first = self.book(self.tables[0], 0)
+        self.book(self.tables[0], 3, guests=4)
+        moving = self.book(self.tables[1], 0)
+        day = self.day.date()
+        self.assertEqual(self.rows(), {(day, 1, 2, 6), (day, 2, 1, 2)})
+
+        moving.date_time += timedelta(days=1)
+        moving.guests = 5
+        moving.save()
+        first.delete()
+        self.assertEqual(self.rows(), {(day, 1, 1, 4), (day + timedelta(days=1), 2, 1, 5)})
+        self.assertEqual(summaries.verify(), {})
+
+    def test_bulk_import_and_rebuild(self):
+        source = io.StringIO(
+            'user,table,date_time,guests\n'
+            'guest@example.com,1,2030-01-01T18:00,2\n'
+            'guest@example.com,2,2030-01-01T18:00,3\n'
+        )
+        list(bulk.import_bookings(bulk.read_rows(source, 'csv')))
+        self.assertEqual(summaries.verify(), {})
+        DailyTableSummary.objects.update(guests=0)
+        with self.assertRaises(CommandError):
+            call_command('summarize_bookings', verify=True, stdout=io.StringIO())
+        call_command('summarize_bookings', stdout=io.StringIO())
+        self.assertEqual(summaries.verify(), {})
+        self.assertEqual(
+            summaries.daily(self.day.date(), self.day.date()),
+            [{'date': self.day.date(), 'bookings': 2, 'guests': 5}],
+        )
+
+    def test_staff_endpoint_takes_a_table_number(self):
+        self.addCleanup(catalogue.invalidate)
+        with self.captureOnCommitCallbacks(execute=True):
+            table = Table.objects.create(table_number=9, capacity=6)
+        self.book(self.tables[0], 0)
+        self.book(table, 0, guests=4)
+        self.client.force_login(get_user_model().objects.create(username='staff', is_staff=True))
+        url = reverse('booking_summary')
+        params = {'start': '2030-01-01', 'end': '2030-01-01'}
+
+        response = self.client.get(url, {**params, 'table': 9})
+        self.assertEqual(response.json()['days'], [{'date': '2030-01-01', 'bookings': 1, 'guests': 4}])
+        response = self.client.get(url, params)
+        self.assertEqual(response.json()['days'], [{'date': '2030-01-01', 'bookings': 2, 'guests': 6}])
+        self.assertEqual(self.client.get(url, {**params, 'table': 5}).status_code, 404)
+        self.assertEqual(self.client.get(url, {**params, 'table': 'nine'}).status_code, 400)
+
+
+class ArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        cls.table = Table.objects.create(table_number=1, capacity=6)
+        cls.now = timezone.now().replace(microsecond=0)
+        cls.old = [
+            Booking.objects.create(
+                user=cls.user, table=cls.table, date_time=cls.now - timedelta(days=400 + n), guests=2,
+            )
+            for n in range(5)
+        ]
+        cls.recent = Booking.objects.create(
+            user=cls.user, table=cls.table, date_time=cls.now - timedelta(days=3), guests=2,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_moves_old_bookings_in_batches(self):
+        self.assertEqual(list(archive.archive(batch_size=2)), [2, 4, 5])
+        self.assertEqual(list(Booking.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(
+            set(ArchivedBooking.objects.values_list('pk', 'table_number')),
+            {(booking.pk, 1) for booking in self.old},
+        )
+        self.assertEqual(summaries.verify(), {})
+        # Nothing left to do on the next run
+        self.assertEqual(list(archive.archive()), [])
+
+    def test_resumes_after_a_partial_copy(self):
+        ArchivedBooking.objects.create(
+            id=self.old[0].pk, user=self.user, table=self.table, table_number=1,
+            date_time=self.old[0].date_time, guests=self.old[0].guests,
+        )
+        call_command('archive_bookings', days=30, stdout=io.StringIO())
+        self.assertEqual(ArchivedBooking.objects.count(), 5)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @mock.patch.object(views.BookingHistoryView, 'paginate_by', 2)
+    def test_history_pages_across_live_and_archived_bookings(self):
+        list(archive.archive(batch_size=2))
+        self.client.force_login(self.user, backend='accounts.backends.EmailBackend')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('booking_history'), {'cursor': cursor} if cursor else {})
+            data = response.json()
+            seen += [(booking['id'], booking['archived']) for booking in data['bookings']]
+            cursor = data['next']
+            if cursor is None:
+                break
+        expected = [(self.recent.pk, False)] + [(booking.pk, True) for booking in self.old]
+        self.assertEqual(seen, expected)
+        previous = self.client.get(reverse('booking_history'), {'cursor': data['previous']}).json()
+        self.assertEqual([booking['id'] for booking in previous['bookings']], [self.old[1].pk, self.old[2].pk])
+
+    def test_staff_have_no_history(self):
+        self.client.force_login(get_user_model().objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('booking_history')).status_code, 403)
+
+
+class ProvisioningTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(email='taken@example.com', first_name='A', last_name='Guest')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_creates_users_and_reports_duplicates(self):
+        source = io.StringIO(
+            'email,first_name,last_name,password\n'
+            'one@example.com,One,User,secret-1\n'
+            'taken@example.com,Taken,User,secret-2\n'
+            'two@EXAMPLE.com,Two,User,\n'
+            'one@example.com,One,Again,secret-3\n'  # Duplicate in the file, in a later chunk
+            'not-an-email,Bad,User,secret-4\n'
+        )
+        results = list(provisioning.provision_users(bulk.read_rows(source, 'csv'), chunk_size=3, workers=2))
+        self.assertEqual(sum(created for _, created, _ in results), 2)
+        errors = [error for _, _, rejects in results for _, error in rejects]
+        self.assertEqual(errors, [
+            'email already registered', 'duplicate email in file', 'email must be a valid email address',
+        ])
+        self.assertTrue(User.objects.get(email='one@example.com').check_password('secret-1'))
+        self.assertFalse(User.objects.get(email='two@example.com').has_usable_password())
+
+    def test_concurrent_signup_only_rejects_the_duplicate(self):
+        accepted, rejects = provisioning.validate_chunk([
+            {'email': 'late@example.com', 'first_name': 'Late', 'last_name': 'User'},
+            {'email': 'new@example.com', 'first_name': 'New', 'last_name': 'User'},
+        ], set())
+        self.assertEqual(rejects, [])
+        User.objects.create(email='late@example.com', first_name='Signed', last_name='Up')
+        created, rejects = provisioning.insert_users(accepted, batch_size=100)
+        self.assertEqual((created, [error for _, error in rejects]), (1, ['email already registered']))
+        self.assertEqual(User.objects.filter(email='new@example.com').count(), 1)
+
+    def test_malformed_json_lines_are_rejected(self):
+        source = io.StringIO('{"email": "one@example.com", "first_name": "One", "last_name": "User"}\n"one"\n')
+        results = list(provisioning.provision_users(bulk.read_rows(source, 'jsonl'), chunk_size=10, workers=1))
+        self.assertEqual([error for _, _, rejects in results for _, error in rejects], ['line 2 is not a JSON object'])
+        self.assertTrue(User.objects.filter(email='one@example.com').exists())
+
+    def test_non_string_passwords_are_rejected(self):
+        source = io.StringIO(
+            '{"email": "one@example.com", "first_name": "One", "last_name": "User", "password": "secret-1"}\n'
+            '{"email": "two@example.com", "first_name": "Two", "last_name": "User", "password": 12345}\n'
+            '{"email": "three@example.com", "first_name": "Three", "last_name": "User", "password": null}\n'
+        )
+        results = list(provisioning.provision_users(bulk.read_rows(source, 'jsonl'), chunk_size=10, workers=1))
+        self.assertEqual([error for _, _, rejects in results for _, error in rejects], ['password must be a string'])
+        self.assertEqual(
+            set(User.objects.values_list('email', flat=True)),
+            {'taken@example.com', 'one@example.com', 'three@example.com'},
+        )
+
+
+class LoginTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('guest@example.com', 'secret-pw')
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().post('/')
+
+    def authenticate(self, password='secret-pw'):
+        return backends.EmailBackend().authenticate(self.request, email='guest@example.com', password=password)
+
+    def test_checks_the_password(self):
+        self.assertEqual(self.authenticate(), self.user)
+        self.assertIsNone(self.authenticate('wrong'))
+        User.objects.filter(pk=self.user.pk).update(password=make_password('new-pw'))
+        self.assertIsNone(self.authenticate())
+        self.assertEqual(self.authenticate('new-pw'), self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(self.authenticate('new-pw'))
+
+    def test_login_upgrades_hashes_made_with_other_costs(self):
+        cheap = hashers.PBKDF2PasswordHasher()
+        cheap.iterations = 1000
+        User.objects.filter(pk=self.user.pk).update(password=cheap.encode('secret-pw', cheap.salt()))
+        self.assertEqual(self.authenticate(), self.user)
+        algorithm, iterations, *_ = User.objects.get(pk=self.user.pk).password.split('$')
+        self.assertEqual((algorithm, int(iterations)), ('pbkdf2_sha256', hashers.PBKDF2PasswordHasher.iterations))
+
+    def test_benchmark_reports_each_configuration(self):
+        out = io.StringIO()
+        call_command('benchmark_logins', pbkdf2_iterations=[1000, 2000], seconds=0.01, stdout=out)
+        self.assertIn('iterations=1000', out.getvalue())
+        self.assertIn('iterations=2000', out.getvalue())
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_customer_credentials_dont_log_in_to_the_admin(self):
+        response = self.client.post(
+            reverse('admin:login'), {'username': 'guest@example.com', 'password': 'secret-pw'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class StaticPipelineTests(SimpleTestCase):
+
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        self.addCleanup(root.cleanup)
+        self.source, self.root = source.name, root.name
+        os.makedirs(os.path.join(self.source, 'css'))
+        with open(os.path.join(self.source, 'css', 'site.css'), 'w') as handle:
+            handle.write('/* Layout */\nbody {\n    margin: 0;\n}\n\n' * 50 + 'a :hover { content: "a  ;  b"; }\n')
+
+    def collect(self):
+        with override_settings(
+            STATICFILES_STORAGE='PROJECTFOURBOOKING.staticfiles.CompressedManifestStaticFilesStorage',
+            STATICFILES_DIRS=[self.source], STATIC_ROOT=self.root,
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.root, 'staticfiles.json')) as handle:
+            return json.load(handle)['paths']['css/site.css']
+
+    def get(self, app, path, **headers):
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'], response['headers'] = status, dict(response_headers)
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, **headers}
+        response['body'] = b''.join(app(environ, start_response))
+        return response
+
+    def test_minify_css_keeps_strings_and_selector_spaces(self):
+        self.assertEqual(
+            staticfiles.minify_css('/* x */ a :hover ,\n b {\n  content: "  ;  " ;\n}\n'),
+            'a :hover,b{content: "  ;  ";}',
+        )
+
+    def test_collects_minified_compressed_files_and_serves_them(self):
+        hashed = self.collect()
+        with open(os.path.join(self.root, hashed)) as handle:
+            minified = handle.read()
+        self.assertTrue(minified.startswith('body{margin: 0;}body{'))
+        self.assertTrue(os.path.exists(os.path.join(self.root, hashed + '.gz')))
+
+        app = staticfiles.StaticFilesApplication(lambda environ, start_response: [b'django'], self.root, '/static/')
+        response = self.get(app, '/static/' + hashed, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(response['headers']['Cache-Control'], staticfiles.IMMUTABLE)
+        self.assertEqual(gzip.decompress(response['body']).decode(), minified)
+        revalidated = self.get(
+            app, '/static/' + hashed, HTTP_IF_MODIFIED_SINCE=response['headers']['Last-Modified'],
+        )
+        self.assertEqual(revalidated['status'], '304 Not Modified')
+
+        response = self.get(app, '/static/css/site.css')
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertEqual(response['headers']['Cache-Control'], staticfiles.REVALIDATE)
+        self.assertEqual(self.get(app, '/static/../settings.py')['body'], b'django')
+
+
+class SessionStoreTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    # Statements that write the session row
+    def writes(self, queries):
+        return sum(query['sql'].startswith(('UPDATE', 'INSERT')) for query in queries.captured_queries)
+
+    def test_unchanged_sessions_are_written_to_the_database_once_per_interval(self):
+        session = sessions.SessionStore()
+        session['cart'] = 1
+        session.create()
+        key = session.session_key
+
+        session = sessions.SessionStore(key)
+        with self.assertNumQueries(0):
+            self.assertEqual(session['cart'], 1)
+            session.save()  # Only the expiry would change
+        with CaptureQueriesContext(connection) as queries:
+            with mock.patch.object(sessions.time, 'time', return_value=time.time() + sessions.WRITE_INTERVAL):
+                session.save()
+            session['cart'] = 2
+            session.save()
+        self.assertEqual(self.writes(queries), 2)
+
+        # The database has the latest data once the cache forgets it
+        cache.clear()
+        self.assertEqual(sessions.SessionStore(key)['cart'], 2)
+
+    def test_logout_removes_the_cached_session(self):
+        session = sessions.SessionStore()
+        session['cart'] = 1
+        session.create()
+        key = session.session_key
+        session.flush()
+        self.assertFalse(session.exists(key))
+        self.assertNotIn('cart', sessions.SessionStore(key).load())
+
+    def test_cached_modes_are_refused_on_a_database_cache(self):
+        database = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        for engine, expected in (('accounts.sessions', ['accounts.E002']), ('django.contrib.sessions.backends.db', [])):
+            with self.subTest(engine=engine), override_settings(CACHES=database, SESSION_ENGINE=engine):
+                self.assertEqual([error.id for error in checks.check_session_cache(None)], expected)
+        with override_settings(SESSION_ENGINE='accounts.sessions'):
+            self.assertEqual(checks.check_session_cache(None), [])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        User.objects.create(email='other@example.com', first_name='An', last_name='Other')
+        table = Table.objects.create(table_number=1, capacity=4)
+        Booking.objects.create(user=cls.user, table=table, date_time=timezone.now(), guests=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def test_estimates_only_unfiltered_counts(self):
+        with mock.patch('accounts.pagination.estimated_count', return_value=10 ** 7):
+            self.assertEqual(EstimatedCountPaginator(Booking.objects.all(), 100).count, 10 ** 7)
+            self.assertEqual(EstimatedCountPaginator(Booking.objects.filter(guests=2), 100).count, 1)
+        # No estimate outside Postgres
+        self.assertEqual(EstimatedCountPaginator(Booking.objects.all(), 100).count, 1)
+
+    def test_changelist_drills_down_by_date_without_a_full_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:accounts_booking_changelist'), {'date_time__year': timezone.now().year},
+            )
+        self.assertContains(response, 'guest@example.com')
+        counts = [query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('WHERE', counts[0])
+
+    def test_booking_user_is_an_autocomplete(self):
+        response = self.client.get(reverse('admin:accounts_booking_add'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, 'other@example.com')
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'gue', 'app_label': 'accounts', 'model_name': 'booking', 'field_name': 'user',
+        })
+        self.assertEqual([result['text'] for result in response.json()['results']], ['guest@example.com'])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        other = User.objects.create(email='other@example.com', first_name='An', last_name='Other')
+        cls.table = Table.objects.create(table_number=1, capacity=4)
+        when = timezone.now() + timedelta(days=1)
+        cls.booking = Booking.objects.create(user=cls.user, table=cls.table, date_time=when, guests=2)
+        cls.others = Booking.objects.create(
+            user=other, table=cls.table, date_time=when + availability.BOOKING_DURATION, guests=2,
+        )
+
+    def setUp(self):
+        cache.clear()
+        catalogue.invalidate()
+
+    # The tables are rolled back, but not the process-local snapshot
+    def tearDown(self):
+        catalogue.invalidate()
+
+    def test_table_pages_revalidate_without_queries(self):
+        for url in (reverse('table-list'), reverse('table-detail', args=[self.table.pk])):
+            response = self.client.get(url)
+            self.assertIn('no-cache', response['Cache-Control'])
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304,
+                )
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+            )
+
+        etag = self.client.get(reverse('table-list'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Table.objects.create(table_number=2, capacity=2)
+        self.assertEqual(self.client.get(reverse('table-list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_booking_detail_revalidates_with_one_lookup(self):
+        self.client.force_login(self.user, backend='accounts.backends.EmailBackend')
+        url = reverse('booking_detail', args=[self.booking.pk])
+        etag = self.client.get(url)['ETag']
+        # Session, user and the booking's columns
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Booking.objects.filter(pk=self.booking.pk).update(guests=3)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('booking_detail', args=[self.others.pk])).status_code, 404)
+
+    # The navigation bar changes on login, so the ETag has to as well
+    def test_etag_depends_on_the_viewer(self):
+        url = reverse('table-list')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.user, backend='accounts.backends.EmailBackend')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# Thread pool queries again, see AsyncApiTests
+class BookingBatchApiTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        catalogue.invalidate()
+        availability.index.invalidate()
+        self.user = User.objects.create(email='guest@example.com', first_name='A', last_name='Guest')
+        other = User.objects.create(email='other@example.com', first_name='An', last_name='Other')
+        tables = [Table.objects.create(table_number=n, capacity=6) for n in (1, 2)]
+        self.at = lambda hour, minute=0: timezone.make_aware(datetime(2030, 1, 1, hour, minute))
+        self.first = Booking.objects.create(user=self.user, table=tables[0], date_time=self.at(19), guests=2)
+        self.second = Booking.objects.create(user=self.user, table=tables[1], date_time=self.at(19), guests=2)
+        self.others = Booking.objects.create(user=other, table=tables[0], date_time=self.at(12), guests=2)
+
+    def tearDown(self):
+        catalogue.invalidate()
+        availability.index.invalidate()
+
+    def post(self, operations, **options):
+        request = RequestFactory().post(
+            '/', json.dumps({'operations': operations, **options}), content_type='application/json',
+        )
+        request.user = self.user
+        response = async_to_sync(async_views.booking_batch)(request)
+        return response.status_code, json.loads(response.content)
+
+    def operations(self):
+        return [
+            {'op': 'delete', 'id': self.first.pk},
+            # Fits in the slot the delete frees
+            {'op': 'create', 'table': 1, 'date_time': '2030-01-01T19:30', 'guests': 4},
+            {'op': 'update', 'id': self.second.pk, 'guests': 5},
+            {'op': 'create', 'table': 2, 'date_time': '2030-01-01T20:00', 'guests': 2},  # Clashes
+            {'op': 'update', 'id': self.others.pk, 'guests': 3},  # Not the user's
+            {'op': 'create', 'table': 1, 'date_time': '2030-01-02T19:00', 'guests': 7},  # Too many
+        ]
+
+    def test_atomic_batch_applies_nothing_when_an_operation_fails(self):
+        status, body = self.post(self.operations())
+        self.assertEqual(status, 400)
+        self.assertFalse(body['applied'])
+        self.assertEqual([result['status'] for result in body['results']], ['skipped'] * 3 + ['error'] * 3)
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def free_at_nine(self):
+        return [number for _, number, _ in availability.free_tables(2, self.at(21))]
+
+    def test_applies_the_valid_operations_in_one_go(self):
+        self.assertEqual(self.free_at_nine(), [1, 2])
+        with assert_max_queries(16):
+            status, body = self.post(self.operations(), atomic=False)
+        self.assertEqual(status, 200)
+        self.assertEqual([result['status'] for result in body['results']], [
+            'deleted', 'created', 'updated', 'error', 'error', 'error',
+        ])
+        self.assertEqual([result.get('error') for result in body['results'][3:]], [
+            'table already booked at that time', 'booking not found', 'table 1 seats 1 to 6 guests',
+        ])
+        created = body['results'][1]['booking']
+        self.assertEqual(
+            Booking.objects.filter(pk=created['id']).values_list('table__table_number', 'guests').get(), (1, 4),
+        )
+        self.assertFalse(Booking.objects.filter(pk=self.first.pk).exists())
+        self.assertEqual(Booking.objects.get(pk=self.second.pk).guests, 5)
+        self.assertEqual(summaries.verify(), {})
+        self.assertEqual(self.free_at_nine(), [2])  # The new booking holds table 1 until 21:30
+
+    def test_locks_tables_before_bookings(self):
+        locked = []
+        select_for_update = QuerySet.select_for_update
+
+        def record(queryset, *args, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'select_for_update', record):
+            self.assertEqual(self.post([{'op': 'update', 'id': self.second.pk, 'guests': 3}])[0], 200)
+        self.assertEqual(locked[:2], [Table, Booking])
+
+    def test_deadlocks_are_conflicts(self):
+        with mock.patch.object(batch, '_write', side_effect=OperationalError('database is locked')):
+            self.assertEqual(self.post([{'op': 'update', 'id': self.second.pk, 'guests': 3}])[0], 409)
+        self.assertEqual(Booking.objects.get(pk=self.second.pk).guests, 2)
+
+    def test_rejects_malformed_batches(self):
+        self.assertEqual(self.post('create')[0], 400)
+        with mock.patch.object(batch, 'MAX_OPERATIONS', 1):
+            self.assertEqual(self.post([{'op': 'delete', 'id': 1}] * 2)[0], 400)
+        status, body = self.post([{'op': 'create', 'table': 1}, {'op': 'move', 'id': 1}])
+        self.assertEqual([result['error'] for result in body['results']], [
+            'create needs table, date_time and guests', 'op must be create, update or delete',
+        ])
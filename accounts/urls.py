@@ -1,9 +1,27 @@
-from . import views
+from . import async_views, views
 from django.urls import path
 
 
 urlpatterns = [
     path('/', views.BookingListView.as_view(), name='home'),
+    path('/history', views.BookingHistoryView.as_view(), name='booking_history'),
+    path('/export', views.BookingExportView.as_view(), name='booking_export'),
+    path('/bookings/<int:pk>', views.BookingDetailView.as_view(), name='booking_detail'),
     path('/create', views.BookingCreateView.as_view(), name='create_view'),
-    path('/booking_edit/<id:id>', views.BookingUpdateView().as_view(), name='update_view'),
+    path('/booking_edit/<int:pk>', views.BookingUpdateView.as_view(), name='update_view'),
+    path('/tables', views.TableListView.as_view(), name='table-list'),
+    path('/tables/create', views.TableCreateView.as_view(), name='table-create'),
+    path('/tables/<int:pk>', views.TableDetailView.as_view(), name='table-detail'),
+    path('/tables/<int:pk>/edit', views.TableUpdateView.as_view(), name='table-update'),
+    path('/tables/<int:pk>/delete', views.TableDeleteView.as_view(), name='table-delete'),
+    path('/availability', views.TableAvailabilityView.as_view(), name='table_availability'),
+    path('/assign', views.TableAssignmentView.as_view(), name='table_assignment'),
+    path('/assign/waitlist', views.WaitlistPlanView.as_view(), name='waitlist_plan'),
+    path('/capacity', views.CapacityView.as_view(), name='capacity'),
+    path('/summary', views.BookingSummaryView.as_view(), name='booking_summary'),
+    path('/db_stats', views.DatabaseStatsView.as_view(), name='db_stats'),
+    path('/api/bookings', async_views.booking_list, name='api_booking_list'),
+    path('/api/bookings/create', async_views.booking_create, name='api_booking_create'),
+    path('/api/bookings/batch', async_views.booking_batch, name='api_booking_batch'),
+    path('/api/availability', async_views.table_availability, name='api_table_availability'),
 ]
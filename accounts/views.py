@@ -1,40 +1,232 @@
+import csv
+import hashlib
+import io
+from datetime import datetime, time, timedelta
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.decorators import login_required, permission_required  # Is this one necessary?
-from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
-
-from .models import Booking, Table, User
+from django.core.cache import cache
+from django.http import (
+    Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse,
+)
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date, quote_etag
+from django.views import View
+
+from PROJECTFOURBOOKING import dbpool
+
+from . import archive, assignment, availability, bulk, caching, capacity, catalogue, reservations, summaries, waitlist
+from .models import Booking, Table, User, WaitlistEntry
+from .pagination import KeysetPaginationMixin
+
+
+# Answer a GET with 304 Not Modified when the client's copy is still
+# current. get_validators() returns (etag, last modified timestamp), either
+# may be None, and must be cheap: a version stamp or an indexed lookup of a
+# few columns, not the objects the page renders. The navigation bar depends
+# on who is looking, so the viewer is part of the ETag, and responses are
+# private and always revalidated.
+class ConditionalGetMixin:
+
+    def get_validators(self):
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag is not None:
+            user = request.user
+            etag = quote_etag(hashlib.md5(f'{type(user).__name__}:{user.pk}:{etag}'.encode()).hexdigest())
+        if last_modified is not None:
+            last_modified = int(last_modified)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if etag is not None:
+            response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        if etag is not None or last_modified is not None:
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+# Validators for pages showing the table catalogue: its version stamp, which
+# is also the time of the last table change
+def catalogue_validators():
+    version = catalogue.snapshot().version
+    return f'tables:{version}', int(version) / 1e9
 
 
 # Views for Bookings model
 
 
 # List view to display all bookings made by a user
-class BookingListView(LoginRequiredMixin, ListView):
+class BookingListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Booking
     template_name = 'index.html'  # The template used to render the view
     context_object_name = 'bookings'  # The name of the variable to be used in the template
     paginate_by = 8
+    keyset = ('-date_time', '-id')  # Newest bookings first
+
+    query_budget = 4  # Session, user, bookings and one spare
 
     # Return the bookings for the currently logged in user
     def get_queryset(self):
-        return Booking.objects.filter(user=self.request.user)
+        return Booking.objects.with_related().filter(user=self.request.user)
+
+    # Serve the page from the per-user cache when the user's bookings haven't
+    # changed since it was stored, see accounts/caching.py
+    def paginate_queryset(self, queryset, page_size):
+        if not caching.pages_cached():
+            self.cache_key = None
+            return super().paginate_queryset(queryset, page_size)
+        self.cache_key = caching.booking_list_key(
+            self.request.user.pk, self.request.GET.get(self.cursor_kwarg, ''),
+        )
+        page = cache.get(self.cache_key)
+        if page is None:
+            page = super().paginate_queryset(queryset, page_size)
+            cache.set(self.cache_key, page, caching.BOOKING_LIST_TIMEOUT)
+        return page
+
+    # The template caches the rendered list under the same key, if any
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['booking_list_key'] = self.cache_key
+        context['booking_list_timeout'] = caching.BOOKING_LIST_TIMEOUT
+        return context
+
+
+# A user's bookings, live and archived, newest first, as JSON pages
+class BookingHistoryView(LoginRequiredMixin, archive.HistoryPaginationMixin, View):
+    paginate_by = 20
+
+    def get(self, request):
+        # Staff sign in as django.contrib.auth users, who have no bookings
+        if not isinstance(request.user, User):
+            return JsonResponse({'error': 'only customer accounts have bookings'}, status=403)
+        _, page, rows, _ = self.paginate_queryset(self.get_history(request.user), self.paginate_by)
+        return JsonResponse({
+            'bookings': [archive.history_json(booking) for booking in rows],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+
+# Stream bookings to staff as a CSV file, optionally filtered by
+# ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive) and ?table=<table number>.
+# Rows are fetched with a server-side iterator and sent in batches, so memory
+# use stays flat however many bookings match.
+class BookingExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    rows_per_chunk = 500
+
+    def test_func(self):
+        return getattr(self.request.user, 'is_staff', False)
+
+    def get(self, request):
+        queryset = Booking.objects.all()
+        try:
+            start = self.date_param('start')
+            end = self.date_param('end')
+        except ValueError:
+            return HttpResponseBadRequest('start and end must be dates (YYYY-MM-DD)')
+        # Compare against timestamps rather than __date so the date_time index is used
+        if start is not None:
+            queryset = queryset.filter(date_time__gte=timezone.make_aware(datetime.combine(start, time.min)))
+        if end is not None:
+            queryset = queryset.filter(
+                date_time__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+            )
+        if request.GET.get('table'):
+            try:
+                table = catalogue.snapshot().by_number(int(request.GET['table']))
+            except ValueError:
+                return HttpResponseBadRequest('table must be a table number')
+            if table is None:
+                raise Http404('No table with that number')
+            queryset = queryset.filter(table_id=table.id)
+
+        response = StreamingHttpResponse(self.stream(queryset), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="bookings.csv"'
+        return response
+
+    # Missing parameters are None, malformed ones raise ValueError
+    def date_param(self, name):
+        value = self.request.GET.get(name)
+        if not value:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise ValueError(name)
+        return parsed
+
+    def stream(self, queryset):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=bulk.BOOKING_FIELDS)
+        writer.writeheader()
+        rows = bulk.export_bookings(queryset, ordering=('date_time', 'id'))
+        for rows in bulk.chunked(rows, self.rows_per_chunk):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
 
 
 # Display details of a single booking
-class BookingDetailView(LoginRequiredMixin, DetailView):
+class BookingDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Booking
+    queryset = Booking.objects.with_related()
     template_name = 'bookings/booking_detail.html'
     context_object_name = 'bookings'
 
+    # Customers see their own bookings, staff everyone's
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self.request.user, 'is_staff', False):
+            return queryset
+        return queryset.filter(user_id=self.request.user.pk)
+
+    # The booking's own columns, by primary key, and the table catalogue
+    # (table numbers); the user's email doesn't change
+    def get_validators(self):
+        row = self.get_queryset().filter(pk=self.kwargs['pk']).values_list(
+            'user_id', 'table_id', 'date_time', 'guests',
+        ).first()
+        if row is None:
+            return None, None  # Let DetailView raise the 404
+        tables, _ = catalogue_validators()
+        return f'{row}:{tables}', None
+
+
+# Save bookings through the locking reservation path instead of form.save(),
+# so that two requests can never take the same table slot
+class ReservationMixin:
+
+    def form_valid(self, form):
+        try:
+            self.object = reservations.reserve(form.instance)
+        except reservations.BookingConflict:
+            return self.booking_conflict(form)
+        return HttpResponseRedirect(self.get_success_url())
+
+    def booking_conflict(self, form):
+        form.add_error('date_time', 'This table is already booked at that time.')
+        return self.form_invalid(form)
+
 
 # Create a new booking
-class BookingCreateView(LoginRequiredMixin, CreateView):
+class BookingCreateView(LoginRequiredMixin, ReservationMixin, CreateView):
     model = Booking
     fields = ['table', 'date_time', 'guests']  # Fields to be included in the form
-    success_url = reverse_lazy('booking_list')
+    success_url = reverse_lazy('home')
     template_name = 'bookings/booking_form.html'
 
     # Set the current user as the user for the new booking
@@ -42,39 +234,249 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
         form.instance.user = self.request.user
         return super().form_valid(form)
 
+    # Point to another free table, or when there is none put the party on
+    # the waitlist rather than have them retry until one frees up
+    def booking_conflict(self, form):
+        booking = form.instance
+        free = availability.free_tables(booking.guests, booking.date_time)
+        if free:
+            form.add_error(
+                'table', f'This table is already booked at that time, but table {free[0][1]} is free.',
+            )
+            return self.form_invalid(form)
+        waitlist.join(booking.user, booking.date_time, booking.guests)
+        messages.info(
+            self.request,
+            'No table is free at that time. You are on the waitlist and will be booked '
+            'as soon as one frees up.',
+        )
+        return HttpResponseRedirect(self.success_url)
+
 
 # Update an existing booking
-class BookingUpdateView(LoginRequiredMixin, UpdateView):
+class BookingUpdateView(LoginRequiredMixin, ReservationMixin, UpdateView):
     model = Booking
+    queryset = Booking.objects.with_related()
     fields = ['table', 'date_time', 'guests']
-    success_url = reverse_lazy('booking_list')
+    success_url = reverse_lazy('home')
     template_name = 'bookings/booking_form.html'
 
 
 # Delete an existing booking
 class BookingDeleteView(LoginRequiredMixin, DeleteView):
     model = Booking
-    success_url = reverse_lazy('booking_list')
+    queryset = Booking.objects.with_related()
+    success_url = reverse_lazy('home')
     template_name = 'bookings/booking_confirm_delete.html'
 
 
+# Read a party from the query string, ?guests=4&date_time=2023-05-01T19:00.
+# Returns (guests, when, None), or (None, None, a 400 response) when either
+# is malformed.
+def party_query(params):
+    try:
+        guests = int(params.get('guests', 1))
+    except ValueError:
+        return None, None, JsonResponse({'error': 'guests must be a number'}, status=400)
+    when = availability.parse_when(params.get('date_time', ''))
+    if when is None:
+        return None, None, JsonResponse({'error': 'date_time must be an ISO 8601 date and time'}, status=400)
+    return guests, when, None
+
+
+# Return the tables that can seat a party at a given time as JSON,
+# e.g. ?guests=4&date_time=2023-05-01T19:00
+class TableAvailabilityView(View):
+
+    def get(self, request):
+        guests, when, error = party_query(request.GET)
+        if error is not None:
+            return error
+
+        tables = [
+            {'id': pk, 'table_number': table_number, 'capacity': capacity}
+            for pk, table_number, capacity in availability.free_tables(guests, when)
+        ]
+        return JsonResponse({'guests': guests, 'date_time': when.isoformat(), 'tables': tables})
+
+
+# Tables suggested for one party, as JSON. A booking holds a single table, so
+# a run of adjacent tables isn't bookable as such: staff book one of them and
+# hold the others by hand.
+def seating_json(rows):
+    return {
+        'tables': [
+            {'id': pk, 'table_number': table_number, 'capacity': capacity}
+            for pk, table_number, capacity in rows
+        ],
+        'bookable': len(rows) == 1,
+    }
+
+
+# Best table, or adjacent tables, for a party: ?guests=10&date_time=...
+class TableAssignmentView(LoginRequiredMixin, UserPassesTestMixin, View):
+
+    def test_func(self):
+        return getattr(self.request.user, 'is_staff', False)
+
+    def get(self, request):
+        guests, when, error = party_query(request.GET)
+        if error is not None:
+            return error
+
+        seating = seating_json(assignment.best_fit(guests, when) or [])
+        return JsonResponse({'guests': guests, 'date_time': when.isoformat(), **seating})
+
+
+# Where the parties on the waitlist for a day could sit, planned together
+# around the bookings already taken: ?date=2030-01-01 (default: today). Only
+# a suggestion; nothing is booked. The promotion worker books single tables
+# as they free up, so parties it can't seat wait on for a run of tables.
+class WaitlistPlanView(LoginRequiredMixin, UserPassesTestMixin, View):
+
+    def test_func(self):
+        return getattr(self.request.user, 'is_staff', False)
+
+    def get(self, request):
+        day = timezone.localdate()
+        if request.GET.get('date'):
+            try:
+                day = parse_date(request.GET['date'])
+            except ValueError:
+                day = None
+            if day is None:
+                return JsonResponse({'error': 'date must be an ISO 8601 date'}, status=400)
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        entries = list(
+            WaitlistEntry.objects
+            .filter(status=WaitlistEntry.WAITING, date_time__gte=start, date_time__lt=start + timedelta(days=1))
+            .values_list('pk', 'guests', 'date_time')
+        )
+        plan, rows = {}, {}
+        if entries:
+            planner = assignment.Planner.for_window(
+                min(when for *_, when in entries), max(when for *_, when in entries),
+            )
+            plan = planner.plan([assignment.Request(pk, guests, when) for pk, guests, when in entries])
+            rows = {pk: (pk, number, capacity) for pk, (number, capacity) in planner.tables.items()}
+        parties = [
+            {
+                'id': pk, 'guests': guests, 'date_time': when.isoformat(),
+                **seating_json([rows[table_id] for table_id in plan[pk] or ()]),
+            }
+            for pk, guests, when in entries
+        ]
+        return JsonResponse({'date': day.isoformat(), 'parties': parties})
+
+
+# Free tables and seats in every slot of the capacity planner, for staff:
+# ?date=2030-01-01&days=7 (default: today to the end of the horizon)
+class CapacityView(LoginRequiredMixin, UserPassesTestMixin, View):
+
+    def test_func(self):
+        return getattr(self.request.user, 'is_staff', False)
+
+    def get(self, request):
+        start = days = None
+        try:
+            if request.GET.get('date'):
+                start = parse_date(request.GET['date'])
+                if start is None:
+                    raise ValueError
+                start = timezone.make_aware(datetime.combine(start, time.min))
+            if request.GET.get('days'):
+                days = int(request.GET['days'])
+        except ValueError:
+            return JsonResponse({'error': 'expected an ISO 8601 date and a number of days'}, status=400)
+        return JsonResponse(capacity.grid(start, days))
+
+
+# Bookings and guests per day from the daily summary, for staff:
+# ?start=2030-01-01&end=2030-01-31&table=3 (default: the next 30 days). Like
+# the export and the booking APIs, table is a table number.
+class BookingSummaryView(LoginRequiredMixin, UserPassesTestMixin, View):
+
+    def test_func(self):
+        return getattr(self.request.user, 'is_staff', False)
+
+    def get(self, request):
+        try:
+            start = parse_date(request.GET.get('start', '')) or timezone.localdate()
+            end = parse_date(request.GET.get('end', '')) or start + timedelta(days=30)
+            table_number = int(request.GET['table']) if request.GET.get('table') else None
+        except ValueError:
+            return JsonResponse({'error': 'expected ISO 8601 start and end dates and a table number'}, status=400)
+        table_id = None
+        if table_number is not None:
+            table = catalogue.snapshot().by_number(table_number)
+            if table is None:
+                return JsonResponse({'error': 'unknown table'}, status=404)
+            table_id = table.id
+        days = [
+            {'date': row['date'].isoformat(), 'bookings': row['bookings'], 'guests': row['guests']}
+            for row in summaries.daily(start, end, table_id)
+        ]
+        return JsonResponse({'start': start.isoformat(), 'end': end.isoformat(), 'days': days})
+
+
+# Database connection metrics of this worker process, for staff
+class DatabaseStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+
+    def test_func(self):
+        return getattr(self.request.user, 'is_staff', False)
+
+    def get(self, request):
+        return JsonResponse(dbpool.all_stats())
+
+
 #  Views for Table model
 
 
-# Display all tables
-class TableListView(ListView):
+# Display all tables, served from the process-local table catalogue
+class TableListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     model = Table
     context_object_name = 'tables'
     template_name = 'tables/table_list.html'
     paginate_by = 8
+    keyset = ('id',)
+
+    def get_queryset(self):
+        return catalogue.snapshot()
+
+    # Seek through the snapshot, which is already ordered by id
+    def seek_rows(self, snapshot, page_size, backwards, values):
+        records = snapshot.records
+        if backwards:
+            end = snapshot.index_before(values[0])
+            rows = records[max(0, end - page_size - 1):end]
+            more = len(rows) > page_size
+            return list(rows[-page_size:]), more
+        start = 0 if values is None else snapshot.index_after(values[0])
+        rows = records[start:start + page_size + 1]
+        return list(rows[:page_size]), len(rows) > page_size
+
+    # Pages differ by URL (?cursor=), so the catalogue version covers them all
+    def get_validators(self):
+        return catalogue_validators()
 
 
 # Display a specific table's details
-class TableDetailView(DetailView):
+class TableDetailView(ConditionalGetMixin, DetailView):
     model = Table
     context_object_name = 'table'
     template_name = 'tables/table_detail.html'
 
+    def get_validators(self):
+        if catalogue.snapshot().get(self.kwargs['pk']) is None:
+            return None, None
+        return catalogue_validators()
+
+    def get_object(self, queryset=None):
+        table = catalogue.snapshot().get(self.kwargs['pk'])
+        if table is None:
+            raise Http404('No table found matching the query')
+        return table
+
 
 # Create a new table
 class TableCreateView(LoginRequiredMixin, CreateView):
@@ -114,12 +516,13 @@ class TableDeleteView(LoginRequiredMixin, DeleteView):
 
 
 # Display a list of all User objects
-class UserListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class UserListView(LoginRequiredMixin, PermissionRequiredMixin, KeysetPaginationMixin, ListView):
     model = User
     context_object_name = 'users'
     template_name = 'users/user_list.html'
     permission_required = ('users.view_user')
     paginate_by = 8
+    keyset = ('id',)
 
 
 # Display the details of a single User
@@ -0,0 +1,83 @@
+import heapq
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import availability, jobs, reservations
+from .models import Booking, WaitlistEntry
+
+
+PROMOTE = 'promote_waitlist'
+
+
+# Put a party on the waitlist for a sitting at `when`. A party already
+# waiting for it keeps its entry, and its place in the queue.
+def join(user, when, guests):
+    entry, _ = WaitlistEntry.objects.get_or_create(
+        user=user, date_time=when, guests=guests, status=WaitlistEntry.WAITING,
+    )
+    return entry
+
+
+# Ask the worker to look for waiting parties that now fit. Called from the
+# booking signals inside the transaction that frees the table; one pending
+# job covers any number of changes.
+def request_promotion():
+    if WaitlistEntry.objects.filter(status=WaitlistEntry.WAITING).exists():
+        jobs.enqueue(PROMOTE, unique=True)
+
+
+# Whether a booking going from `previous` to `current`, both (table id,
+# start, guests), can make room for a waiting party: it left its slot, or
+# it has fewer guests
+def frees_room(previous, current):
+    return previous[:2] != current[:2] or current[2] < previous[2]
+
+
+# Book a table for every waiting party that fits now. Parties are taken from
+# a priority queue: earliest request first and, for requests made at the same
+# moment, the larger party first, since it is the harder one to seat.
+#
+# The worker runs in its own process, whose availability index only hears
+# about the bookings it makes itself, so it is rebuilt from the database
+# first. Tables taken after that are caught by reserve().
+@jobs.handler(PROMOTE)
+def promote():
+    availability.index.rebuild()
+    now = timezone.now()
+    WaitlistEntry.objects.filter(status=WaitlistEntry.WAITING, date_time__lte=now).update(
+        status=WaitlistEntry.EXPIRED,
+    )
+    queue = [
+        (requested_at, -guests, pk)
+        for pk, requested_at, guests in WaitlistEntry.objects
+        .filter(status=WaitlistEntry.WAITING)
+        .values_list('pk', 'requested_at', 'guests')
+    ]
+    heapq.heapify(queue)
+    promoted = 0
+    while queue:
+        _, _, pk = heapq.heappop(queue)
+        promoted += _promote(pk)
+    return promoted
+
+
+def _promote(pk):
+    with transaction.atomic():
+        entry = WaitlistEntry.objects.select_for_update().filter(pk=pk, status=WaitlistEntry.WAITING).first()
+        if entry is None:
+            return 0
+        # Smallest free table that seats the party
+        for table_id, _, _ in availability.free_tables(entry.guests, entry.date_time):
+            booking = Booking(
+                user_id=entry.user_id, table_id=table_id, date_time=entry.date_time, guests=entry.guests,
+            )
+            try:
+                reservations.reserve(booking)
+            except reservations.BookingConflict:
+                continue  # Taken since the index was rebuilt
+            entry.status = WaitlistEntry.PROMOTED
+            entry.booking = booking
+            entry.save(update_fields=['status', 'booking'])
+            return 1
+    return 0